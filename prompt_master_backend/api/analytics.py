@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Template, TemplateDailyUsage, CategoryDailyUsage, TagDailyUsage, TagUsageStats
+from .rollups import tag_stats_are_current
+from .serializers import TemplateListSerializer
+
+# 使用统计接口的各项查询，均读取日汇总表，查询代价与明细数据量无关。
+# 各查询相互独立，同步视图依次执行，异步视图并发执行。
+
+TIME_RANGES = ('week', 'month', 'quarter')
+
+
+def start_date_for(time_range):
+    return timezone.localdate() - timedelta(days=TagUsageStats.WINDOW_DAYS[time_range])
+
+
+def usage_trend(start_date):
+    return list(
+        CategoryDailyUsage.objects.filter(date__gte=start_date)
+        .values('date')
+        .annotate(count=Sum('count'))
+        .order_by('date')
+    )
+
+
+def category_totals(start_date):
+    # 日汇总只包含有使用记录的分类，补上使用次数为 0 的分类，与按模板分组统计时的输出一致
+    totals = dict.fromkeys((choice for choice, _ in Template.CATEGORY_CHOICES), 0)
+    totals.update(
+        CategoryDailyUsage.objects.filter(date__gte=start_date)
+        .values_list('category')
+        .annotate(count=Sum('count'))
+        .order_by()
+    )
+    return sorted(
+        ({'category': category, 'count': count} for category, count in totals.items()),
+        key=lambda item: -item['count']
+    )
+
+
+def popular_tags(time_range):
+    # 读取按窗口预先汇总的标签统计；当天尚未刷新时窗口起点已经移动，改为直接汇总标签日汇总表
+    if tag_stats_are_current():
+        return list(
+            TagUsageStats.objects.filter(window=time_range)
+            .values('tag', 'count')
+            .order_by('-count')[:20]
+        )
+    return list(
+        TagDailyUsage.objects.filter(date__gte=start_date_for(time_range))
+        .values('tag')
+        .annotate(count=Sum('count'))
+        .order_by('-count')[:20]
+    )
+
+
+def top_templates(start_date):
+    top_usage = list(
+        TemplateDailyUsage.objects.filter(date__gte=start_date)
+        .values('template_id')
+        .annotate(count=Sum('count'))
+        .order_by('-count')[:10]
+    )
+    templates = Template.objects.for_list().in_bulk([item['template_id'] for item in top_usage])
+    result = []
+    for item in top_usage:
+        template = templates.get(item['template_id'])
+        if template is not None:
+            template.recent_usage_count = item['count']
+            result.append(template)
+    return result
+
+
+def build_response(usage_data, category_data, tags, templates):
+    serialized_templates = TemplateListSerializer(templates, many=True).data
+    for template, serialized_template in zip(templates, serialized_templates):
+        serialized_template['recent_usage_count'] = template.recent_usage_count
+
+    return {
+        'usageData': {
+            'labels': [item['date'].strftime('%Y-%m-%d') for item in usage_data],
+            'values': [item['count'] for item in usage_data]
+        },
+        'categoryData': {
+            'labels': [item['category'] for item in category_data],
+            'values': [item['count'] for item in category_data]
+        },
+        'popularTags': [{'name': item['tag'], 'count': item['count']} for item in tags],
+        'topTemplates': serialized_templates
+    }
@@ -0,0 +1,202 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import analytics
+from .cache import CATALOG, response_cache_key
+from .db_router import served_by_replica
+from .fieldsets import sparse_queryset
+from .models import Template
+from .serializers import TemplateSerializer, TemplateListSerializer
+from .views import TemplateListView, TemplateDetailView, RecommendedTemplatesView
+
+# 只读接口的原生 async 版本，在 ASGI 下不为每个请求占用一个线程。
+# DRF 3.14 不支持 async 视图，这里复用 DRF 的认证类、过滤、序列化与 JSON 渲染，
+# 查询使用 Django 的 async ORM；相互独立的查询通过 run_parallel 并发执行。
+
+
+def run_parallel(func):
+    """把同步查询函数包装为可以并发 await 的协程函数。
+
+    async ORM 默认在同一个线程中依次执行查询，这里改为使用线程池中的独立线程与
+    独立数据库连接，执行完毕后按 CONN_MAX_AGE 关闭连接。
+    """
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+class AsyncAPIView(View):
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    renderer = JSONRenderer()
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.request = Request(
+            request, authenticators=[auth() for auth in self.authentication_classes]
+        )
+        try:
+            user = await sync_to_async(lambda: self.request.user)()
+            if not (user and user.is_authenticated):
+                raise exceptions.NotAuthenticated()
+            return await super().dispatch(self.request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    def handle_exception(self, exc):
+        if isinstance(exc.detail, (list, dict)):
+            data = exc.detail
+        else:
+            data = {'detail': exc.detail}
+        response = self.render(data, exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            # 与 APIView.get_authenticate_header 一致，使用第一个认证类的 WWW-Authenticate
+            header = None
+            if self.authentication_classes:
+                header = self.authentication_classes[0]().authenticate_header(self.request)
+            if header:
+                response['WWW-Authenticate'] = header
+            else:
+                response.status_code = status.HTTP_403_FORBIDDEN
+        return response
+
+    def render(self, data, status_code=status.HTTP_200_OK):
+        return HttpResponse(
+            self.renderer.render(data),
+            content_type=self.renderer.media_type,
+            status=status_code,
+        )
+
+    async def cached(self, namespaces, produce):
+        # 与同步视图的 cache_response 使用相同的代号机制，同样不缓存由副本提供的结果
+        key = await sync_to_async(response_cache_key)(self.request, [CATALOG, *namespaces])
+        data = await cache.aget(key)
+        if data is None:
+            data = await produce()
+            if not served_by_replica():
+                await cache.aset(key, data, settings.CATALOG_CACHE_TIMEOUT)
+        return data
+
+    def sync_view(self, view_class, **kwargs):
+        # 借用同步视图构造查询集（不执行查询），保证过滤与排序规则一致
+        return view_class(request=self.request, args=(), kwargs=kwargs, format_kwarg=None)
+
+
+class AsyncTemplateListView(AsyncAPIView):
+    read_from_replica = True
+
+    async def get(self, request):
+        return self.render(await self.cached(['templates'], self.get_page))
+
+    async def get_page(self):
+        view = self.sync_view(TemplateListView)
+        queryset = view.filter_queryset(view.get_queryset())
+        paginator = view.pagination_class()
+        page_size = paginator.get_page_size(self.request)
+        try:
+            page_number = int(self.request.query_params.get(paginator.page_query_param, 1))
+        except ValueError:
+            page_number = 0
+        if page_number < 1:
+            raise exceptions.NotFound('Invalid page.')
+
+        offset = (page_number - 1) * page_size
+        count, results = await asyncio.gather(
+            run_parallel(queryset.count)(),
+            run_parallel(lambda: list(queryset[offset:offset + page_size]))(),
+        )
+        if page_number > 1 and not results:
+            raise exceptions.NotFound('Invalid page.')
+
+        url = self.request.build_absolute_uri()
+        next_link = None
+        if offset + page_size < count:
+            next_link = replace_query_param(url, paginator.page_query_param, page_number + 1)
+        previous_link = None
+        if page_number == 2:
+            previous_link = remove_query_param(url, paginator.page_query_param)
+        elif page_number > 2:
+            previous_link = replace_query_param(url, paginator.page_query_param, page_number - 1)
+
+        return {
+            'count': count,
+            'next': next_link,
+            'previous': previous_link,
+            'results': TemplateListSerializer(
+                results, many=True, context={'request': self.request}
+            ).data,
+        }
+
+
+class AsyncTemplateDetailView(AsyncAPIView):
+    async def get(self, request, pk):
+        context = {'request': self.request}
+
+        async def produce():
+            queryset = sparse_queryset(TemplateSerializer, TemplateDetailView.queryset.all(), context)
+            try:
+                template = await queryset.aget(pk=pk)
+            except Template.DoesNotExist:
+                raise exceptions.NotFound()
+            return TemplateSerializer(template, context=context).data
+        return self.render(await self.cached([f'template:{pk}'], produce))
+
+
+class AsyncRecommendedTemplatesView(AsyncAPIView):
+    read_from_replica = True
+
+    async def get(self, request):
+        user = self.request.user
+        limit = RecommendedTemplatesView.limit
+        context = {'request': self.request}
+        recommended_templates = [
+            template async for template in sparse_queryset(
+                TemplateListSerializer,
+                Template.objects.recommended_for(user, RecommendedTemplatesView.recent_window),
+                context
+            )[:limit]
+        ]
+        if len(recommended_templates) < limit:
+            recommended_templates += [
+                template async for template in sparse_queryset(
+                    TemplateListSerializer,
+                    Template.objects.popular_for(
+                        user, exclude=[template.pk for template in recommended_templates]
+                    ),
+                    context
+                )[:limit - len(recommended_templates)]
+            ]
+        return self.render(
+            TemplateListSerializer(recommended_templates, many=True, context=context).data
+        )
+
+
+class AsyncTemplateAnalyticsView(AsyncAPIView):
+    read_from_replica = True
+
+    async def get(self, request):
+        time_range = self.request.query_params.get('time_range', 'week')
+        if time_range not in analytics.TIME_RANGES:
+            return self.render({'error': 'Invalid time range'}, status.HTTP_400_BAD_REQUEST)
+        start_date = analytics.start_date_for(time_range)
+
+        # 四项统计相互独立，各自在独立的连接上并发执行
+        usage_data, category_data, tags, templates = await asyncio.gather(
+            run_parallel(analytics.usage_trend)(start_date),
+            run_parallel(analytics.category_totals)(start_date),
+            run_parallel(analytics.popular_tags)(time_range),
+            run_parallel(analytics.top_templates)(start_date),
+        )
+        return self.render(analytics.build_response(usage_data, category_data, tags, templates))
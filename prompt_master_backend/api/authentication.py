@@ -0,0 +1,111 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .cache import bump, get_generations
+
+# JWT 认证的用户缓存：先查进程内缓存（TTL 很短，无法跨进程失效），再查共享缓存，
+# 都未命中时才查询数据库。共享缓存键包含用户 ID、令牌版本（ver 声明）与该用户的缓存代号，
+# 用户保存或删除时由 api.signals 调用 invalidate_user 递增代号。
+
+DEFAULTS = {
+    'LOCAL_TTL': 5,  # 进程内缓存的有效期（秒），也是其他进程中资料修改生效的最长延迟
+    'SHARED_TTL': 300,  # 共享缓存的有效期（秒）
+    'LOCAL_MAX_ENTRIES': 10000,
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'AUTH_USER_CACHE', {}))
+    return config
+
+
+def user_namespace(user_id):
+    return f'user:{user_id}'
+
+
+def user_cache_key(user_id, version, generation):
+    return f'auth:user:{user_id}:v{version}:g{generation}'
+
+
+class VersionedRefreshToken(RefreshToken):
+    """携带用户令牌版本的刷新令牌，由其生成的访问令牌会复制 ver 声明。"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['ver'] = user.token_version
+        return token
+
+
+class LocalUserCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get((user_id, version))
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, user, version, ttl, max_entries):
+        with self._lock:
+            if len(self._entries) >= max_entries:
+                self._entries.clear()
+            self._entries[(user.pk, version)] = (time.monotonic() + ttl, user)
+
+    def discard(self, user_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_users = LocalUserCache()
+
+
+def invalidate_user(user):
+    bump(user_namespace(user.pk))
+    local_users.discard(user.pk)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed(_('Token contained no recognizable user identification'))
+        version = validated_token.get('ver', 0)
+        config = get_config()
+
+        user = local_users.get(user_id, version)
+        if user is not None:
+            return user
+
+        # 先取代号再查询数据库：查询期间用户被修改或停用时，提交后递增的代号使这里写入的旧数据
+        # 不会再被读到，而不是在共享缓存中保留 SHARED_TTL
+        generation, = get_generations([user_namespace(user_id)])
+        key = user_cache_key(user_id, version, generation)
+        user = cache.get(key)
+        if user is None:
+            # 未命中时走父类逻辑：用户不存在或已停用时抛出 AuthenticationFailed
+            user = super().get_user(validated_token)
+            if user.token_version != version:
+                raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+            cache.set(key, user, config['SHARED_TTL'])
+
+        local_users.set(user, version, config['LOCAL_TTL'], config['LOCAL_MAX_ENTRIES'])
+        return user
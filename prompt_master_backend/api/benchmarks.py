@@ -0,0 +1,314 @@
+"""接口基准测试：生成指定规模的数据，用测试客户端逐个请求 api/urls.py 中的接口，
+记录耗时与 SQL 查询数，并与保存的基线比较。由 benchmark_api 命令调用。"""
+import json
+import random
+import statistics
+import time
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+from functools import partial
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from . import revisions
+from .authentication import VersionedRefreshToken
+from .cache import CATALOG, bump
+from .counters import usage_counter
+from .instrumentation import QueryCollector
+from .models import (
+    User, Scene, Template, TemplateComment, TemplateUsage, PromptTemplate, store_text_blobs
+)
+from .partitions import ensure_partitions
+from .recommendations import build_full
+from .rollups import refresh_tag_stats
+
+SCALES = {
+    '1k': {'users': 50, 'templates': 200, 'prompt_templates': 200, 'comments': 500, 'usages': 1000},
+    '100k': {'users': 2000, 'templates': 5000, 'prompt_templates': 5000, 'comments': 20000, 'usages': 100000},
+    '1m': {'users': 20000, 'templates': 20000, 'prompt_templates': 20000, 'comments': 100000, 'usages': 1000000},
+}
+
+USAGE_DAYS = 120
+BATCH_SIZE = 5000
+
+WORDS = [
+    '数据分析', '报告', '可视化', '营销', '文案', '代码', '审查', '翻译', '总结', '邮件',
+    '周报', '产品', '用户', '增长', '测试', '文档', '新闻', '策划', '品牌', '调研',
+]
+TAGS = [f'标签{i}' for i in range(50)]
+
+Case = namedtuple('Case', 'label name method kwargs query data')
+
+
+def default_baseline_path():
+    return Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+def text(rng, words):
+    return ''.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed(scale, random_seed=0):
+    """在当前数据库中生成一份 ``scale`` 规模的数据，返回基准用户。"""
+    sizes = SCALES[scale]
+    rng = random.Random(random_seed)
+    categories = [choice for choice, _ in Template.CATEGORY_CHOICES]
+
+    users = User.objects.bulk_create(
+        [User(username=f'bench{i}', password='') for i in range(sizes['users'])],
+        batch_size=BATCH_SIZE
+    )
+    templates = []
+    for i in range(sizes['templates']):
+        template = Template(
+            name=f'{text(rng, 2)}模板{i}', description=text(rng, 8), category=rng.choice(categories),
+            content=text(rng, 50), usage=text(rng, 10), example=text(rng, 10),
+            creator=rng.choice(users), tags=rng.sample(TAGS, 3),
+        )
+        template.update_search_vector()
+        templates.append(template)
+    with transaction.atomic():
+        store_text_blobs(templates)
+        Template.objects.bulk_create(templates, batch_size=BATCH_SIZE)
+
+    prompt_templates = []
+    for i in range(sizes['prompt_templates']):
+        prompt_template = PromptTemplate(
+            name=f'{text(rng, 2)}提示词{i}', description=text(rng, 8), content=text(rng, 50),
+            creator=rng.choice(users), is_public=rng.random() < 0.8, tags=rng.sample(TAGS, 3),
+        )
+        prompt_template.update_search_vector()
+        prompt_templates.append(prompt_template)
+    with transaction.atomic():
+        store_text_blobs(prompt_templates)
+        PromptTemplate.objects.bulk_create(prompt_templates, batch_size=BATCH_SIZE)
+    revisions.record_many(prompt_templates, created=True)
+
+    TemplateComment.objects.bulk_create([
+        TemplateComment(
+            template=rng.choice(templates), user=rng.choice(users),
+            content=text(rng, 6), rating=rng.randint(1, 5),
+        )
+        for _ in range(sizes['comments'])
+    ], batch_size=BATCH_SIZE)
+    Scene.objects.bulk_create([
+        Scene(name=text(rng, 2), description=text(rng, 6), creator=rng.choice(users), tags=rng.sample(TAGS, 2))
+        for _ in range(20)
+    ])
+
+    seed_usages(sizes['usages'], random_seed)
+    Template.objects.all().recompute_ratings()
+    refresh_tag_stats()
+    build_full()
+    return users[0]
+
+
+def seed_usages(count, random_seed):
+    """用一条 INSERT ... SELECT 生成使用记录，模板热度按幂律倾斜，并同步日汇总与使用次数。"""
+    today = timezone.localdate()
+    ensure_partitions(start=timezone.now() - timedelta(days=USAGE_DAYS))
+    usage_table = TemplateUsage._meta.db_table
+    template_table = Template._meta.db_table
+    user_table = User._meta.db_table
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT setseed(%s)', [(random_seed % 1000) / 1000])
+        cursor.execute(
+            f'WITH t AS (SELECT array_agg(id ORDER BY id) AS ids FROM {template_table}), '
+            f'u AS (SELECT array_agg(id ORDER BY id) AS ids FROM {user_table}) '
+            f'INSERT INTO {usage_table} (template_id, user_id, used_at, context) '
+            f'SELECT t.ids[1 + floor(power(random(), 3) * cardinality(t.ids))::int], '
+            f'u.ids[1 + floor(random() * cardinality(u.ids))::int], '
+            f'now() - random() * %s * interval \'1 day\', \'{{}}\'::jsonb '
+            f'FROM t, u, generate_series(1, %s)',
+            [USAGE_DAYS, count]
+        )
+        cursor.execute(
+            f'UPDATE {template_table} SET usage_count = counts.count '
+            f'FROM (SELECT template_id, COUNT(*) AS count FROM {usage_table} GROUP BY template_id) counts '
+            f'WHERE {template_table}.id = counts.template_id'
+        )
+    usage_counter.rebuild_rollups(today - timedelta(days=USAGE_DAYS + 1), today)
+
+
+def url_names(resolver=None, namespace=''):
+    names = set()
+    for pattern in (resolver or get_resolver('api.urls')).url_patterns:
+        if isinstance(pattern, URLResolver):
+            names |= url_names(pattern)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def build_cases(user):
+    template = Template.objects.order_by('-usage_count').first()
+    prompt_template = PromptTemplate.objects.filter(creator=user).first() \
+        or PromptTemplate.objects.first()
+    next_page = Client(HTTP_AUTHORIZATION=auth_header(user)) \
+        .get(reverse('prompttemplate-list'), {'page_size': 20}) \
+        .json() \
+        .get('next')
+    cursor = parse_qs(urlparse(next_page).query)['cursor'][0] if next_page else ''
+    now = timezone.now()
+
+    return [
+        Case('api root', 'api-root', 'get', {}, {}, None),
+        Case('register', 'register', 'post', {}, {}, lambda: {
+            'username': f'bench-{uuid.uuid4().hex[:12]}', 'password': 'bench-pass-123'
+        }),
+        Case('login', 'login', 'post', {}, {}, lambda: {'username': user.username, 'password': 'bench-pass-123'}),
+        Case('profile', 'user-profile', 'get', {}, {}, None),
+        Case('recommended scenes', 'recommended-scenes', 'get', {}, {}, None),
+        Case('template list', 'template-list', 'get', {}, {}, None),
+        Case('template list page 5', 'template-list', 'get', {}, {'page': 5}, None),
+        Case('template list by usage', 'template-list', 'get', {}, {'sort_by': 'usage_count', 'rating': 3}, None),
+        Case('template search', 'template-list', 'get', {}, {'search': '数据分析报告'}, None),
+        Case('template tags', 'template-list', 'get', {}, {'tags': f'{TAGS[0]},{TAGS[1]}'}, None),
+        Case('template list sparse', 'template-list', 'get', {}, {
+            'fields': 'id,name,category,rating,usage_count'
+        }, None),
+        Case('template detail', 'template-detail', 'get', {'pk': template.pk}, {}, None),
+        Case('template detail sparse', 'template-detail', 'get', {'pk': template.pk}, {
+            'fields': 'id,name,content,creator', 'expand': 'creator'
+        }, None),
+        Case('template use', 'template-use', 'post', {'pk': template.pk}, {}, lambda: {'context': {}}),
+        Case('usage batch 100', 'template-usage-batch', 'post', {}, {}, lambda: [
+            {'event_id': uuid.uuid4().hex, 'template_id': template.pk, 'used_at': now.isoformat()}
+            for _ in range(100)
+        ]),
+        Case('template comment', 'template-comment', 'post', {'pk': template.pk}, {}, lambda: {
+            'content': 'benchmark', 'rating': 4
+        }),
+        Case('recommended templates', 'recommended-templates', 'get', {}, {}, None),
+        Case('analytics quarter', 'template-analytics', 'get', {}, {'time_range': 'quarter'}, None),
+        Case('prompt template list', 'prompttemplate-list', 'get', {}, {}, None),
+        Case('prompt template page 2', 'prompttemplate-list', 'get', {}, {'page_size': 20, 'cursor': cursor}, None),
+        Case('prompt template search', 'prompttemplate-list', 'get', {}, {'search': '文案'}, None),
+        Case('prompt template list sparse', 'prompttemplate-list', 'get', {}, {'fields': 'id,name,tags'}, None),
+        Case('prompt template detail', 'prompttemplate-detail', 'get', {'pk': prompt_template.pk}, {}, None),
+        Case('prompt template update', 'prompttemplate-detail', 'patch', {'pk': prompt_template.pk}, {}, lambda: {
+            'description': uuid.uuid4().hex
+        }),
+        Case('prompt template versions', 'prompttemplate-versions', 'get', {'pk': prompt_template.pk}, {}, None),
+        Case('prompt template version 1', 'prompttemplate-version', 'get', {'pk': prompt_template.pk, 'version': 1}, {}, None),
+        Case('prompt template diff', 'prompttemplate-diff', 'get', {'pk': prompt_template.pk}, {'from': 1}, None),
+        Case('prompt template bulk create 100', 'prompttemplate-bulk', 'post', {}, {}, lambda: [
+            {'name': f'批量{i}', 'description': '基准', 'content': '内容', 'tags': [TAGS[i % 50]]}
+            for i in range(100)
+        ]),
+        Case('prompt template bulk delete', 'prompttemplate-bulk-delete', 'post', {}, {}, lambda: {
+            'ids': list(PromptTemplate.objects.filter(creator=user, name__startswith='批量')
+                        .values_list('pk', flat=True)[:100]) or [0]
+        }),
+        Case('async template list', 'async-template-list', 'get', {}, {}, None),
+        Case('async template detail', 'async-template-detail', 'get', {'pk': template.pk}, {}, None),
+        Case('async recommended templates', 'async-recommended-templates', 'get', {}, {}, None),
+        Case('async analytics quarter', 'async-template-analytics', 'get', {}, {'time_range': 'quarter'}, None),
+    ]
+
+
+def auth_header(user):
+    return f'Bearer {VersionedRefreshToken.for_user(user).access_token}'
+
+
+def run_case(client, case, repeat, warm_cache):
+    url = reverse(case.name, kwargs=case.kwargs)
+    durations = []
+    queries = []
+    query_durations = []
+    status_codes = set()
+    for iteration in range(repeat + 1):
+        if not warm_cache:
+            # 只使响应缓存失效，认证用户缓存保持稳定状态
+            bump(CATALOG)
+        url_with_query = f'{url}?{urlencode(case.query)}' if case.query else url
+        if case.data is None:
+            request = partial(getattr(client, case.method), url_with_query)
+        else:
+            request = partial(
+                getattr(client, case.method), url_with_query,
+                data=case.data(), content_type='application/json'
+            )
+        with QueryCollector() as collected:
+            started = time.perf_counter()
+            response = request()
+            elapsed = time.perf_counter() - started
+        status_codes.add(response.status_code)
+        if iteration == 0:
+            continue  # 第一次请求用于预热
+        durations.append(elapsed * 1000)
+        queries.append(collected.count)
+        query_durations.append(collected.duration * 1000)
+
+    durations.sort()
+    return {
+        'name': case.name,
+        'method': case.method.upper(),
+        'status': sorted(status_codes),
+        'queries': max(queries),
+        'median_ms': round(statistics.median(durations), 2),
+        'p95_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 2),
+        'sql_ms': round(statistics.median(query_durations), 2),
+    }
+
+
+def run(user, repeat=10, warm_cache=False, only=None):
+    user.set_password('bench-pass-123')
+    user.save(update_fields=['password'])
+    client = Client(HTTP_AUTHORIZATION=auth_header(user))
+    cases = build_cases(user)
+
+    missing = url_names() - {case.name for case in cases}
+    if missing:
+        raise ValueError(f'No benchmark case for URL names: {", ".join(sorted(missing))}')
+
+    results = {}
+    for case in cases:
+        if only and case.label not in only and case.name not in only:
+            continue
+        results[case.label] = run_case(client, case, repeat, warm_cache)
+    usage_counter.flush()
+    return results
+
+
+def load_baseline(path):
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_baseline(path, scale, results):
+    baseline = load_baseline(path)
+    baseline[scale] = {
+        label: {key: result[key] for key in ('queries', 'median_ms', 'p95_ms')}
+        for label, result in results.items()
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(baseline, ensure_ascii=False, indent=2, sort_keys=True) + '\n')
+
+
+def compare(results, baseline, time_tolerance, min_delta_ms, check_time=True):
+    """返回回归列表：查询数增加，或中位耗时同时超过相对与绝对阈值。"""
+    regressions = []
+    for label, result in results.items():
+        if any(status >= 400 for status in result['status']):
+            regressions.append(f'{label}: HTTP {result["status"]}')
+        expected = baseline.get(label)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries']:
+            regressions.append(f'{label}: {result["queries"]} queries (baseline {expected["queries"]})')
+        limit = max(expected['median_ms'] * (1 + time_tolerance), expected['median_ms'] + min_delta_ms)
+        if check_time and result['median_ms'] > limit:
+            regressions.append(
+                f'{label}: median {result["median_ms"]}ms (baseline {expected["median_ms"]}ms)'
+            )
+    return regressions
@@ -0,0 +1,195 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import revisions
+from .cache import CATALOG, bump
+from .counters import usage_counter
+from .models import PromptTemplate, Template, TemplateUsage, store_text_blobs
+from .serializers import PromptTemplateSerializer, UsageEventSerializer
+
+# 提示词模板的批量创建 / 更新 / 删除与模板使用事件的批量上报。
+# 每个请求在一个事务内完成，任一条目校验失败时整批不写入，
+# 错误以 {"errors": [{"index": i, "errors": {...}}]} 的形式按条目返回。
+# bulk_create / bulk_update 不触发 post_save 信号，也不调用 save()，
+# 因此这里手动维护 search_vector、updated_at、版本历史，并递增全局缓存代号；
+# 批量删除仍使用 QuerySet.delete()，级联与缓存失效由 Collector 和信号处理。
+
+BATCH_SIZE = 1000
+
+
+class BulkError(Exception):
+    # 与 rest_framework 的 ValidationError 不同，条目序号保持为整数
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def get_limit():
+    return getattr(settings, 'PROMPT_TEMPLATE_BULK_LIMIT', 5000)
+
+
+def check_items(items, limit=None):
+    if not isinstance(items, list):
+        raise BulkError([{'index': None, 'errors': 'Expected a list of items.'}])
+    if not items:
+        raise BulkError([{'index': None, 'errors': 'Expected at least one item.'}])
+    limit = limit or get_limit()
+    if len(items) > limit:
+        raise BulkError([{'index': None, 'errors': f'At most {limit} items per request.'}])
+
+
+def raise_item_errors(errors):
+    errors = [{'index': index, 'errors': error} for index, error in errors if error]
+    if errors:
+        raise BulkError(errors)
+
+
+def validate_items(items, context, partial=False, serializer_class=PromptTemplateSerializer):
+    serializer = serializer_class(data=items, many=True, partial=partial, context=context)
+    if not serializer.is_valid():
+        raise_item_errors(enumerate(serializer.errors))
+    return serializer.validated_data
+
+
+def bulk_create(user, items, context):
+    check_items(items)
+    validated = validate_items(items, context)
+
+    objs = []
+    for data in validated:
+        obj = PromptTemplate(creator=user, **data)
+        obj.update_search_vector()
+        objs.append(obj)
+
+    with transaction.atomic():
+        store_text_blobs(objs)
+        PromptTemplate.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+        revisions.record_many(objs, author=user, created=True)
+    bump(CATALOG)
+    return objs
+
+
+def bulk_update(user, items, context):
+    check_items(items)
+    errors = []
+    ids = []
+    seen = set()
+    for index, item in enumerate(items):
+        pk = item.get('id') if isinstance(item, dict) else None
+        if not isinstance(pk, int) or isinstance(pk, bool):
+            errors.append((index, {'id': ['This field is required.']}))
+        elif pk in seen:
+            errors.append((index, {'id': ['Duplicate id.']}))
+        ids.append(pk)
+        seen.add(pk)
+    raise_item_errors(errors)
+    validated = validate_items(items, context, partial=True)
+
+    with transaction.atomic():
+        # 只允许修改自己创建的模板；只锁定模板行，不锁定关联的用户与共享的 TextBlob
+        existing = PromptTemplate.objects.select_for_update(of=('self',)) \
+            .select_related('creator', 'content_blob') \
+            .filter(creator=user, pk__in=ids) \
+            .in_bulk()
+        raise_item_errors(
+            (index, {'id': ['Not found.']})
+            for index, pk in enumerate(ids) if pk not in existing
+        )
+
+        now = timezone.now()
+        fields = {'updated_at', 'search_vector', 'version'}
+        objs = []
+        changed = []
+        for pk, data in zip(ids, validated):
+            obj = existing[pk]
+            if revisions.has_changes(obj, data):
+                obj.version += 1
+                changed.append(obj)
+            for field, value in data.items():
+                setattr(obj, field, value)
+            fields.update(f'{field}_blob' if field in PromptTemplate.BLOB_FIELDS else field for field in data)
+            obj.updated_at = now
+            obj.update_search_vector()
+            objs.append(obj)
+        store_text_blobs(objs)
+        PromptTemplate.objects.bulk_update(objs, sorted(fields), batch_size=BATCH_SIZE)
+        if changed:
+            revisions.record_many(changed, author=user)
+    bump(CATALOG)
+    return objs
+
+
+def bulk_delete(user, ids):
+    check_items(ids)
+    raise_item_errors(
+        (index, {'id': ['Expected an integer id.']})
+        for index, pk in enumerate(ids)
+        if not isinstance(pk, int) or isinstance(pk, bool)
+    )
+
+    with transaction.atomic():
+        queryset = PromptTemplate.objects.filter(creator=user, pk__in=ids)
+        existing = set(queryset.select_for_update().values_list('pk', flat=True))
+        raise_item_errors(
+            (index, {'id': ['Not found.']})
+            for index, pk in enumerate(ids) if pk not in existing
+        )
+        # 通过 Collector 删除：级联删除版本历史，并逐条发送 post_delete 信号，
+        # 由 api.signals 在提交后使列表与各条详情的缓存失效
+        queryset.delete()
+    return len(existing)
+
+
+def ingest_usage_events(user, items, context):
+    """批量写入使用事件，返回 (写入数, 因 event_id 重复而跳过的数量)。
+
+    带 event_id 的事件按 (用户, event_id) 去重，重复上报同一批事件不会重复计数。
+    """
+    check_items(items, getattr(settings, 'USAGE_EVENT_BATCH_LIMIT', 10000))
+    events = validate_items(items, context, serializer_class=UsageEventSerializer)
+
+    template_ids = {event['template_id'] for event in events}
+    existing = set(Template.objects.filter(pk__in=template_ids).values_list('pk', flat=True))
+    raise_item_errors(
+        (index, {'template_id': ['Template not found.']})
+        for index, event in enumerate(events) if event['template_id'] not in existing
+    )
+
+    now = timezone.now()
+    with transaction.atomic():
+        # 同一用户的批量上报串行执行，保证查重与写入之间不会插入相同的 event_id
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))',
+                [f'usage-events:{user.pk}']
+            )
+        event_ids = {event['event_id'] for event in events if event.get('event_id')}
+        seen = set(
+            TemplateUsage.objects.filter(user=user, event_id__in=event_ids)
+            .values_list('event_id', flat=True)
+        )
+
+        objs = []
+        for event in events:
+            event_id = event.get('event_id')
+            if event_id:
+                if event_id in seen:
+                    continue
+                seen.add(event_id)
+            objs.append(TemplateUsage(
+                template_id=event['template_id'],
+                user=user,
+                used_at=event.get('used_at') or now,
+                context=event.get('context', {}),
+                event_id=event_id,
+            ))
+        TemplateUsage.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+
+        deltas = Counter((obj.template_id, timezone.localdate(obj.used_at)) for obj in objs)
+        # 详情缓存在计数写回数据库时由 usage_counter.flush() 失效
+        transaction.on_commit(lambda: usage_counter.increment_many(deltas))
+    return len(objs), len(events) - len(objs)
+
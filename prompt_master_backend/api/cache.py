@@ -0,0 +1,103 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.response import Response
+
+from .db_router import served_by_replica
+
+# 响应缓存键中包含各命名空间的代号（generation），数据变更时递增代号即可使旧缓存全部失效，
+# 无需逐个删除缓存键。命名空间约定：
+#   catalog                   所有目录接口，批量修改数据（管理命令等）后递增
+#   templates                 模板列表
+#   template:<pk>             模板详情
+#   scenes                    场景推荐
+#   prompt-templates          提示词模板列表
+#   prompt-template:<pk>      提示词模板详情
+#   user:<pk>                 JWT 认证缓存的用户（api.authentication）
+
+CATALOG = 'catalog'
+
+
+def generation_key(namespace):
+    return f'catalog:generation:{namespace}'
+
+
+def initial_generation():
+    # 代号被淘汰后以当前时间重新初始化，保证不会与淘汰前的代号重复
+    return int(time.time() * 1000)
+
+
+def get_generations(namespaces):
+    keys = [generation_key(namespace) for namespace in namespaces]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, initial_generation(), timeout=None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump(*namespaces):
+    for namespace in namespaces:
+        key = generation_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, initial_generation(), timeout=None)
+
+
+def response_cache_key(request, namespaces):
+    # 同一 URL 的不同表示（JSON / 可浏览 API）分别缓存，保存的 ETag 也随之区分
+    renderer = getattr(request, 'accepted_renderer', None)
+    media_type = renderer.media_type if renderer else ''
+    params = sorted(request.query_params.lists())
+    generations = get_generations(namespaces)
+    raw = repr((request.path, media_type, params, list(zip(namespaces, generations))))
+    return 'catalog:response:' + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def set_validators(response, etag, last_modified):
+    if etag:
+        response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def cache_response(*namespaces, timeout=None):
+    """缓存视图方法返回的 ``Response.data`` 及其 ETag / Last-Modified。
+
+    ``namespaces`` 中可以使用 URL 参数占位符，例如 ``'template:{pk}'``。只缓存 200 响应；
+    由只读副本提供的响应可能早于当前代号对应的写入，同样不缓存。
+    应放在 ``@conditional`` 外层：命中缓存时直接用保存的校验器回答条件请求，
+    不执行视图，也不执行校验器的查询。
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            names = [CATALOG, *(namespace.format(**kwargs) for namespace in namespaces)]
+            key = response_cache_key(request, names)
+            entry = cache.get(key)
+            if entry is not None:
+                data, etag, last_modified = entry
+                response = get_conditional_response(
+                    request, etag=etag, last_modified=last_modified
+                ) or Response(data)
+                return set_validators(response, etag, last_modified)
+
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200 and not served_by_replica():
+                entry = (
+                    response.data,
+                    response.headers.get('ETag'),
+                    parse_http_date_safe(response.headers.get('Last-Modified')),
+                )
+                cache.set(key, entry, timeout if timeout is not None else settings.CATALOG_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,86 @@
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from .cache import CATALOG, response_cache_key, set_validators
+from .db_router import may_read_from_replica
+from .fieldsets import requested_fields
+from .models import Template, PromptTemplate
+
+# 条件 GET：根据少量列或缓存代号计算校验器（ETag / Last-Modified），在序列化之前判断能否返回 304。
+# 校验器函数签名为 (view, request, **kwargs)，返回 (etag_parts, last_modified)；
+# 返回 None 表示对象不存在或无法给出校验器，交给视图本身处理（通常为 404，或不带校验器的 200）。
+# 与 @cache_response 同时使用时放在其内层，只在缓存未命中时执行，校验器随响应一起缓存。
+
+
+def make_etag(request, parts):
+    # 同一资源的不同表示（JSON / 可浏览 API、不同的 ?fields= / ?expand=）使用不同的 ETag
+    renderer = getattr(request, 'accepted_renderer', None)
+    media_type = renderer.media_type if renderer else ''
+    raw = repr((media_type, requested_fields(request), *parts))
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def conditional(validators):
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return method(self, request, *args, **kwargs)
+
+            result = validators(self, request, **kwargs)
+            if result is None:
+                return method(self, request, *args, **kwargs)
+
+            parts, last_modified = result
+            etag = make_etag(request, parts)
+            timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+
+            not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if not_modified is None:
+                response = method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            else:
+                response = not_modified
+            return set_validators(response, etag, timestamp)
+        return wrapper
+    return decorator
+
+
+def template_detail_validators(view, request, pk):
+    # 使用次数与评分通过 update() 维护，不一定修改 updated_at，因此不提供 Last-Modified
+    row = Template.objects.filter(pk=pk) \
+        .values_list('updated_at', 'usage_count', 'rating_count') \
+        .first()
+    if row is None:
+        return None
+    updated_at, usage_count, rating_count = row
+    return ('template', pk, updated_at.isoformat(), usage_count, rating_count), None
+
+
+def prompt_template_detail_validators(view, request, pk):
+    row = PromptTemplate.objects.filter(pk=pk) \
+        .values_list('updated_at', 'version') \
+        .first()
+    if row is None:
+        return None
+    updated_at, version = row
+    return ('prompt-template', pk, updated_at.isoformat(), version), updated_at
+
+
+def list_validators(namespace):
+    """列表的校验器：由路径、规范化后的查询参数与缓存代号得到，不查询数据库。
+
+    列表中任何记录的变更（含使用次数写回与评分）都会递增 ``namespace`` 或 catalog 的代号，
+    与响应缓存的失效规则一致。代号反映的是主库的状态，而副本可能落后于它，
+    因此请求可能由副本提供时不给出 ETag，避免把旧数据标记为最新版本并持续返回 304。
+    """
+    def validators(view, request):
+        if may_read_from_replica():
+            return None
+        return ('list', response_cache_key(request, [CATALOG, namespace])), None
+    return validators
@@ -0,0 +1,184 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import bump
+from .models import Template
+from .rollups import apply_usage_deltas, rebuild_rollups, refresh_tag_stats_if_stale
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'FLUSH_INTERVAL': 5,  # 后台线程的刷新周期（秒），0 表示每次累加后立即写库
+    'MAX_LAG': 30,  # 缓冲中最早一次累加允许等待的最长时间（秒）
+    'MAX_PENDING': 1000,  # 缓冲中允许积压的（模板, 日期）条目数上限
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'USAGE_COUNTER', {}))
+    return config
+
+
+class UsageCounterBuffer:
+    """模板使用次数的写回缓冲区。
+
+    请求线程只在内存中按（模板, 日期）累加，增量由后台线程按批写回数据库；每次写回对同一
+    增量值的模板使用一条 ``UPDATE ... SET usage_count = usage_count + n``，
+    因此不会丢失并发累加，也不会重写模板的其他列。同一事务内还会把增量累加到日汇总表。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._oldest = None
+        self._flusher = None
+
+    def increment(self, template_id, amount=1, used_at=None):
+        date = timezone.localdate(used_at) if used_at else timezone.localdate()
+        self.increment_many({(template_id, date): amount})
+
+    def increment_many(self, deltas):
+        """一次累加多条 {(template_id, date): 次数} 形式的增量，例如批量上报的使用事件。"""
+        if not deltas:
+            return
+        config = get_config()
+        with self._lock:
+            for key, amount in deltas.items():
+                self._pending[key] += amount
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = (
+                config['FLUSH_INTERVAL'] <= 0
+                or len(self._pending) >= config['MAX_PENDING']
+                or time.monotonic() - self._oldest >= config['MAX_LAG']
+            )
+
+        if due:
+            self.flush()
+        else:
+            self._ensure_flusher(config['FLUSH_INTERVAL'])
+
+    def flushed_count(self, template_id):
+        """写回本进程缓冲中的增量后，读取数据库中模板的使用次数。
+
+        其他进程（多个 worker 或多台主机）缓冲中的增量由各自的后台线程最多 MAX_LAG 秒后写回，
+        不包含在结果中，因此它不是精确计数，不应在承诺精确计数的地方使用。
+        """
+        self.flush()
+        return Template.objects.filter(pk=template_id) \
+            .values_list('usage_count', flat=True) \
+            .first()
+
+    def flush(self):
+        with self._flush_lock:
+            pending = self._write_pending()
+        return self._after_write(pending)
+
+    def rebuild_rollups(self, start_date, end_date):
+        """根据 TemplateUsage 明细重建日汇总（api.rollups.rebuild_rollups）。
+
+        明细提交后才会累加到缓冲区，缓冲中尚未写回的增量已经包含在明细里，重建后再写回会被
+        重复计入。因此先写回本进程的缓冲区，并在重建期间持有写回锁。其他进程缓冲中的增量
+        （最多 MAX_LAG 秒）无法在这里写回，应在停止写入或低峰期重建。
+        """
+        with self._flush_lock:
+            pending = self._write_pending()
+            rebuild_rollups(start_date, end_date)
+        self._after_write(pending)
+
+    def _write_pending(self):
+        # 调用方需持有 _flush_lock
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._oldest = None
+        if not pending:
+            return pending
+
+        try:
+            self._write(pending)
+        except Exception:
+            # 写库失败时把增量放回缓冲区，留待下次重试
+            self._restore(pending)
+            raise
+        return pending
+
+    def _after_write(self, pending):
+        if not pending:
+            return 0
+
+        # 使用次数会出现在列表与详情响应中，写回后使相关缓存失效
+        bump('templates', *{f'template:{template_id}' for template_id, _ in pending})
+
+        try:
+            refresh_tag_stats_if_stale()
+        except Exception:
+            logger.exception('Failed to refresh tag statistics')
+        return len(pending)
+
+    def _write(self, pending):
+        per_template = defaultdict(int)
+        for (template_id, _), amount in pending.items():
+            per_template[template_id] += amount
+
+        by_amount = defaultdict(list)
+        for template_id, amount in per_template.items():
+            by_amount[amount].append(template_id)
+
+        with transaction.atomic():
+            for amount, template_ids in by_amount.items():
+                Template.objects.filter(pk__in=sorted(template_ids)) \
+                    .update(usage_count=F('usage_count') + amount)
+            apply_usage_deltas(pending)
+
+    def _restore(self, pending):
+        with self._lock:
+            for key, amount in pending.items():
+                self._pending[key] += amount
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _ensure_flusher(self, interval):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(
+                target=self._run_flusher,
+                args=(interval,),
+                name='usage-counter-flusher',
+                daemon=True,
+            )
+            self._flusher.start()
+
+    def _run_flusher(self, interval):
+        while True:
+            time.sleep(interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush usage counters')
+            finally:
+                close_old_connections()
+
+
+usage_counter = UsageCounterBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        usage_counter.flush()
+    except Exception:
+        logger.exception('Failed to flush usage counters on exit')
@@ -0,0 +1,227 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.urls import Resolver404, resolve
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+logger = logging.getLogger(__name__)
+
+# 只读副本路由：视图类设置 read_from_replica = True 时，其 GET / HEAD 请求内的读查询发往副本，
+# 写操作始终使用主库。用户写入后的 STICKY_SECONDS 秒内，其请求全部使用主库以读到自己的写入；
+# 副本不可用或复制延迟超过 MAX_LAG 时回退到主库。
+
+DEFAULTS = {
+    'MAX_LAG': 5,  # 允许的最大复制延迟（秒）
+    'CHECK_INTERVAL': 5,  # 副本健康检查结果的缓存时间（秒）
+    'STICKY_SECONDS': 10,  # 写入后固定使用主库的时长（秒）
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+LAG_SQL = (
+    'SELECT CASE '
+    'WHEN NOT pg_is_in_recovery() THEN 0 '
+    'WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) '
+    'END'
+)
+
+_read_from_replica = contextvars.ContextVar('read_from_replica', default=False)
+# 当前请求中实际发往副本的读查询所用的别名；保存可变集合，线程池中执行的查询同样能记录
+_replica_reads = contextvars.ContextVar('replica_reads', default=None)
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'DATABASE_REPLICA', {}))
+    return config
+
+
+def get_replicas():
+    return [alias for alias in getattr(settings, 'REPLICA_DATABASES', []) if alias in settings.DATABASES]
+
+
+class ReplicaHealth:
+    """按进程缓存各副本的可用性与复制延迟检查结果。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}
+
+    def is_healthy(self, alias):
+        config = get_config()
+        now = time.monotonic()
+        with self._lock:
+            checked = self._checked.get(alias)
+            if checked is not None and now - checked[0] < config['CHECK_INTERVAL']:
+                return checked[1]
+            # 检查期间其他线程沿用旧结果（首次检查前视为不可用）
+            self._checked[alias] = (now, checked[1] if checked else False)
+
+        healthy = self.check(alias, config['MAX_LAG'])
+        with self._lock:
+            self._checked[alias] = (time.monotonic(), healthy)
+        return healthy
+
+    def check(self, alias, max_lag):
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError:
+            logger.warning('Replica %s is unavailable, reading from primary', alias, exc_info=True)
+            connections[alias].close()
+            return False
+        if lag > max_lag:
+            logger.warning('Replica %s lags %.1fs behind primary, reading from primary', alias, lag)
+            return False
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._checked.clear()
+
+
+replica_health = ReplicaHealth()
+
+
+def choose_replica():
+    healthy = [alias for alias in get_replicas() if replica_health.is_healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _read_from_replica.get():
+            return DEFAULT_DB_ALIAS
+        alias = choose_replica()
+        if alias is None:
+            return DEFAULT_DB_ALIAS
+        reads = _replica_reads.get()
+        if reads is not None:
+            reads.add(alias)
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本与主库是同一份数据
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in get_replicas()
+
+
+class read_from_replica:
+    """在代码块内把读查询发往副本，例如离线统计任务：``with read_from_replica(): ...``。"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+
+    def __enter__(self):
+        self._token = _read_from_replica.set(self.enabled)
+        self._reads_token = _replica_reads.set(set())
+
+    def __exit__(self, *exc_info):
+        _replica_reads.reset(self._reads_token)
+        _read_from_replica.reset(self._token)
+
+
+def served_by_replica():
+    """当前请求（或 read_from_replica 代码块）中是否有读查询发往了副本。
+
+    副本上的数据可能落后于已经递增的缓存代号，据此读出的结果不应写入响应缓存。
+    """
+    return bool(_replica_reads.get())
+
+
+def may_read_from_replica():
+    """当前请求（或 read_from_replica 代码块）中的读查询是否可能发往副本。
+
+    与副本的健康状态无关：检查之后副本可能恢复可用，这里只根据路由开关判断。
+    """
+    return _read_from_replica.get() and bool(get_replicas())
+
+
+def sticky_key(request):
+    # JWT 认证在视图中进行；中间件阶段只校验令牌签名并读取其中的用户 ID，不查询数据库。
+    # 以用户而不是令牌区分，刷新令牌后或在其他设备上也能读到自己的写入
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    try:
+        raw_token = authentication.get_raw_token(header)
+        if raw_token is None:
+            return None
+        token = authentication.get_validated_token(raw_token)
+    except AuthenticationFailed:
+        return None
+    user_id = token.get(jwt_settings.USER_ID_CLAIM)
+    if user_id is None:
+        return None
+    return f'db:sticky:user:{user_id}'
+
+
+def wants_replica(request):
+    if request.method not in SAFE_METHODS or not get_replicas():
+        return False
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return False
+    view_class = getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None)
+    return getattr(view_class, 'read_from_replica', False)
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        key = sticky_key(request)
+        use_replica = wants_replica(request) and not (key and cache.get(key))
+        token = _read_from_replica.set(use_replica)
+        reads_token = _replica_reads.set(set())
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica_reads.reset(reads_token)
+            _read_from_replica.reset(token)
+
+        if key and request.method not in SAFE_METHODS and response.status_code < 400:
+            cache.set(key, True, get_config()['STICKY_SECONDS'])
+        return response
+
+    async def __acall__(self, request):
+        key = sticky_key(request)
+        use_replica = wants_replica(request) and not (key and await cache.aget(key))
+        token = _read_from_replica.set(use_replica)
+        reads_token = _replica_reads.set(set())
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replica_reads.reset(reads_token)
+            _read_from_replica.reset(token)
+
+        if key and request.method not in SAFE_METHODS and response.status_code < 400:
+            await cache.aset(key, True, get_config()['STICKY_SECONDS'])
+        return response
@@ -0,0 +1,220 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .counters import usage_counter
+from .metrics import USAGE_EVENT_BATCHES, USAGE_EVENT_FLUSH_DURATION, USAGE_EVENT_QUEUE_DEPTH, USAGE_EVENTS
+from .models import TemplateUsage
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,  # 关闭时在请求线程内同步写库
+    'QUEUE_SIZE': 10000,  # 队列容量（事件数）
+    'BATCH_SIZE': 500,  # 后台线程每次 bulk_create 的最大事件数
+    'FLUSH_INTERVAL': 1,  # 队列未攒满一批时，最多等待多久写一次（秒）
+    'BACKPRESSURE': 'block',  # 队列已满时的处理方式：block / drop / sync
+    'BLOCK_TIMEOUT': 0.5,  # block 模式下最长等待时间（秒），超时后改为同步写库
+    'SHUTDOWN_TIMEOUT': 10,  # 进程退出时等待后台线程排空队列的最长时间（秒）
+    'RETRIES': 3,  # 一批写入失败后的最大重试次数，用尽后丢弃该批并计入 failed
+    'RETRY_BACKOFF': 0.5,  # 首次重试前的等待时间（秒），之后每次加倍
+}
+
+BACKPRESSURE_POLICIES = ('block', 'drop', 'sync')
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'USAGE_EVENTS', {}))
+    if config['BACKPRESSURE'] not in BACKPRESSURE_POLICIES:
+        raise ValueError(f"USAGE_EVENTS['BACKPRESSURE'] must be one of {BACKPRESSURE_POLICIES}")
+    return config
+
+
+def write_usages(usages):
+    """写入一批 TemplateUsage，并把使用次数累加到写回缓冲区。"""
+    TemplateUsage.objects.bulk_create(usages)
+    deltas = Counter((usage.template_id, timezone.localdate(usage.used_at)) for usage in usages)
+    usage_counter.increment_many(deltas)
+
+
+class UsageEventPipeline:
+    """模板使用事件的进程内异步写入管道。
+
+    请求线程只把未保存的 TemplateUsage 放入有界队列，由后台线程按批 ``bulk_create``。
+    队列已满时按 BACKPRESSURE 处理：block 等待片刻后同步写库，drop 丢弃并计数，
+    sync 直接同步写库。写入失败的批次按 RETRIES / RETRY_BACKOFF 退避重试，用尽后才丢弃。
+    进程退出时排空队列。
+    各项计数同时导出为 Prometheus 指标（api.metrics），``metrics()`` 返回当前进程的快照。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._writer = None
+        self._stopping = threading.Event()
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'sync_writes': 0,
+            'failed': 0,
+            'batches': 0,
+            'retries': 0,
+            'last_flush_seconds': 0.0,
+            'max_flush_seconds': 0.0,
+            'total_flush_seconds': 0.0,
+        }
+
+    def submit(self, usage):
+        """提交一条未保存的 TemplateUsage，返回 True 表示已入队或已写入，False 表示被丢弃。"""
+        config = get_config()
+        if not config['ENABLED'] or self._stopping.is_set():
+            self._write_sync([usage])
+            return True
+
+        events = self._ensure_writer(config)
+        try:
+            if config['BACKPRESSURE'] == 'block':
+                events.put(usage, timeout=config['BLOCK_TIMEOUT'])
+            else:
+                events.put_nowait(usage)
+        except queue.Full:
+            if config['BACKPRESSURE'] == 'drop':
+                self._record(dropped=1)
+                logger.warning('Usage event queue is full, dropping event')
+                return False
+            self._write_sync([usage])
+            return True
+
+        self._record(enqueued=1)
+        USAGE_EVENT_QUEUE_DEPTH.set(events.qsize())
+        return True
+
+    def metrics(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            events = self._queue
+        config = get_config()
+        snapshot['queue_depth'] = events.qsize() if events is not None else 0
+        snapshot['queue_capacity'] = config['QUEUE_SIZE']
+        snapshot['writer_alive'] = self._writer is not None and self._writer.is_alive()
+        return snapshot
+
+    def shutdown(self, timeout=None):
+        """停止接收新事件入队，等待后台线程排空队列；超时后在当前线程写入剩余事件。"""
+        self._stopping.set()
+        writer = self._writer
+        if writer is not None and writer.is_alive():
+            writer.join(timeout if timeout is not None else get_config()['SHUTDOWN_TIMEOUT'])
+        if self._queue is not None:
+            remaining = self._drain(self._queue.qsize())
+            if remaining:
+                self._write_sync(remaining)
+
+    def _ensure_writer(self, config):
+        with self._lock:
+            if self._queue is None:
+                self._queue = queue.Queue(maxsize=config['QUEUE_SIZE'])
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._run_writer,
+                    args=(config['BATCH_SIZE'], config['FLUSH_INTERVAL']),
+                    name='usage-event-writer',
+                    daemon=True,
+                )
+                self._writer.start()
+            return self._queue
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_writer(self, batch_size, interval):
+        try:
+            while True:
+                try:
+                    first = self._queue.get(timeout=interval)
+                except queue.Empty:
+                    if self._stopping.is_set():
+                        return
+                    continue
+                batch = [first] + self._drain(batch_size - 1)
+                USAGE_EVENT_QUEUE_DEPTH.set(self._queue.qsize())
+                close_old_connections()
+                try:
+                    self._write_batch(batch)
+                finally:
+                    close_old_connections()
+        finally:
+            connection.close()
+
+    def _write_batch(self, batch):
+        config = get_config()
+        for attempt in range(config['RETRIES'] + 1):
+            started = time.monotonic()
+            try:
+                # bulk_create 在一个事务内插入整批，失败时没有写入任何事件，可以原样重试
+                write_usages(batch)
+                break
+            except Exception:
+                if attempt == config['RETRIES']:
+                    logger.exception('Failed to write %d usage events, dropping them', len(batch))
+                    self._record(failed=len(batch))
+                    USAGE_EVENT_BATCHES.labels('failed').inc()
+                    return
+                delay = config['RETRY_BACKOFF'] * 2 ** attempt
+                logger.warning(
+                    'Failed to write %d usage events, retrying in %.1fs', len(batch), delay, exc_info=True
+                )
+                with self._lock:
+                    self._stats['retries'] += 1
+                USAGE_EVENT_BATCHES.labels('retried').inc()
+                # 出错的连接可能已不可用，关闭后下次写入时重新连接
+                close_old_connections()
+                time.sleep(delay)
+        elapsed = time.monotonic() - started
+        USAGE_EVENTS.labels('written').inc(len(batch))
+        USAGE_EVENT_BATCHES.labels('written').inc()
+        USAGE_EVENT_FLUSH_DURATION.observe(elapsed)
+        with self._lock:
+            self._stats['written'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['last_flush_seconds'] = elapsed
+            self._stats['max_flush_seconds'] = max(self._stats['max_flush_seconds'], elapsed)
+            self._stats['total_flush_seconds'] += elapsed
+
+    def _write_sync(self, usages):
+        write_usages(usages)
+        self._record(sync_writes=len(usages), written=len(usages))
+
+    def _record(self, **counts):
+        with self._lock:
+            for key, value in counts.items():
+                self._stats[key] += value
+        for key, value in counts.items():
+            USAGE_EVENTS.labels(key).inc(value)
+
+
+usage_events = UsageEventPipeline()
+
+
+@atexit.register
+def _drain_on_exit():
+    # 在 counters 的退出刷新之前执行（atexit 后注册先执行），排空的事件随后一并写回使用次数
+    try:
+        usage_events.shutdown()
+    except Exception:
+        logger.exception('Failed to drain usage events on exit')
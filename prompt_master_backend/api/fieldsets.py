@@ -0,0 +1,164 @@
+"""稀疏字段集：GET 请求中 ``?fields=id,name,rating`` 只输出列出的字段，``?expand=creator``
+把关联对象展开为嵌套表示。
+
+指定 fields 后，序列化器 Meta.expandable_fields 中的关联字段（创建者、评论等）默认只输出主键，
+列在 expand 中才输出嵌套对象；未指定 fields 时输出保持不变，expand 只用于展开默认不嵌套的关联。
+查询集按实际输出的字段重建 only() / select_related() / prefetch_related()，
+未输出的列、TextBlob 与关联表都不再读取。
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def parse_names(value):
+    names = []
+    for name in (value or '').split(','):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def requested_fields(request):
+    """返回 (fields, expand)，fields 为 None 表示输出全部字段；只对 GET / HEAD 生效。"""
+    query_params = getattr(request, 'query_params', None)
+    if query_params is None or request.method not in ('GET', 'HEAD'):
+        return None, []
+    fields = parse_names(query_params.get(FIELDS_PARAM))
+    return fields or None, parse_names(query_params.get(EXPAND_PARAM))
+
+
+class SparseFieldsMixin:
+    """为 ModelSerializer 增加 ``?fields=`` 与 ``?expand=``，需要在 context 中传入 request。
+
+    ``Meta.expandable_fields`` 为 {字段名: 嵌套序列化器类}。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sparse_fields, self.expand = requested_fields(self.context.get('request'))
+
+    @property
+    def is_sparse(self):
+        return self.sparse_fields is not None or bool(self.expand)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+
+        invalid = [name for name in self.expand if name not in expandable]
+        if invalid:
+            raise ValidationError({EXPAND_PARAM: f'Must be any of: {", ".join(expandable)}.'})
+
+        if self.sparse_fields is not None:
+            invalid = [name for name in self.sparse_fields if name not in fields]
+            if invalid:
+                raise ValidationError({FIELDS_PARAM: f'Unknown fields: {", ".join(invalid)}.'})
+            fields = {
+                name: field for name, field in fields.items()
+                if name in self.sparse_fields or name in self.expand
+            }
+
+        for name, serializer_class in expandable.items():
+            if name not in fields:
+                continue
+            field = fields[name]
+            many = isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField))
+            kwargs = {'source': field.source} if field.source else {}
+            if name in self.expand:
+                fields[name] = serializer_class(many=many, read_only=True, **kwargs)
+            elif self.sparse_fields is not None:
+                fields[name] = serializers.PrimaryKeyRelatedField(many=many, read_only=True, **kwargs)
+        return fields
+
+
+def query_plan(serializer, model, prefix=''):
+    """根据序列化器输出的字段计算 (only 路径, select_related 路径, Prefetch 列表)。"""
+    only = {prefix + model._meta.pk.name}
+    related = set()
+    prefetches = []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        name = field.source.split('.')[0]
+
+        # 保存在 TextBlob 中的文本，只读取压缩后的数据列
+        if name in getattr(model, 'BLOB_FIELDS', ()):
+            related.add(f'{prefix}{name}_blob')
+            only.update((f'{prefix}{name}_blob', f'{prefix}{name}_blob__data'))
+            continue
+
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue  # 注解或属性，不影响查询的列
+
+        if isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField)):
+            related_model = model_field.related_model
+            if isinstance(field, serializers.ListSerializer):
+                child_only, child_related, child_prefetches = query_plan(field.child, related_model)
+            else:
+                child_only, child_related, child_prefetches = {related_model._meta.pk.name}, set(), []
+            if model_field.one_to_many:
+                # 反向外键的预取需要加载指向当前模型的外键列
+                child_only.add(model_field.field.name)
+            queryset = related_model._default_manager.all()
+            if child_related:
+                queryset = queryset.select_related(*child_related)
+            queryset = queryset.prefetch_related(*child_prefetches).only(*child_only)
+            prefetches.append(Prefetch(prefix + name, queryset=queryset))
+        elif isinstance(field, serializers.BaseSerializer):
+            related.add(prefix + name)
+            only.add(prefix + name)
+            nested_only, nested_related, nested_prefetches = query_plan(
+                field, model_field.related_model, f'{prefix}{name}__'
+            )
+            only |= nested_only
+            related |= nested_related
+            prefetches += nested_prefetches
+        elif model_field.concrete:
+            only.add(prefix + name)
+    return only, related, prefetches
+
+
+def prune_queryset(serializer, queryset):
+    only, related, prefetches = query_plan(serializer, queryset.model)
+    # 排序用到的列（游标分页据此生成下一页游标）同样需要加载
+    for ordering in queryset.query.order_by:
+        if not isinstance(ordering, str):
+            continue
+        try:
+            model_field = queryset.model._meta.get_field(ordering.lstrip('-'))
+        except FieldDoesNotExist:
+            continue  # 按注解排序，例如全文检索的相关度
+        if model_field.concrete:
+            only.add(model_field.name)
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if related:
+        # 不带参数的 select_related() 会关联全部外键
+        queryset = queryset.select_related(*related)
+    return queryset.prefetch_related(*prefetches).only(*only)
+
+
+def sparse_queryset(serializer_class, queryset, context):
+    """请求中带有 fields / expand 时，按 ``serializer_class`` 实际输出的字段裁剪查询集。"""
+    serializer = serializer_class(context=context)
+    if not getattr(serializer, 'is_sparse', False):
+        return queryset
+    return prune_queryset(serializer, queryset)
+
+
+class SparseFieldsFilter(BaseFilterBackend):
+    """在视图的 filter_backends 中放在最后，使排序已经确定。"""
+
+    def filter_queryset(self, request, queryset, view):
+        # 版本、差异等自定义 action 也会调用 get_object，它们使用的字段与序列化器无关
+        if getattr(view, 'action', None) not in (None, 'list', 'retrieve'):
+            return queryset
+        return sparse_queryset(view.get_serializer_class(), queryset, view.get_serializer_context())
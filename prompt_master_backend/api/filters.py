@@ -0,0 +1,46 @@
+from django.contrib.postgres.search import SearchRank
+from django.db.models import F
+from rest_framework import filters
+from .search import build_search_query
+
+
+class FullTextSearchFilter(filters.BaseFilterBackend):
+    """基于 search_vector 的全文检索，结果按相关度排序，相关度相同时保留原有排序。
+
+    视图设置 ``search_rank_ordering = False`` 时只过滤、不改变排序（例如使用游标分页的视图）。
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = build_search_query(request.query_params.get(self.search_param, ''))
+        if query is None:
+            return queryset
+
+        queryset = queryset.filter(search_vector=query)
+        if not getattr(view, 'search_rank_ordering', True):
+            return queryset
+
+        ordering = queryset.query.order_by
+        return queryset \
+            .annotate(search_rank=SearchRank(F('search_vector'), query)) \
+            .order_by('-search_rank', *ordering)
+
+
+def parse_tags(value):
+    tags = []
+    for tag in (value or '').split(','):
+        tag = tag.strip()
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+class TagFilter(filters.BaseFilterBackend):
+    """``?tags=a,b`` 过滤同时包含所有给定标签的记录，使用单个 ``@>`` 查询以命中 tags 上的 GIN 索引。"""
+    tags_param = 'tags'
+
+    def filter_queryset(self, request, queryset, view):
+        tags = parse_tags(request.query_params.get(self.tags_param))
+        if not tags:
+            return queryset
+        return queryset.filter(tags__contains=tags)
@@ -0,0 +1,87 @@
+import contextvars
+import threading
+import time
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# 查询埋点：在每个数据库连接上安装同一个 execute_wrapper，把执行的 SQL 交给当前上下文中
+# 注册的收集器。收集器保存在 contextvar 中，sync_to_async 的工作线程会继承调用方的上下文，
+# 而后台线程（使用计数写回、事件写入）不会，因此只统计发起请求的代码产生的查询。
+
+_collectors = contextvars.ContextVar('query_collectors', default=())
+_install_lock = threading.Lock()
+_installed = False
+
+
+def query_wrapper(execute, sql, params, many, context):
+    collectors = _collectors.get()
+    if not collectors:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        alias = context['connection'].alias
+        for collector in collectors:
+            collector.record(sql, params, many, duration, alias)
+
+
+def _wrap_connection(connection, **kwargs):
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+def install():
+    """为之后创建的所有连接以及当前线程已有的连接安装埋点，可重复调用。"""
+    global _installed
+    with _install_lock:
+        if not _installed:
+            connection_created.connect(_wrap_connection, dispatch_uid='api.instrumentation')
+            _installed = True
+    for connection in connections.all(initialized_only=True):
+        _wrap_connection(connection)
+
+
+class QueryCollector:
+    """收集代码块内执行的查询：``with QueryCollector() as queries: ...``。
+
+    子类可以覆盖 ``record`` 做实时统计而不保存每条 SQL。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = []
+
+    def record(self, sql, params, many, duration, alias):
+        with self._lock:
+            self.queries.append({'sql': sql, 'params': params, 'many': many, 'duration': duration, 'alias': alias})
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(query['duration'] for query in self.queries)
+
+    def __enter__(self):
+        install()
+        self._token = _collectors.set((*_collectors.get(), self))
+        return self
+
+    def __exit__(self, *exc_info):
+        _collectors.reset(self._token)
+
+
+class unobserved:
+    """代码块内执行的查询不交给任何收集器，用于埋点自身产生的查询（例如慢查询的 EXPLAIN），
+    避免它们计入请求的查询数。"""
+
+    def __enter__(self):
+        self._token = _collectors.set(())
+
+    def __exit__(self, *exc_info):
+        _collectors.reset(self._token)
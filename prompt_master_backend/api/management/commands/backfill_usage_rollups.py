@@ -0,0 +1,48 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from api.models import TemplateUsage
+from api.counters import usage_counter
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily usage rollups (per template, category and tag) from TemplateUsage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last day to rebuild (YYYY-MM-DD)')
+        parser.add_argument(
+            '--days', type=int,
+            help='Rebuild only the last N days; ignored when --start is given'
+        )
+        parser.add_argument(
+            '--chunk-days', type=int, default=7,
+            help='Number of days rebuilt per transaction'
+        )
+
+    def handle(self, *args, **options):
+        end = options['end'] or timezone.localdate()
+        start = options['start']
+        if start is None and options['days']:
+            start = end - timedelta(days=options['days'] - 1)
+        if start is None:
+            first_used_at = TemplateUsage.objects.aggregate(first=Min('used_at'))['first']
+            if first_used_at is None:
+                self.stdout.write('No usage records to roll up')
+                return
+            start = timezone.localdate(first_used_at)
+        if start > end:
+            raise CommandError('--start must not be later than --end')
+
+        chunk = timedelta(days=options['chunk_days'])
+        current = start
+        while current <= end:
+            # 按天分段重建，缩短单个事务持有锁的时间
+            chunk_end = min(current + chunk - timedelta(days=1), end)
+            usage_counter.rebuild_rollups(current, chunk_end)
+            self.stdout.write(f'Rebuilt rollups for {current} .. {chunk_end}')
+            current = chunk_end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS('Successfully backfilled usage rollups'))
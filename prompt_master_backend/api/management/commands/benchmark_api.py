@@ -0,0 +1,106 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import get_runner
+from django.conf import settings
+from api import benchmarks
+from api.events import usage_events
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = 'Seeds a throwaway database and benchmarks every API endpoint against a stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', choices=sorted(benchmarks.SCALES), default='1k',
+            help='Dataset size, named after the number of usage records'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=10,
+            help='Measured requests per endpoint (after one warm-up request)'
+        )
+        parser.add_argument(
+            '--baseline', type=Path, default=benchmarks.default_baseline_path(),
+            help='Baseline JSON file, keyed by scale'
+        )
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Write the results as the new baseline instead of comparing'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help='Allowed relative increase of the median response time'
+        )
+        parser.add_argument(
+            '--min-delta', type=float, default=5,
+            help='Median increases below this many milliseconds are never reported'
+        )
+        parser.add_argument(
+            '--queries-only', action='store_true',
+            help='Only compare query counts, e.g. on noisy CI machines'
+        )
+        parser.add_argument(
+            '--warm-cache', action='store_true',
+            help='Keep the response cache between requests instead of invalidating it'
+        )
+        parser.add_argument(
+            '--only', nargs='*',
+            help='Benchmark only these case labels or URL names'
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Keep the benchmark database and reuse it if it is already seeded'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated data')
+
+    def handle(self, *args, **options):
+        runner = get_runner(settings)(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        # 与测试一样在独立的数据库中运行，并允许测试客户端使用的 testserver 主机名
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            user = User.objects.filter(username='bench0').first()
+            if user is None:
+                self.stdout.write(f'Seeding {options["scale"]} dataset...')
+                user = benchmarks.seed(options['scale'], options['seed'])
+            try:
+                results = benchmarks.run(
+                    user, repeat=options['repeat'], warm_cache=options['warm_cache'], only=options['only']
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+            finally:
+                usage_events.shutdown()
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+        self.write_table(results)
+        baseline_path = options['baseline']
+        if options['update_baseline']:
+            benchmarks.save_baseline(baseline_path, options['scale'], results)
+            self.stdout.write(self.style.SUCCESS(f'Updated baseline {baseline_path}'))
+            return
+
+        baseline = benchmarks.load_baseline(baseline_path).get(options['scale'], {})
+        if not baseline:
+            self.stdout.write(self.style.WARNING(
+                f'No {options["scale"]} baseline in {baseline_path}; run with --update-baseline'
+            ))
+        regressions = benchmarks.compare(
+            results, baseline, options['tolerance'], options['min_delta'],
+            check_time=not options['queries_only']
+        )
+        if regressions:
+            raise CommandError('Benchmark regressions:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions'))
+
+    def write_table(self, results):
+        self.stdout.write(f'{"case":<34}{"status":>10}{"queries":>9}{"median":>10}{"p95":>10}{"sql":>10}')
+        for label, result in results.items():
+            status = ','.join(str(code) for code in result['status'])
+            self.stdout.write(
+                f'{label:<34}{status:>10}{result["queries"]:>9}'
+                f'{result["median_ms"]:>9.1f}ms{result["p95_ms"]:>8.1f}ms{result["sql_ms"]:>8.1f}ms'
+            )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from api.recommendations import DEFAULT_TOP_K, build_full, build_incremental
+
+
+class Command(BaseCommand):
+    help = 'Builds template neighbours from co-usage; incremental unless --full is given'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Rebuild the co-usage matrix from all usage records'
+        )
+        parser.add_argument(
+            '--top-k', type=int, default=DEFAULT_TOP_K,
+            help='Number of neighbours kept per template'
+        )
+
+    def handle(self, *args, **options):
+        build = build_full if options['full'] else build_incremental
+        templates, neighbors = build(top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {neighbors} neighbours for {templates} templates'
+        ))
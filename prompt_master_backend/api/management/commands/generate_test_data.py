@@ -1,104 +1,204 @@
-from django.core.management.base import BaseCommand
-from django.contrib.auth import get_user_model
-from api.models import Template, TemplateComment, TemplateUsage
-from django.utils import timezone
+import csv
+import io
+import json
+import multiprocessing
 import random
 from datetime import timedelta
-from faker import Faker
-
-User = get_user_model()
-fake = Faker(['zh_CN'])  # 使用中文数据
-
-class Command(BaseCommand):
-    help = 'Generates test data for the PromptMaster application'
-
-    def handle(self, *args, **kwargs):
-        self.stdout.write('Generating test data...')
-
-        # Create test users
-        users = self.create_users()
-        self.stdout.write('Created users')
 
-        # Create test templates
-        templates = self.create_templates(users)
-        self.stdout.write('Created templates')
-
-        # Create template comments
-        self.create_template_comments(users, templates)
-        self.stdout.write('Created comments')
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from faker import Faker
 
-        # Create template usage data
-        self.create_template_usage(users, templates)
-        self.stdout.write('Created usage data')
+from api.cache import CATALOG, bump
+from api.counters import usage_counter
+from api.models import Template, TemplateComment, TemplateUsage, store_text_blobs
+from api.partitions import ensure_partitions
+from api.rollups import refresh_tag_stats
 
-        self.stdout.write(self.style.SUCCESS('Successfully generated test data'))
+User = get_user_model()
 
-    def create_users(self):
-        users = []
-        for i in range(20):
-            username = f"{fake.last_name()}{fake.first_name()}"
-            email = fake.email()
-            user, created = User.objects.get_or_create(username=username, email=email)
-            if created:
-                user.set_password('testpass123')
-                user.first_name = fake.first_name()
-                user.last_name = fake.last_name()
-                user.save()
-            users.append(user)
-        return users
-
-    def create_templates(self, users):
-        categories = {
-            'analysis': ['数据分析', '数据可视化', '数据清洗', '统计分析', '预测模型'],
-            'writing': ['文案创作', '内容编辑', '广告文案', '新闻写作', '技术文档'],
-            'coding': ['代码生成', 'API开发', '单元测试', '代码重构', '性能优化'],
-            'marketing': ['营销策划', '社媒运营', '品牌推广', '用户增长', '市场分析']
+CATEGORIES = {
+    'analysis': ['数据分析', '数据可视化', '数据清洗', '统计分析', '预测模型'],
+    'writing': ['文案创作', '内容编辑', '广告文案', '新闻写作', '技术文档'],
+    'coding': ['代码生成', 'API开发', '单元测试', '代码重构', '性能优化'],
+    'marketing': ['营销策划', '社媒运营', '品牌推广', '用户增长', '市场分析']
+}
+
+TEMPLATE_TYPES = {
+    'analysis': [
+        '数据分析报告模板', '数据可视化脚本', '数据清洗工具',
+        '统计分析模型', '预测分析模板', '数据挖掘流程'
+    ],
+    'writing': [
+        '产品描述模板', '新闻稿模板', '社媒文案模板',
+        '技术文档模板', '营销文案模板', '用户指南模板'
+    ],
+    'coding': [
+        'API文档生成', '代码注释模板', '单元测试模板',
+        '性能优化建议', '代码审查清单', '错误处理模板'
+    ],
+    'marketing': [
+        '营销活动策划', '用户画像分析', '竞品分析报告',
+        '市场调研模板', '品牌推广方案', '增长策略模板'
+    ]
+}
+
+COMMENT_TEMPLATES = [
+    "这个模板{verb}，{detail}",
+    "{verb}这个模板，{detail}",
+    "模板整体{verb}，{detail}",
+    "{verb}，{detail}，推荐使用。",
+    "使用效果{verb}，{detail}"
+]
+VERBS = ['非常实用', '很专业', '很全面', '很贴心', '设计合理', '效果显著']
+DETAILS = [
+    '对工作帮助很大',
+    '节省了很多时间',
+    '内容很专业',
+    '逻辑性强',
+    '可以直接使用',
+    '值得推荐',
+    '适合新手使用',
+    '专业度高',
+    '效果明显',
+    '使用体验好'
+]
+
+# 每种数据使用独立的随机流，分块的种子只取决于 (--seed, 数据种类, 块序号)，
+# 因此无论使用多少个进程，同样的参数都会生成完全相同的数据
+STREAMS = {'users': 1, 'templates': 2, 'comments': 3, 'usages': 4, 'popularity': 5}
+
+
+def chunk_seed(seed, stream, index):
+    return [seed, STREAMS[stream], index]
+
+
+def chunk_random(seed, stream, index):
+    return random.Random(f'{seed}-{stream}-{index}')
+
+
+def chunk_faker(seed, stream, index):
+    fake = Faker(['zh_CN'])  # 使用中文数据
+    fake.seed_instance(f'{seed}-{stream}-{index}')
+    return fake
+
+
+def chunks(total, size):
+    return [(index, start, min(size, total - start)) for index, start in enumerate(range(0, total, size))]
+
+
+def popularity_weights(count, skew, seed):
+    """按 Zipf 分布为模板分配热度：排名第 r 的模板权重正比于 1 / r^skew，排名顺序随机打乱。"""
+    weights = 1 / np.arange(1, count + 1, dtype=np.float64) ** skew
+    rng = np.random.default_rng(chunk_seed(seed, 'popularity', 0))
+    weights = weights[rng.permutation(count)]
+    return weights / weights.sum()
+
+
+def generate_users(args):
+    seed, index, start, count = args
+    fake = chunk_faker(seed, 'users', index)
+    return [
+        {
+            # 附加序号保证用户名唯一
+            'username': f"{fake.last_name()}{fake.first_name()}{start + offset}",
+            'email': fake.email(),
+            'first_name': fake.first_name(),
+            'last_name': fake.last_name(),
         }
-        
-        templates = []
-        template_types = {
-            'analysis': [
-                '数据分析报告模板', '数据可视化脚本', '数据清洗工具',
-                '统计分析模型', '预测分析模板', '数据挖掘流程'
-            ],
-            'writing': [
-                '产品描述模板', '新闻稿模板', '社媒文案模板',
-                '技术文档模板', '营销文案模板', '用户指南模板'
-            ],
-            'coding': [
-                'API文档生成', '代码注释模板', '单元测试模板',
-                '性能优化建议', '代码审查清单', '错误处理模板'
-            ],
-            'marketing': [
-                '营销活动策划', '用户画像分析', '竞品分析报告',
-                '市场调研模板', '品牌推广方案', '增长策略模板'
-            ]
-        }
-
-        for i in range(100):
-            category = random.choice(list(categories.keys()))
-            template_type = random.choice(template_types[category])
-            tags = random.sample(categories[category], random.randint(2, 4))
-            
-            template = Template.objects.create(
-                name=f"{template_type}-{fake.company_prefix()}版",
-                description=f"{fake.sentence()}这是一个{template_type}，{fake.sentence()}",
-                category=category,
-                content=self.generate_template_content(category),
-                usage=f"适用场景：{fake.paragraph()}\n使用步骤：\n1. {fake.sentence()}\n2. {fake.sentence()}\n3. {fake.sentence()}",
-                example=self.generate_example_content(category),
-                creator=random.choice(users),
-                tags=tags,
-                rating=round(random.uniform(3.5, 5), 1),  # 大多数模板评分在3.5-5之间
-                usage_count=random.randint(100, 10000)
-            )
-            templates.append(template)
-
-        return templates
-
-    def generate_template_content(self, category):
-        if category == 'analysis':
-            return f"""# {fake.company()}数据分析报告模板
+        for offset in range(count)
+    ]
+
+
+def generate_templates(args):
+    seed, index, start, count, user_count = args
+    fake = chunk_faker(seed, 'templates', index)
+    rng = chunk_random(seed, 'templates', index)
+    rows = []
+    for _ in range(count):
+        category = rng.choice(list(CATEGORIES.keys()))
+        template_type = rng.choice(TEMPLATE_TYPES[category])
+        rows.append({
+            'name': f"{template_type}-{fake.company_prefix()}版",
+            'description': f"{fake.sentence()}这是一个{template_type}，{fake.sentence()}",
+            'category': category,
+            'content': generate_template_content(fake, category),
+            'usage': f"适用场景：{fake.paragraph()}\n使用步骤：\n1. {fake.sentence()}\n2. {fake.sentence()}\n3. {fake.sentence()}",
+            'example': generate_example_content(fake, category),
+            'creator': rng.randrange(user_count),
+            'tags': rng.sample(CATEGORIES[category], rng.randint(2, 4)),
+        })
+    return rows
+
+
+# 评论与使用记录的生成进程共享的只读数据，由 set_shared 在进程启动时设置一次
+_shared = {}
+
+
+def set_shared(values):
+    _shared.update(values)
+
+
+def to_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def generate_comments(args):
+    seed, index, start, count = args
+    user_ids, template_ids, weights = _shared['user_ids'], _shared['template_ids'], _shared['weights']
+    start_date, days = _shared['start_date'], _shared['days']
+    rng = np.random.default_rng(chunk_seed(seed, 'comments', index))
+    templates = template_ids[rng.choice(len(template_ids), size=count, p=weights)]
+    users = user_ids[rng.integers(len(user_ids), size=count)]
+    # 大多数评分在4-5星
+    ratings = rng.choice([5, 4, 3, 2, 1], size=count, p=[0.5, 0.3, 0.15, 0.04, 0.01])
+    offsets = rng.random(count) * days * 86400
+    comment_templates = rng.integers(len(COMMENT_TEMPLATES), size=count)
+    verbs = rng.integers(len(VERBS), size=count)
+    details = rng.integers(len(DETAILS), size=count)
+    return to_csv(
+        (
+            templates[i], users[i],
+            COMMENT_TEMPLATES[comment_templates[i]].format(verb=VERBS[verbs[i]], detail=DETAILS[details[i]]),
+            ratings[i], (start_date + timedelta(seconds=float(offsets[i]))).isoformat(),
+        )
+        for i in range(count)
+    )
+
+
+def generate_usages(args):
+    seed, index, start, count = args
+    user_ids, template_ids, weights = _shared['user_ids'], _shared['template_ids'], _shared['weights']
+    start_date, days = _shared['start_date'], _shared['days']
+    rng = np.random.default_rng(chunk_seed(seed, 'usages', index))
+    templates = template_ids[rng.choice(len(template_ids), size=count, p=weights)]
+    users = user_ids[rng.integers(len(user_ids), size=count)]
+    offsets = rng.random(count) * days * 86400
+    durations = rng.integers(30, 301, size=count)  # 使用时长（秒）
+    successes = rng.random(count) > 0.1  # 90%的成功率
+    scenarios = rng.integers(len(VERBS), size=count)
+    return to_csv(
+        (
+            templates[i], users[i], (start_date + timedelta(seconds=float(offsets[i]))).isoformat(),
+            json.dumps({
+                'input_params': {'scenario': VERBS[scenarios[i]]},
+                'duration': int(durations[i]),
+                'success': bool(successes[i]),
+            }, ensure_ascii=False),
+        )
+        for i in range(count)
+    )
+
+
+def generate_template_content(fake, category):
+    if category == 'analysis':
+        return f"""# {fake.company()}数据分析报告模板
 
 ## 1. 数据概览
 {fake.paragraph()}
@@ -115,8 +215,8 @@ class Command(BaseCommand):
 
 ## 4. 建议
 {fake.paragraph()}"""
-        elif category == 'writing':
-            return f"""# {fake.company_prefix()}{fake.word()}产品文案
+    elif category == 'writing':
+        return f"""# {fake.company_prefix()}{fake.word()}产品文案
 
 ## 产品亮点
 1. {fake.sentence()}
@@ -132,8 +232,8 @@ class Command(BaseCommand):
 ## 号召性用语
 - {fake.sentence()}
 - {fake.sentence()}"""
-        elif category == 'coding':
-            return f"""/**
+    elif category == 'coding':
+        return f"""/**
  * {fake.sentence()}
  * 
  * @param {fake.word()} - {fake.sentence()}
@@ -148,8 +248,8 @@ function {fake.word()}({fake.word()}, {fake.word()}) {{
 // 使用示例
 {fake.sentence()}
 """
-        else:  # marketing
-            return f"""# {fake.company()}营销方案
+    else:  # marketing
+        return f"""# {fake.company()}营销方案
 
 ## 市场分析
 {fake.paragraph()}
@@ -165,9 +265,9 @@ function {fake.word()}({fake.word()}, {fake.word()}) {{
 ## 预期效果
 {fake.paragraph()}"""
 
-    def generate_example_content(self, category):
-        if category == 'analysis':
-            return f"""## 数据分析结果示例
+def generate_example_content(fake, category):
+    if category == 'analysis':
+        return f"""## 数据分析结果示例
 
 1. 数据趋势
 {fake.paragraph()}
@@ -178,8 +278,8 @@ function {fake.word()}({fake.word()}, {fake.word()}) {{
 
 3. 结论
 {fake.paragraph()}"""
-        elif category == 'writing':
-            return f"""## 文案示例
+    elif category == 'writing':
+        return f"""## 文案示例
 
 标题：{fake.sentence()}
 
@@ -187,8 +287,8 @@ function {fake.word()}({fake.word()}, {fake.word()}) {{
 {fake.paragraph()}
 
 关键词：{fake.word()}、{fake.word()}、{fake.word()}"""
-        elif category == 'coding':
-            return f"""// 代码示例
+    elif category == 'coding':
+        return f"""// 代码示例
 const {fake.word()} = {{
     name: '{fake.word()}',
     description: '{fake.sentence()}'
@@ -196,8 +296,8 @@ const {fake.word()} = {{
 
 // 输出结果
 {fake.sentence()}"""
-        else:  # marketing
-            return f"""## 营销方案示例
+    else:  # marketing
+        return f"""## 营销方案示例
 
 活动名称：{fake.sentence()}
 
@@ -208,78 +308,149 @@ const {fake.word()} = {{
 预期结果：
 {fake.paragraph()}"""
 
-    def create_template_comments(self, users, templates):
-        comment_templates = [
-            "这个模板{verb}，{detail}",
-            "{verb}这个模板，{detail}",
-            "模板整体{verb}，{detail}",
-            "{verb}，{detail}，推荐使用。",
-            "使用效果{verb}，{detail}"
-        ]
-        
-        verbs = ['非常实用', '很专业', '很全面', '很贴心', '设计合理', '效果显著']
-        details = [
-            '对工作帮助很大',
-            '节省了很多时间',
-            '内容很专业',
-            '逻辑性强',
-            '可以直接使用',
-            '值得推荐',
-            '适合新手使用',
-            '专业度高',
-            '效果明显',
-            '使用体验好'
-        ]
 
-        for template in templates:
-            # 根据模板的使用次数决定评论数量
-            comment_count = random.randint(5, 20)
-            for _ in range(comment_count):
-                comment_template = random.choice(comment_templates)
-                verb = random.choice(verbs)
-                detail = random.choice(details)
-                
-                rating = random.choices(
-                    [5, 4, 3, 2, 1],
-                    weights=[0.5, 0.3, 0.15, 0.04, 0.01]  # 大多数评分在4-5星
-                )[0]
-                
-                TemplateComment.objects.create(
-                    template=template,
-                    user=random.choice(users),
-                    content=comment_template.format(verb=verb, detail=detail),
-                    rating=rating
-                )
+class Command(BaseCommand):
+    help = 'Generates test data for the PromptMaster application'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Number of users')
+        parser.add_argument('--templates', type=int, default=100, help='Number of templates')
+        parser.add_argument('--comments', type=int, default=1250, help='Number of template comments')
+        parser.add_argument('--usages', type=int, default=50000, help='Number of template usage records')
+        parser.add_argument('--days', type=int, default=180, help='Spread comments and usages over this many days')
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Zipf exponent of template popularity; 0 spreads usage evenly'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; equal seeds give equal data')
+        parser.add_argument('--batch-size', type=int, default=100000, help='Rows generated and written per batch')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Processes used to generate rows; the output does not depend on this'
+        )
+        parser.add_argument(
+            '--password', default='testpass123',
+            help='Password of every generated user (hashed once)'
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['templates'] < 1:
+            raise CommandError('At least one user and one template are required')
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be positive')
+        self.options = options
+        self.stdout.write('Generating test data...')
+
+        # Create test users
+        user_ids = self.create_users()
+        self.stdout.write(f'Created {len(user_ids)} users')
+
+        # Create test templates
+        template_ids = self.create_templates(user_ids)
+        self.stdout.write(f'Created {len(template_ids)} templates')
 
-    def create_template_usage(self, users, templates):
         end_date = timezone.now()
-        start_date = end_date - timedelta(days=180)
-
-        # 为每个模板创建使用记录
-        for template in templates:
-            # 根据模板的总使用次数创建详细记录
-            usage_count = template.usage_count
-            for _ in range(usage_count):
-                user = random.choice(users)
-                used_at = fake.date_time_between(
-                    start_date=start_date,
-                    end_date=end_date,
-                    tzinfo=timezone.get_current_timezone()
+        start_date = end_date - timedelta(days=options['days'])
+        shared = {
+            'user_ids': user_ids,
+            'template_ids': template_ids,
+            'weights': popularity_weights(len(template_ids), options['skew'], options['seed']),
+            'start_date': start_date,
+            'days': options['days'],
+        }
+
+        # Create template comments
+        self.copy(
+            TemplateComment, ['template_id', 'user_id', 'content', 'rating', 'created_at'],
+            generate_comments, options['comments'], shared
+        )
+        self.stdout.write(f'Created {options["comments"]} comments')
+
+        # Create template usage data
+        ensure_partitions(start=start_date)
+        self.copy(
+            TemplateUsage, ['template_id', 'user_id', 'used_at', 'context'],
+            generate_usages, options['usages'], shared
+        )
+        self.stdout.write(f'Created {options["usages"]} usage records')
+
+        self.refresh_aggregates(start_date)
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully generated test data; run build_template_recommendations --full to rebuild recommendations'
+        ))
+
+    def map(self, func, tasks, shared=None):
+        # 按块的顺序返回结果；单进程时直接在当前进程生成，便于调试
+        shared = shared or {}
+        if self.options['workers'] == 1 or len(tasks) == 1:
+            set_shared(shared)
+            yield from map(func, tasks)
+            return
+        context = multiprocessing.get_context('fork')
+        with context.Pool(self.options['workers'], initializer=set_shared, initargs=(shared,)) as pool:
+            yield from pool.imap(func, tasks)
+
+    def create_users(self):
+        seed, batch_size = self.options['seed'], self.options['batch_size']
+        password = make_password(self.options['password'])
+        tasks = [(seed, index, start, count) for index, start, count in chunks(self.options['users'], batch_size)]
+        user_ids = []
+        for rows in self.map(generate_users, tasks):
+            # 与 get_or_create 一样，重复运行时复用已存在的同名用户
+            User.objects.bulk_create(
+                [User(password=password, **row) for row in rows],
+                batch_size=5000, ignore_conflicts=True
+            )
+            usernames = [row['username'] for row in rows]
+            ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+            user_ids.extend(ids[username] for username in usernames)
+        return np.array(user_ids, dtype=np.int64)
+
+    def create_templates(self, user_ids):
+        seed, batch_size = self.options['seed'], self.options['batch_size']
+        # 模板正文较长，按较小的块生成，避免单块占用过多内存
+        tasks = [
+            (seed, index, start, count, len(user_ids))
+            for index, start, count in chunks(self.options['templates'], min(batch_size, 5000))
+        ]
+        template_ids = []
+        for rows in self.map(generate_templates, tasks):
+            templates = []
+            for row in rows:
+                template = Template(creator_id=int(user_ids[row.pop('creator')]), **row)
+                template.update_search_vector()
+                templates.append(template)
+            with transaction.atomic():
+                store_text_blobs(templates)
+                template_ids.extend(
+                    template.pk for template in Template.objects.bulk_create(templates, batch_size=1000)
                 )
-                
-                context = {
-                    'input_params': {
-                        'scenario': fake.word(),
-                        'requirements': fake.sentence(),
-                        'additional_info': fake.sentence()
-                    },
-                    'duration': random.randint(30, 300),  # 使用时长（秒）
-                    'success': random.random() > 0.1  # 90%的成功率
-                }
-                
-                TemplateUsage.objects.create(
-                    template=template,
-                    user=user,
-                    used_at=used_at,
-                    context=context
-                )
\ No newline at end of file
+        return np.array(template_ids, dtype=np.int64)
+
+    def copy(self, model, columns, func, total, shared):
+        """用 PostgreSQL COPY 分块写入 ``func`` 生成的 CSV 数据。"""
+        seed = self.options['seed']
+        tasks = [(seed, index, start, count) for index, start, count in chunks(total, self.options['batch_size'])]
+        sql = f'COPY {model._meta.db_table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)'
+        written = 0
+        for (_, _, _, count), data in zip(tasks, self.map(func, tasks, shared)):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.copy_expert(sql, io.StringIO(data))
+            written += count
+            if len(tasks) > 1:
+                self.stdout.write(f'  {model.__name__}: {written}/{total}')
+
+    def refresh_aggregates(self, start_date):
+        # 使用次数、评分与日汇总都由明细数据推导，保证与生成的记录一致
+        template_table = Template._meta.db_table
+        usage_table = TemplateUsage._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {template_table} SET usage_count = counts.count '
+                f'FROM (SELECT template_id, COUNT(*) AS count FROM {usage_table} GROUP BY template_id) counts '
+                f'WHERE {template_table}.id = counts.template_id'
+            )
+        Template.objects.all().recompute_ratings()
+        usage_counter.rebuild_rollups(timezone.localdate(start_date), timezone.localdate())
+        refresh_tag_stats()
+        bump(CATALOG)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.partitions import add_months, detach_partitions, ensure_partitions, month_start
+
+
+class Command(BaseCommand):
+    help = 'Creates upcoming monthly TemplateUsage partitions and detaches expired ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead', type=int, default=3,
+            help='Number of future months to create partitions for'
+        )
+        parser.add_argument(
+            '--retain-months', type=int,
+            help='Detach partitions older than this many months (kept unless given)'
+        )
+        parser.add_argument(
+            '--drop', action='store_true',
+            help='Drop detached partitions instead of keeping them as standalone tables'
+        )
+
+    def handle(self, *args, **options):
+        for name in ensure_partitions(months_ahead=options['months_ahead']):
+            self.stdout.write(f'Created partition {name}')
+
+        retain_months = options['retain_months']
+        if retain_months is not None:
+            if retain_months < 1:
+                raise CommandError('--retain-months must be at least 1')
+            # 保留当前月份在内的最近 retain_months 个月
+            cutoff = add_months(month_start(timezone.now()), 1 - retain_months)
+            for name in detach_partitions(cutoff, drop=options['drop']):
+                action = 'Dropped' if options['drop'] else 'Detached'
+                self.stdout.write(f'{action} partition {name}')
+
+        self.stdout.write(self.style.SUCCESS('Successfully maintained usage partitions'))
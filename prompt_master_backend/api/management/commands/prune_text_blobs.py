@@ -0,0 +1,52 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from api.models import TextBlob, lock_text_blobs
+
+
+def blob_references():
+    # 所有指向 TextBlob 的外键，(模型, 字段名)
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if field.is_relation and field.related_model is TextBlob
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Deletes text blobs no longer referenced by any template; run off-peak'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of blobs deleted per batch'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count unreferenced blobs'
+        )
+
+    def handle(self, *args, **options):
+        unreferenced = TextBlob.objects.all()
+        for model, field in blob_references():
+            unreferenced = unreferenced.exclude(
+                Exists(model.objects.filter(**{field: OuterRef('pk')}))
+            )
+
+        if options['dry_run']:
+            self.stdout.write(f'{unreferenced.count()} unreferenced text blobs')
+            return
+
+        deleted = 0
+        while True:
+            digests = list(unreferenced.values_list('pk', flat=True)[:options['batch_size']])
+            if not digests:
+                break
+            with transaction.atomic():
+                # 等待正在写入文本的事务提交后再次确认未被引用，期间新写入的模板可能复用了相同的文本；
+                # 新的写入在本批删除提交后才会继续，届时重新插入被删除的文本
+                lock_text_blobs(shared=False)
+                deleted += unreferenced.filter(pk__in=digests).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} unreferenced text blobs'))
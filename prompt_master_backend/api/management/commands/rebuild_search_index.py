@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from api.cache import CATALOG, bump
+from api.models import Template, PromptTemplate
+from api.search import rebuild_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds full-text search vectors, e.g. after changing SEARCH_TOKENIZER'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows updated per batch'
+        )
+
+    def handle(self, *args, **options):
+        for model in (Template, PromptTemplate):
+            total = rebuild_search_vectors(model, model.SEARCH_FIELDS, options['batch_size'])
+            self.stdout.write(f'Rebuilt search vectors for {total} {model._meta.verbose_name_plural}')
+
+        bump(CATALOG)
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt search index'))
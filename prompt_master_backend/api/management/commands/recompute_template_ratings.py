@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.cache import CATALOG, bump
+from api.models import Template
+
+
+class Command(BaseCommand):
+    help = 'Recomputes rating sum, count and average of templates from their comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Number of templates updated per transaction'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = Template.objects.order_by('pk').values_list('pk', flat=True)
+
+        total = 0
+        last_id = 0
+        while True:
+            # 按主键区间分批，避免单个事务长时间锁住整张模板表
+            batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                total += Template.objects.filter(
+                    pk__gte=batch[0], pk__lte=batch[-1]
+                ).recompute_ratings()
+            last_id = batch[-1]
+            self.stdout.write(f'Recomputed ratings for {total} templates')
+
+        bump(CATALOG)
+        self.stdout.write(self.style.SUCCESS(f'Successfully recomputed ratings for {total} templates'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.rollups import refresh_tag_stats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes per-tag usage counts for the day, week, month and quarter windows'
+
+    def handle(self, *args, **kwargs):
+        refresh_tag_stats()
+        self.stdout.write(self.style.SUCCESS('Successfully refreshed tag statistics'))
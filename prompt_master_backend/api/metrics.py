@@ -0,0 +1,170 @@
+"""按路由统计请求耗时、SQL 查询数与耗时、响应大小，以及使用事件写入管道（api.events）的
+入队、写入、丢弃、失败与队列深度，并以 Prometheus 文本格式导出。
+
+gunicorn 等多进程部署时需在启动前设置环境变量 PROMETHEUS_MULTIPROC_DIR（每次启动清空的目录），
+各 worker 把指标写入该目录下的 mmap 文件，/metrics 汇总所有进程的数据；退出的 worker 由
+gunicorn.conf.py 中的 child_exit 钩子清理。未设置时只导出当前进程的指标。
+
+/metrics 由 settings.METRICS 控制：未启用时返回 404；设置 TOKEN 后要求
+``Authorization: Bearer <TOKEN>``，设置 ALLOWED_IPS 后只允许列出的地址或网段访问。
+"""
+import hmac
+import ipaddress
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+    multiprocess
+)
+
+from .instrumentation import QueryCollector
+
+DEFAULTS = {
+    'ENABLED': False,
+    'TOKEN': '',
+    'ALLOWED_IPS': [],  # 例如 ['127.0.0.1', '10.0.0.0/8']
+}
+
+LABELS = ['route', 'method']
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Request latency by route',
+    LABELS + ['status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL queries executed per request',
+    LABELS,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+DB_DURATION = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in SQL per request',
+    LABELS,
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Response body size by route',
+    LABELS,
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+
+USAGE_EVENTS = Counter(
+    'usage_events', 'Usage events handled by the write pipeline, by outcome',
+    ['outcome'],
+)
+USAGE_EVENT_BATCHES = Counter(
+    'usage_event_batches', 'Usage event batches written by the background writer, by status',
+    ['status'],
+)
+USAGE_EVENT_FLUSH_DURATION = Histogram(
+    'usage_event_flush_duration_seconds', 'Time to write one batch of usage events',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+USAGE_EVENT_QUEUE_DEPTH = Gauge(
+    'usage_event_queue_depth', 'Usage events waiting in the in-process queue',
+    multiprocess_mode='livesum',
+)
+
+# 预先创建各标签，尚未发生的结果也以 0 导出，便于告警规则计算增量
+for outcome in ('enqueued', 'written', 'sync_writes', 'dropped', 'failed'):
+    USAGE_EVENTS.labels(outcome)
+for status in ('written', 'retried', 'failed'):
+    USAGE_EVENT_BATCHES.labels(status)
+
+
+class QueryCounter(QueryCollector):
+    # 只累计次数与耗时，不保存 SQL，请求路径上的开销尽量小
+    count = 0
+    duration = 0.0
+
+    def record(self, sql, params, many, duration, alias):
+        with self._lock:
+            self.count += 1
+            self.duration += duration
+
+
+def route_label(request):
+    # 使用 URL 名称而不是路径，避免 <pk> 等参数造成标签基数膨胀
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+def observe(request, response, started, queries):
+    route = route_label(request)
+    method = request.method
+    REQUEST_DURATION.labels(route, method, str(response.status_code)).observe(time.perf_counter() - started)
+    DB_QUERIES.labels(route, method).observe(queries.count)
+    DB_DURATION.labels(route, method).observe(queries.duration)
+    if not response.streaming:
+        RESPONSE_SIZE.labels(route, method).observe(len(response.content))
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        started = time.perf_counter()
+        with QueryCounter() as queries:
+            response = self.get_response(request)
+        observe(request, response, started, queries)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        # sync_to_async 的工作线程继承当前上下文，async 视图中的查询同样计入
+        with QueryCounter() as queries:
+            response = await self.get_response(request)
+        observe(request, response, started, queries)
+        return response
+
+
+def get_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'METRICS', {}))
+    return config
+
+
+def is_allowed(request, config):
+    if config['TOKEN']:
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(authorization.encode(), f'Bearer {config["TOKEN"]}'.encode()):
+            return False
+    if config['ALLOWED_IPS']:
+        try:
+            address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+        except ValueError:
+            return False
+        return any(address in ipaddress.ip_network(network) for network in config['ALLOWED_IPS'])
+    return True
+
+
+def metrics_view(request):
+    config = get_config()
+    if not config['ENABLED']:
+        raise Http404
+    if not is_allowed(request, config):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
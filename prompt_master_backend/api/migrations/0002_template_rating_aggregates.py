@@ -0,0 +1,60 @@
+# Generated by Django 5.0.2 on 2026-10-18 05:04
+
+from django.db import migrations, models
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    FloatField,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Template = apps.get_model("api", "Template")
+    TemplateComment = apps.get_model("api", "TemplateComment")
+    comments = (
+        TemplateComment.objects.filter(template=OuterRef("pk"))
+        .order_by()
+        .values("template")
+    )
+    Template.objects.update(
+        rating_sum=Coalesce(
+            Subquery(comments.annotate(total=Sum("rating")).values("total")), 0
+        ),
+        rating_count=Coalesce(
+            Subquery(comments.annotate(count=Count("id")).values("count")), 0
+        ),
+    )
+    Template.objects.update(
+        rating=Case(
+            When(rating_count=0, then=Value(0.0)),
+            default=Cast(F("rating_sum"), FloatField()) / F("rating_count"),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="template",
+            name="rating_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="template",
+            name="rating_sum",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.0.2 on 2026-10-18 05:06
+
+import re
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# 分词规则与 SQL 复制自迁移编写时的 api.search.NgramTokenizer，不引用应用代码，
+# 之后修改分词器不会影响本迁移。配置了其他 SEARCH_TOKENIZER 时，迁移后执行 rebuild_search_index。
+SEARCH_FIELDS = (("name", "A"), ("tags", "B"), ("description", "C"))
+
+CJK_RUN = r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+"
+TOKEN_RE = re.compile(rf"{CJK_RUN}|[0-9a-z]+")
+CJK_RE = re.compile(CJK_RUN)
+
+
+def tokenize(text):
+    # 中文切出单字和相邻双字，其余按字母数字切词
+    tokens = []
+    for word in TOKEN_RE.findall(text.lower()):
+        if CJK_RE.fullmatch(word):
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def field_text(value):
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(item) for item in value)
+    return value or ""
+
+
+def populate_search_vectors(apps, schema_editor):
+    quote = schema_editor.quote_name
+    names = [name for name, _ in SEARCH_FIELDS]
+    vector = " || ".join(
+        f"setweight(array_to_tsvector(%s::text[]), '{weight}')" for _, weight in SEARCH_FIELDS
+    )
+    for model_name in ("Template", "PromptTemplate"):
+        model = apps.get_model("api", model_name)
+        sql = f"UPDATE {quote(model._meta.db_table)} SET search_vector = ({vector}) WHERE id = %s"
+        rows = model.objects.using(schema_editor.connection.alias) \
+            .order_by("pk") \
+            .values_list("pk", *names)
+        with schema_editor.connection.cursor() as cursor:
+            batch = []
+            for pk, *values in rows.iterator(chunk_size=1000):
+                batch.append([sorted(set(tokenize(field_text(value)))) for value in values] + [pk])
+                if len(batch) >= 1000:
+                    cursor.executemany(sql, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_template_rating_aggregates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="prompttemplate",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="template",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="prompttemplate",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="prompttemplate_search_gin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="template",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="template_search_gin"
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.2 on 2026-10-18 05:06
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_search_vectors"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="prompttemplate",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["tags"], name="prompttemplate_tags_gin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scene",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["tags"], name="scene_tags_gin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="template",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["tags"], name="template_tags_gin"
+            ),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.0.2 on 2026-10-18 05:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_tag_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TemplateNeighbor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="templateusage",
+            index=models.Index(
+                fields=["user", "-used_at"], name="usage_user_recent_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="templateusage",
+            index=models.Index(
+                fields=["user", "template"], name="usage_user_template_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="templateneighbor",
+            name="neighbor",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="neighbor_of",
+                to="api.template",
+            ),
+        ),
+        migrations.AddField(
+            model_name="templateneighbor",
+            name="template",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="neighbors",
+                to="api.template",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="templateneighbor",
+            index=models.Index(
+                fields=["template", "-score"], name="template_neighbor_score_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="templateneighbor",
+            constraint=models.UniqueConstraint(
+                fields=("template", "neighbor"), name="unique_template_neighbor"
+            ),
+        ),
+    ]
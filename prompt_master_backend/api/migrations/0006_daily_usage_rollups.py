@@ -0,0 +1,104 @@
+# Generated by Django 5.0.2 on 2026-10-18 05:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_template_neighbors"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TagDailyUsage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tag", models.CharField(max_length=100)),
+                ("date", models.DateField()),
+                ("count", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TemplateDailyUsage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("count", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="CategoryDailyUsage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("category", models.CharField(max_length=50)),
+                ("date", models.DateField()),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["date"], name="category_daily_usage_date_idx")
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="categorydailyusage",
+            constraint=models.UniqueConstraint(
+                fields=("category", "date"), name="unique_category_daily_usage"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tagdailyusage",
+            index=models.Index(fields=["date"], name="tag_daily_usage_date_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="tagdailyusage",
+            constraint=models.UniqueConstraint(
+                fields=("tag", "date"), name="unique_tag_daily_usage"
+            ),
+        ),
+        migrations.AddField(
+            model_name="templatedailyusage",
+            name="template",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="daily_usage",
+                to="api.template",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="templatedailyusage",
+            index=models.Index(fields=["date"], name="template_daily_usage_date_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="templatedailyusage",
+            constraint=models.UniqueConstraint(
+                fields=("template", "date"), name="unique_template_daily_usage"
+            ),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.2 on 2026-10-18 05:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_daily_usage_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TagUsageStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tag", models.CharField(max_length=100)),
+                (
+                    "window",
+                    models.CharField(
+                        choices=[
+                            ("day", "今日"),
+                            ("week", "近一周"),
+                            ("month", "近一月"),
+                            ("quarter", "近一季度"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+                ("refreshed_at", models.DateTimeField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["window", "-count"], name="tag_usage_stats_top_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="tagusagestats",
+            constraint=models.UniqueConstraint(
+                fields=("window", "tag"), name="unique_tag_usage_stats"
+            ),
+        ),
+    ]
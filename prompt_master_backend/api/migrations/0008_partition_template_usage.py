@@ -0,0 +1,123 @@
+# 把 TemplateUsage 改为按 used_at 月份范围分区的表。
+# 模型状态不变：Django 仍以 id 作为主键，数据库主键为 (id, used_at)，以满足分区表的约束要求。
+
+from datetime import datetime
+
+from django.db import migrations
+from django.utils import timezone
+
+PARTITION_TABLE = """
+ALTER TABLE api_templateusage RENAME TO api_templateusage_unpartitioned;
+ALTER INDEX api_templateusage_pkey RENAME TO api_templateusage_unpartitioned_pkey;
+
+CREATE SEQUENCE api_templateusage_partitioned_id_seq;
+CREATE TABLE api_templateusage (
+    id bigint NOT NULL DEFAULT nextval('api_templateusage_partitioned_id_seq'),
+    used_at timestamp with time zone NOT NULL,
+    context jsonb NOT NULL,
+    template_id bigint NOT NULL,
+    user_id bigint NOT NULL,
+    CONSTRAINT api_templateusage_pkey PRIMARY KEY (id, used_at)
+) PARTITION BY RANGE (used_at);
+ALTER SEQUENCE api_templateusage_partitioned_id_seq OWNED BY api_templateusage.id;
+CREATE TABLE api_templateusage_default PARTITION OF api_templateusage DEFAULT;
+"""
+
+COPY_ROWS = """
+INSERT INTO api_templateusage (id, used_at, context, template_id, user_id)
+    SELECT id, used_at, context, template_id, user_id FROM api_templateusage_unpartitioned;
+SELECT setval(
+    'api_templateusage_partitioned_id_seq',
+    COALESCE((SELECT MAX(id) FROM api_templateusage), 0) + 1,
+    false
+);
+DROP TABLE api_templateusage_unpartitioned;
+ALTER SEQUENCE api_templateusage_partitioned_id_seq RENAME TO api_templateusage_id_seq;
+
+ALTER TABLE api_templateusage
+    ADD CONSTRAINT api_templateusage_template_id_f9a4778b_fk_api_template_id
+    FOREIGN KEY (template_id) REFERENCES api_template (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE api_templateusage
+    ADD CONSTRAINT api_templateusage_user_id_4a98b488_fk_api_user_id
+    FOREIGN KEY (user_id) REFERENCES api_user (id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX api_templateusage_template_id_f9a4778b ON api_templateusage (template_id);
+CREATE INDEX api_templateusage_user_id_4a98b488 ON api_templateusage (user_id);
+CREATE INDEX usage_user_recent_idx ON api_templateusage (user_id, used_at DESC);
+CREATE INDEX usage_user_template_idx ON api_templateusage (user_id, template_id);
+"""
+
+UNPARTITION_TABLE = """
+CREATE TABLE api_templateusage_unpartitioned (
+    id bigint NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    used_at timestamp with time zone NOT NULL,
+    context jsonb NOT NULL,
+    template_id bigint NOT NULL,
+    user_id bigint NOT NULL
+);
+INSERT INTO api_templateusage_unpartitioned (id, used_at, context, template_id, user_id)
+    SELECT id, used_at, context, template_id, user_id FROM api_templateusage;
+SELECT setval(
+    pg_get_serial_sequence('api_templateusage_unpartitioned', 'id'),
+    COALESCE((SELECT MAX(id) FROM api_templateusage_unpartitioned), 0) + 1,
+    false
+);
+DROP TABLE api_templateusage CASCADE;
+ALTER TABLE api_templateusage_unpartitioned RENAME TO api_templateusage;
+ALTER INDEX api_templateusage_unpartitioned_pkey RENAME TO api_templateusage_pkey;
+ALTER SEQUENCE api_templateusage_unpartitioned_id_seq RENAME TO api_templateusage_id_seq;
+
+ALTER TABLE api_templateusage
+    ADD CONSTRAINT api_templateusage_template_id_f9a4778b_fk_api_template_id
+    FOREIGN KEY (template_id) REFERENCES api_template (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE api_templateusage
+    ADD CONSTRAINT api_templateusage_user_id_4a98b488_fk_api_user_id
+    FOREIGN KEY (user_id) REFERENCES api_user (id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX api_templateusage_template_id_f9a4778b ON api_templateusage (template_id);
+CREATE INDEX api_templateusage_user_id_4a98b488 ON api_templateusage (user_id);
+CREATE INDEX usage_user_recent_idx ON api_templateusage (user_id, used_at DESC);
+CREATE INDEX usage_user_template_idx ON api_templateusage (user_id, template_id);
+"""
+
+
+# 以下分区命名与月份计算复制自迁移编写时的 api.partitions，不引用应用代码
+def month_start(value):
+    value = timezone.localtime(value)
+    return timezone.make_aware(datetime(value.year, value.month, 1), value.tzinfo)
+
+
+def add_months(start, months):
+    index = start.year * 12 + start.month - 1 + months
+    return timezone.make_aware(datetime(index // 12, index % 12 + 1, 1), start.tzinfo)
+
+
+def create_monthly_partitions(apps, schema_editor):
+    # 先按已有数据的时间范围建好月分区，再复制数据，避免记录全部落入默认分区。
+    # 此时默认分区为空，可以直接创建分区，无需像 api.partitions 那样迁移默认分区中的记录
+    quote = schema_editor.quote_name
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT MIN(used_at) FROM api_templateusage_unpartitioned")
+        first_used_at = cursor.fetchone()[0]
+
+        current = month_start(first_used_at or timezone.now())
+        last = add_months(month_start(timezone.now()), 3)
+        while current <= last:
+            name = f"api_templateusage_y{current.year:04d}m{current.month:02d}"
+            cursor.execute(
+                f"CREATE TABLE {quote(name)} PARTITION OF api_templateusage "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [current, add_months(current, 1)],
+            )
+            current = add_months(current, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_tag_usage_stats"),
+    ]
+
+    operations = [
+        migrations.RunSQL(PARTITION_TABLE, UNPARTITION_TABLE),
+        migrations.RunPython(create_monthly_partitions, migrations.RunPython.noop),
+        migrations.RunSQL(COPY_ROWS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.0.2 on 2026-10-18 05:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_partition_template_usage"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="prompttemplate",
+            name="creator",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="prompt_templates",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prompttemplate",
+            index=models.Index(
+                fields=["created_at", "id"], name="prompttpl_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prompttemplate",
+            index=models.Index(
+                fields=["updated_at", "id"], name="prompttpl_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prompttemplate",
+            index=models.Index(fields=["name", "id"], name="prompttpl_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="prompttemplate",
+            index=models.Index(
+                fields=["is_public", "created_at", "id"],
+                name="prompttpl_public_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prompttemplate",
+            index=models.Index(
+                fields=["is_public", "updated_at", "id"],
+                name="prompttpl_public_updated_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prompttemplate",
+            index=models.Index(
+                fields=["is_public", "name", "id"], name="prompttpl_public_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prompttemplate",
+            index=models.Index(
+                fields=["creator", "created_at", "id"],
+                name="prompttpl_creator_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prompttemplate",
+            index=models.Index(
+                fields=["creator", "updated_at", "id"],
+                name="prompttpl_creator_updated_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prompttemplate",
+            index=models.Index(
+                fields=["creator", "name", "id"], name="prompttpl_creator_name_idx"
+            ),
+        ),
+    ]
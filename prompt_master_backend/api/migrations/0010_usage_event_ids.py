@@ -0,0 +1,30 @@
+# Generated by Django 5.0.2 on 2026-10-18 05:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_prompt_template_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="templateusage",
+            name="event_id",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name="templateusage",
+            name="used_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddConstraint(
+            model_name="templateusage",
+            constraint=models.UniqueConstraint(
+                fields=("user", "event_id", "used_at"), name="unique_usage_event"
+            ),
+        ),
+    ]
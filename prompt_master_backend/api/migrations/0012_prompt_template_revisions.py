@@ -0,0 +1,90 @@
+# Generated by Django 5.0.2 on 2026-10-18 05:41
+
+import json
+import zlib
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+# 快照格式复制自迁移编写时的 api.revisions，不引用应用代码
+TRACKED_FIELDS = ("name", "description", "content", "tags", "is_public")
+
+
+def encode(payload):
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode())
+
+
+def snapshot_current_versions(apps, schema_editor):
+    # 已有模板以当前内容作为其当前版本的快照，之后的修改以此为基础记录差异
+    PromptTemplate = apps.get_model("api", "PromptTemplate")
+    PromptTemplateRevision = apps.get_model("api", "PromptTemplateRevision")
+    batch = []
+    db_alias = schema_editor.connection.alias
+    for obj in PromptTemplate.objects.using(db_alias).order_by("pk").iterator(chunk_size=1000):
+        batch.append(PromptTemplateRevision(
+            prompt_template_id=obj.pk,
+            version=obj.version,
+            is_snapshot=True,
+            data=encode({field: getattr(obj, field) for field in TRACKED_FIELDS}),
+            created_at=obj.updated_at,
+        ))
+        if len(batch) >= 1000:
+            PromptTemplateRevision.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    PromptTemplateRevision.objects.using(db_alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_user_token_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PromptTemplateRevision",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.IntegerField()),
+                ("is_snapshot", models.BooleanField(default=False)),
+                ("data", models.BinaryField()),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "author",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "prompt_template",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="revisions",
+                        to="api.prompttemplate",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="prompttemplaterevision",
+            constraint=models.UniqueConstraint(
+                fields=("prompt_template", "version"),
+                name="unique_prompt_template_revision",
+            ),
+        ),
+        migrations.RunPython(snapshot_current_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,187 @@
+# Generated by Django 5.0.2 on 2026-10-18 06:02
+
+import hashlib
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BLOB_FIELDS = {
+    "Template": ("content", "usage", "example"),
+    "PromptTemplate": ("content",),
+}
+
+
+def batches(queryset, size=1000):
+    # 按主键分批（键集分页）：写回的行不影响后续批次的范围，也不用 OFFSET 反复扫描已处理的行
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        objs = list(page.order_by("pk")[:size])
+        if not objs:
+            return
+        yield objs
+        last_pk = objs[-1].pk
+
+
+def move_text_to_blobs(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    TextBlob = apps.get_model("api", "TextBlob")
+    for model_name, fields in BLOB_FIELDS.items():
+        model = apps.get_model("api", model_name)
+        for objs in batches(model.objects.using(db_alias).only("pk", *fields)):
+            blobs = {}
+            for obj in objs:
+                for field in fields:
+                    encoded = getattr(obj, field).encode()
+                    digest = hashlib.sha256(encoded).hexdigest()
+                    blobs[digest] = TextBlob(digest=digest, data=zlib.compress(encoded), size=len(encoded))
+                    setattr(obj, f"{field}_blob_id", digest)
+            TextBlob.objects.using(db_alias).bulk_create(list(blobs.values()), ignore_conflicts=True)
+            model.objects.using(db_alias).bulk_update(objs, [f"{field}_blob" for field in fields])
+
+
+def move_blobs_to_text(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    TextBlob = apps.get_model("api", "TextBlob")
+    for model_name, fields in BLOB_FIELDS.items():
+        model = apps.get_model("api", model_name)
+        for objs in batches(model.objects.using(db_alias).only("pk", *[f"{field}_blob" for field in fields])):
+            digests = {getattr(obj, f"{field}_blob_id") for obj in objs for field in fields}
+            texts = {
+                blob.digest: zlib.decompress(bytes(blob.data)).decode()
+                for blob in TextBlob.objects.using(db_alias).filter(digest__in=digests)
+            }
+            for obj in objs:
+                for field in fields:
+                    setattr(obj, field, texts[getattr(obj, f"{field}_blob_id")])
+            model.objects.using(db_alias).bulk_update(objs, list(fields))
+
+
+def blob_field():
+    return models.ForeignKey(
+        db_index=False,
+        null=True,
+        on_delete=django.db.models.deletion.PROTECT,
+        related_name="+",
+        to="api.textblob",
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_prompt_template_revisions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TextBlob",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("data", models.BinaryField()),
+                ("size", models.IntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="template",
+            name="content_blob",
+            field=blob_field(),
+        ),
+        migrations.AddField(
+            model_name="template",
+            name="usage_blob",
+            field=blob_field(),
+        ),
+        migrations.AddField(
+            model_name="template",
+            name="example_blob",
+            field=blob_field(),
+        ),
+        migrations.AddField(
+            model_name="prompttemplate",
+            name="content_blob",
+            field=blob_field(),
+        ),
+        migrations.RunPython(move_text_to_blobs, move_blobs_to_text),
+        # blank=True 只影响状态，使回滚时重新添加的非空文本列以空字符串填充，再由上一步写回原文
+        migrations.AlterField(
+            model_name="template",
+            name="content",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name="template",
+            name="usage",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name="template",
+            name="example",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name="prompttemplate",
+            name="content",
+            field=models.TextField(blank=True),
+        ),
+        migrations.RemoveField(
+            model_name="template",
+            name="content",
+        ),
+        migrations.RemoveField(
+            model_name="template",
+            name="usage",
+        ),
+        migrations.RemoveField(
+            model_name="template",
+            name="example",
+        ),
+        migrations.RemoveField(
+            model_name="prompttemplate",
+            name="content",
+        ),
+        migrations.AlterField(
+            model_name="template",
+            name="content_blob",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="api.textblob",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="template",
+            name="usage_blob",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="api.textblob",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="template",
+            name="example_blob",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="api.textblob",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="prompttemplate",
+            name="content_blob",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="api.textblob",
+            ),
+        ),
+    ]
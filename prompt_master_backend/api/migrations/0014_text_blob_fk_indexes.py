@@ -0,0 +1,35 @@
+# Generated by Django 5.0.2 on 2026-10-18 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_text_blobs"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="prompttemplate",
+            index=models.Index(
+                fields=["content_blob"], name="prompttpl_content_blob_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="template",
+            index=models.Index(
+                fields=["content_blob"], name="template_content_blob_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="template",
+            index=models.Index(fields=["usage_blob"], name="template_usage_blob_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="template",
+            index=models.Index(
+                fields=["example_blob"], name="template_example_blob_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.2 on 2026-10-18 06:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0014_text_blob_fk_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TemplateCousageState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("data", models.BinaryField()),
+                ("watermark", models.BigIntegerField()),
+                ("scanned_at", models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,10 +1,137 @@
+import hashlib
+import zlib
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connection, models, transaction
+from django.db.transaction import TransactionManagementError
+from django.db.models import (
+    Case, Count, Exists, F, FloatField, OuterRef, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Cast, Coalesce
 from django.utils import timezone
+from .search import build_search_vector
+
+class SearchIndexedModel(models.Model):
+    # 需要全文检索的模型在保存时同步更新 search_vector，字段与权重由 SEARCH_FIELDS 指定
+    SEARCH_FIELDS = ()
+
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def update_search_vector(self):
+        self.search_vector = build_search_vector(self, self.SEARCH_FIELDS)
+
+    def save(self, *args, **kwargs):
+        self.update_search_vector()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'search_vector'}
+        super().save(*args, **kwargs)
+
+class TextBlob(models.Model):
+    # 内容寻址的压缩文本：主键为原文的 SHA-256，相同的文本只保存一份
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()  # zlib 压缩的 UTF-8 原文
+    size = models.IntegerField()  # 原文字节数
+
+    @classmethod
+    def from_text(cls, text):
+        encoded = text.encode()
+        return cls(digest=hashlib.sha256(encoded).hexdigest(), data=zlib.compress(encoded), size=len(encoded))
+
+    @property
+    def text(self):
+        return zlib.decompress(bytes(self.data)).decode()
+
+    def __str__(self):
+        return self.digest
+
+def blob_text(name):
+    """把 ``<name>_blob`` 外键包装为文本属性：读取时解压关联的 TextBlob，赋值时生成新的 TextBlob。
+
+    关联对象未随查询加载（select_related）时，读取会额外执行一次查询。
+    """
+    fk = f'{name}_blob'
+
+    def getter(self):
+        if getattr(self, f'{fk}_id') is None:
+            return ''
+        return getattr(self, fk).text
+
+    def setter(self, value):
+        setattr(self, fk, TextBlob.from_text(value))
+
+    return property(getter, setter)
+
+# 写入引用 TextBlob 的行时持有共享锁，prune_text_blobs 删除时持有排他锁：
+# 复用已有摘要的写入在提交前不会被清理任务看作未引用
+TEXT_BLOB_LOCK = 'text-blobs'
+
+
+def lock_text_blobs(shared=True):
+    function = 'pg_advisory_xact_lock_shared' if shared else 'pg_advisory_xact_lock'
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {function}(hashtextextended(%s, 0))', [TEXT_BLOB_LOCK])
+
+
+def store_text_blobs(objs):
+    """写入 ``objs`` 中新赋值的文本，bulk_create / bulk_update 前需要手动调用，save() 会自动调用。
+
+    必须与写入 ``objs`` 在同一事务内调用：锁在事务结束时才释放，事务外调用时锁随语句释放，
+    清理任务可能在 ``objs`` 写入前删除刚保存的文本。
+    """
+    if not connection.in_atomic_block:
+        raise TransactionManagementError('store_text_blobs() must be called inside transaction.atomic().')
+    blobs = {}
+    for obj in objs:
+        for name in obj.BLOB_FIELDS:
+            field = obj._meta.get_field(f'{name}_blob')
+            if field.is_cached(obj):
+                blob = field.get_cached_value(obj)
+                if blob is not None and blob._state.adding:
+                    blobs[blob.digest] = blob
+    if blobs:
+        lock_text_blobs()
+        TextBlob.objects.bulk_create(list(blobs.values()), batch_size=1000, ignore_conflicts=True)
+        for blob in blobs.values():
+            blob._state.adding = False
+
+class CompressedTextModel(models.Model):
+    # 较大的文本字段（BLOB_FIELDS）保存在 TextBlob 中，列表查询只读取 64 字节的摘要
+    BLOB_FIELDS = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {
+                f'{field}_blob' if field in self.BLOB_FIELDS else field for field in update_fields
+            }
+        # 锁与引用文本的行在同一事务中；已在事务中时不需要保存点
+        with transaction.atomic(savepoint=False):
+            store_text_blobs([self])
+            super().save(*args, **kwargs)
 
 class User(AbstractUser):
-    # Add custom fields for the user model here
-    pass
+    # 写入 JWT 的 ver 声明；修改密码时递增，使已签发的令牌与认证缓存全部失效
+    token_version = models.PositiveIntegerField(default=0)
+
+    def save(self, *args, **kwargs):
+        # set_password 设置的新密码在保存前保留在 _password 中；登录时的哈希算法升级
+        # 会在保存前清空它，密码并未改变，不应使已签发的令牌失效
+        update_fields = kwargs.get('update_fields')
+        if self._password is not None and not self._state.adding \
+                and (update_fields is None or 'password' in update_fields):
+            self.token_version += 1
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'token_version'}
+        super().save(*args, **kwargs)
 
 class Scene(models.Model):
     name = models.CharField(max_length=200)
@@ -14,10 +141,68 @@ class Scene(models.Model):
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scenes')
     tags = models.JSONField(default=list)
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['tags'], name='scene_tags_gin'),
+        ]
+
     def __str__(self):
         return self.name
 
-class Template(models.Model):
+class TemplateQuerySet(models.QuerySet):
+    def with_comment_count(self):
+        # 用子查询统计评论数，避免与其他聚合的 JOIN 相互放大
+        comments = TemplateComment.objects.filter(template=OuterRef('pk')) \
+            .order_by() \
+            .values('template') \
+            .annotate(count=Count('id')) \
+            .values('count')
+        return self.annotate(comment_count=Coalesce(Subquery(comments), 0))
+
+    def for_list(self):
+        return self.select_related('creator').with_comment_count()
+
+    def unused_by(self, user):
+        used = TemplateUsage.objects.filter(user=user, template=OuterRef('pk'))
+        return self.exclude(Exists(used))
+
+    def recommended_for(self, user, recent_window):
+        # 以用户最近使用的模板为种子，汇总预计算邻居的相似度
+        recent_templates = TemplateUsage.objects.filter(user=user) \
+            .order_by('-used_at') \
+            .values('template_id')[:recent_window]
+        return self.for_list() \
+            .filter(neighbor_of__template__in=Subquery(recent_templates)) \
+            .unused_by(user) \
+            .annotate(similarity=Sum('neighbor_of__score')) \
+            .order_by('-similarity', '-rating')
+
+    def popular_for(self, user, exclude=()):
+        # 新用户或邻居不足时用高评分、高使用量的模板补足
+        return self.for_list() \
+            .unused_by(user) \
+            .exclude(pk__in=exclude) \
+            .order_by('-rating', '-usage_count')
+
+    def recompute_ratings(self):
+        # 根据评论表重新计算评分总和、数量与平均分，返回更新的模板数量
+        comments = TemplateComment.objects.filter(template=OuterRef('pk')) \
+            .order_by() \
+            .values('template')
+        updated = self.update(
+            rating_sum=Coalesce(Subquery(comments.annotate(total=Sum('rating')).values('total')), 0),
+            rating_count=Coalesce(Subquery(comments.annotate(count=Count('id')).values('count')), 0),
+        )
+        self.update(rating=Case(
+            When(rating_count=0, then=Value(0.0)),
+            default=Cast(F('rating_sum'), FloatField()) / F('rating_count'),
+        ))
+        return updated
+
+class Template(CompressedTextModel, SearchIndexedModel):
+    SEARCH_FIELDS = (('name', 'A'), ('tags', 'B'), ('description', 'C'))
+    BLOB_FIELDS = ('content', 'usage', 'example')
+
     CATEGORY_CHOICES = [
         ('analysis', '数据分析'),
         ('writing', '文案创作'),
@@ -28,16 +213,34 @@ class Template(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
-    content = models.TextField()
-    usage = models.TextField()
-    example = models.TextField()
+    # 文本外键的索引在 Meta 中声明：prune_text_blobs 按它们判断 TextBlob 是否仍被引用；
+    # db_index 会为字符串外键额外建立无用的 varchar_pattern_ops 索引
+    content_blob = models.ForeignKey(TextBlob, on_delete=models.PROTECT, related_name='+', db_index=False)
+    usage_blob = models.ForeignKey(TextBlob, on_delete=models.PROTECT, related_name='+', db_index=False)
+    example_blob = models.ForeignKey(TextBlob, on_delete=models.PROTECT, related_name='+', db_index=False)
+    content = blob_text('content')
+    usage = blob_text('usage')
+    example = blob_text('example')
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='templates')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     tags = models.JSONField(default=list)
     rating = models.FloatField(default=0)
+    rating_sum = models.BigIntegerField(default=0)  # 评论评分总和，与 rating_count 一起增量维护平均分
+    rating_count = models.IntegerField(default=0)
     usage_count = models.IntegerField(default=0)
 
+    objects = TemplateQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='template_search_gin'),
+            GinIndex(fields=['tags'], name='template_tags_gin'),
+            models.Index(fields=['content_blob'], name='template_content_blob_idx'),
+            models.Index(fields=['usage_blob'], name='template_usage_blob_idx'),
+            models.Index(fields=['example_blob'], name='template_example_blob_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -51,28 +254,181 @@ class TemplateComment(models.Model):
     def __str__(self):
         return f"Comment on {self.template.name} by {self.user.username}"
 
-class PromptTemplate(models.Model):
+class PromptTemplate(CompressedTextModel, SearchIndexedModel):
+    SEARCH_FIELDS = (('name', 'A'), ('tags', 'B'), ('description', 'C'))
+    BLOB_FIELDS = ('content',)
+
     name = models.CharField(max_length=200)
     description = models.TextField()
-    content = models.TextField()
-    creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='prompt_templates')
+    content_blob = models.ForeignKey(TextBlob, on_delete=models.PROTECT, related_name='+', db_index=False)
+    content = blob_text('content')
+    # 按创建者查询由下方 (creator, 排序键, id) 复合索引覆盖，不再单独建外键索引
+    creator = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='prompt_templates', db_index=False
+    )
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     is_public = models.BooleanField(default=True)
     tags = models.JSONField(default=list)
     version = models.IntegerField(default=1)
-    
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='prompttemplate_search_gin'),
+            GinIndex(fields=['tags'], name='prompttemplate_tags_gin'),
+            # 游标分页：每个可排序字段都以 id 作为次序键，并按可见性 / 创建者过滤
+            models.Index(fields=['created_at', 'id'], name='prompttpl_created_idx'),
+            models.Index(fields=['updated_at', 'id'], name='prompttpl_updated_idx'),
+            models.Index(fields=['name', 'id'], name='prompttpl_name_idx'),
+            models.Index(fields=['is_public', 'created_at', 'id'], name='prompttpl_public_created_idx'),
+            models.Index(fields=['is_public', 'updated_at', 'id'], name='prompttpl_public_updated_idx'),
+            models.Index(fields=['is_public', 'name', 'id'], name='prompttpl_public_name_idx'),
+            models.Index(fields=['creator', 'created_at', 'id'], name='prompttpl_creator_created_idx'),
+            models.Index(fields=['creator', 'updated_at', 'id'], name='prompttpl_creator_updated_idx'),
+            models.Index(fields=['creator', 'name', 'id'], name='prompttpl_creator_name_idx'),
+            models.Index(fields=['content_blob'], name='prompttpl_content_blob_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+class PromptTemplateRevision(models.Model):
+    # 提示词模板的历史版本，由 api.revisions 维护：data 为 zlib 压缩的 JSON，
+    # 快照保存全部受跟踪字段，其余版本只保存相对上一版本的行级差异
+    prompt_template = models.ForeignKey(PromptTemplate, on_delete=models.CASCADE, related_name='revisions')
+    version = models.IntegerField()
+    is_snapshot = models.BooleanField(default=False)
+    data = models.BinaryField()
+    author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['prompt_template', 'version'], name='unique_prompt_template_revision'),
+        ]
+
+    def __str__(self):
+        return f"{self.prompt_template_id} v{self.version}"
+
 class TemplateUsage(models.Model):
     template = models.ForeignKey(Template, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    used_at = models.DateTimeField(auto_now_add=True)
+    used_at = models.DateTimeField(default=timezone.now)
     context = models.JSONField(default=dict)  # 存储使用时的上下文信息
+    event_id = models.CharField(max_length=64, null=True, blank=True)  # 客户端生成的事件 ID，用于批量上报去重
 
     class Meta:
         ordering = ['-used_at']
+        constraints = [
+            # 分区表上的唯一约束必须包含分区键 used_at
+            models.UniqueConstraint(fields=['user', 'event_id', 'used_at'], name='unique_usage_event'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-used_at'], name='usage_user_recent_idx'),
+            models.Index(fields=['user', 'template'], name='usage_user_template_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} used {self.template.name} at {self.used_at}"
+
+class TemplateNeighbor(models.Model):
+    # 由 build_template_recommendations 预计算的模板共现相似度，每个模板只保留得分最高的若干邻居
+    template = models.ForeignKey(Template, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Template, on_delete=models.CASCADE, related_name='neighbor_of')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['template', 'neighbor'], name='unique_template_neighbor'),
+        ]
+        indexes = [
+            models.Index(fields=['template', '-score'], name='template_neighbor_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.template_id} -> {self.neighbor_id} ({self.score:.3f})"
+
+class TemplateCousageState(models.Model):
+    # build_template_recommendations 增量构建所需的状态（api.recommendations），只有一行；
+    # 保存在数据库中，在任何一台主机上执行的构建都基于同一份状态
+    data = models.BinaryField()  # 共现矩阵与使用矩阵，np.savez_compressed 格式
+    watermark = models.BigIntegerField()  # 已处理的 TemplateUsage 最大主键
+    scanned_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"co-usage state up to usage {self.watermark}"
+
+class TemplateDailyUsage(models.Model):
+    # 以下日汇总表由 api.rollups 维护，供使用统计接口读取，避免扫描 TemplateUsage 明细
+    template = models.ForeignKey(Template, on_delete=models.CASCADE, related_name='daily_usage')
+    date = models.DateField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['template', 'date'], name='unique_template_daily_usage'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='template_daily_usage_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.template_id} on {self.date}: {self.count}"
+
+class CategoryDailyUsage(models.Model):
+    category = models.CharField(max_length=50)
+    date = models.DateField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'date'], name='unique_category_daily_usage'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='category_daily_usage_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.category} on {self.date}: {self.count}"
+
+class TagDailyUsage(models.Model):
+    tag = models.CharField(max_length=100)
+    date = models.DateField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tag', 'date'], name='unique_tag_daily_usage'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='tag_daily_usage_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tag} on {self.date}: {self.count}"
+
+class TagUsageStats(models.Model):
+    # 各标签在滚动时间窗口内的使用次数，由 api.rollups.refresh_tag_stats 从 TagDailyUsage 汇总
+    WINDOW_CHOICES = [
+        ('day', '今日'),
+        ('week', '近一周'),
+        ('month', '近一月'),
+        ('quarter', '近一季度'),
+    ]
+    WINDOW_DAYS = {'day': 0, 'week': 7, 'month': 30, 'quarter': 90}
+
+    tag = models.CharField(max_length=100)
+    window = models.CharField(max_length=10, choices=WINDOW_CHOICES)
+    count = models.IntegerField(default=0)
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['window', 'tag'], name='unique_tag_usage_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['window', '-count'], name='tag_usage_stats_top_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} used {self.template.name} at {self.used_at}"
\ No newline at end of file
+        return f"{self.tag} ({self.window}): {self.count}"
@@ -0,0 +1,113 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class StandardPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """按（排序键, 唯一键）做游标分页，只支持向后翻页。
+
+    queryset 必须按两个方向相同的字段排序，第二个字段唯一（通常为 id），例如
+    ``order_by('-created_at', '-id')``。游标记录上一页最后一行的两个值，下一页通过
+    ``key <= v AND (key < v OR id < last_id)`` 定位，配合 (key, id) 索引，
+    任意深度的页面与第一页开销相同。
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by)
+        if len(ordering) != 2 or not all(isinstance(field, str) for field in ordering):
+            raise ValueError('KeysetPagination requires ordering by (key, unique key)')
+        descending = {field.startswith('-') for field in ordering}
+        if len(descending) != 1:
+            raise ValueError('KeysetPagination requires both ordering fields in the same direction')
+        return [field.lstrip('-') for field in ordering], descending.pop()
+
+    def decode_cursor(self, request, model, fields):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if data['fields'] != fields:
+                raise ValueError
+            return [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(fields, data['values'])
+            ]
+        except (ValueError, KeyError, TypeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, fields):
+        values = [
+            obj._meta.get_field(field).value_to_string(obj)
+            for field in fields
+        ]
+        data = json.dumps({'fields': fields, 'values': values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        fields, descending = self.get_ordering(queryset)
+
+        cursor = self.decode_cursor(request, queryset.model, fields)
+        if cursor is not None:
+            (key, tiebreaker), (key_value, tiebreaker_value) = fields, cursor
+            op = 'lt' if descending else 'gt'
+            # 外层的 key <= v 让数据库可以直接在索引上定位起点
+            queryset = queryset.filter(
+                Q(**{f'{key}__{op}e': key_value})
+                & (Q(**{f'{key}__{op}': key_value}) | Q(**{f'{tiebreaker}__{op}': tiebreaker_value}))
+            )
+
+        results = list(queryset[:page_size + 1])
+        self.page = results[:page_size]
+        self.next_cursor = self.encode_cursor(self.page[-1], fields) if len(results) > page_size else None
+        return self.page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
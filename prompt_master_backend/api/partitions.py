@@ -0,0 +1,104 @@
+import re
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import TemplateUsage
+
+# TemplateUsage 按 used_at 每月一个分区，另有一个默认分区兜底落在范围外的记录
+PARTITION_NAME_RE = re.compile(r'_y(\d{4})m(\d{2})$')
+
+
+def usage_table():
+    return TemplateUsage._meta.db_table
+
+
+def month_start(value):
+    value = timezone.localtime(value)
+    return timezone.make_aware(datetime(value.year, value.month, 1), value.tzinfo)
+
+
+def add_months(start, months):
+    index = start.year * 12 + start.month - 1 + months
+    return timezone.make_aware(datetime(index // 12, index % 12 + 1, 1), start.tzinfo)
+
+
+def partition_name(table, start):
+    return f'{table}_y{start.year:04d}m{start.month:02d}'
+
+
+def list_partitions(table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE parent.relname = %s ORDER BY child.relname',
+            [table]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def create_partition(table, start):
+    """创建 ``start`` 所在月份的分区，并把默认分区中属于该月的记录移入新分区。"""
+    name = partition_name(table, start)
+    end = add_months(start, 1)
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE {quote(name)} '
+            f'(LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        )
+        cursor.execute(
+            f'WITH moved AS ('
+            f'DELETE FROM {quote(table + "_default")} '
+            f'WHERE used_at >= %s AND used_at < %s RETURNING *'
+            f') INSERT INTO {quote(name)} SELECT * FROM moved',
+            [start, end]
+        )
+        cursor.execute(
+            f'ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} '
+            f'FOR VALUES FROM (%s) TO (%s)',
+            [start, end]
+        )
+    return name
+
+
+def ensure_partitions(table=None, start=None, months_ahead=3):
+    """确保从 ``start`` 所在月份到当前月份之后 ``months_ahead`` 个月的分区都已存在。"""
+    table = table or usage_table()
+    existing = set(list_partitions(table))
+    current = month_start(start or timezone.now())
+    last = add_months(month_start(timezone.now()), months_ahead)
+
+    created = []
+    while current <= last:
+        if partition_name(table, current) not in existing:
+            created.append(create_partition(table, current))
+        current = add_months(current, 1)
+    return created
+
+
+def detach_partitions(before, table=None, drop=False):
+    """分离（可选删除）结束时间不晚于 ``before`` 所在月份月初的月分区。"""
+    table = table or usage_table()
+    cutoff = month_start(before)
+    quote = connection.ops.quote_name
+
+    detached = []
+    for name in list_partitions(table):
+        match = PARTITION_NAME_RE.search(name)
+        if not match:
+            continue
+        start = timezone.make_aware(
+            datetime(int(match.group(1)), int(match.group(2)), 1), cutoff.tzinfo
+        )
+        if add_months(start, 1) > cutoff:
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {quote(table)} DETACH PARTITION {quote(name)}')
+            if drop:
+                cursor.execute(f'DROP TABLE {quote(name)}')
+        detached.append(name)
+    return detached
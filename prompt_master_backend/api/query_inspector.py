@@ -0,0 +1,177 @@
+"""开发与测试环境使用的查询检查：按请求对 SQL 归一化取指纹，发现重复形状的语句（N+1），
+记录超过阈值的慢查询及其 EXPLAIN 计划，并检查每个视图的查询数预算。
+
+中间件由 QUERY_INSPECTOR['ENABLED'] 控制，默认只在 DEBUG 下启用；RAISE 为 True 时发现
+N+1 或超出 QUERY_BUDGETS 会抛出 QueryBudgetExceeded，测试客户端会把它作为测试失败抛出。
+测试中也可以直接使用 ``with query_budget(5): ...`` 限定一段代码的查询数。
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+
+from .instrumentation import QueryCollector, unobserved
+from .metrics import route_label
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': None,  # None 表示跟随 DEBUG
+    'N_PLUS_ONE_THRESHOLD': 5,  # 同一指纹在一个请求内出现的次数达到该值即视为 N+1
+    'SLOW_QUERY_MS': 100,
+    'EXPLAIN': True,  # 为慢查询附带 EXPLAIN 计划（只对 SELECT 执行）
+    'RAISE': False,
+}
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST_RE = re.compile(r'\(\s*(?:\?\s*,\s*)*\?\s*\)')
+ROW_LIST_RE = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'QUERY_INSPECTOR', {}))
+    if config['ENABLED'] is None:
+        config['ENABLED'] = settings.DEBUG
+    return config
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    """把 SQL 中的字面量与参数占位符统一替换为 ?，``IN (?, ?, ...)`` 与多行 VALUES 折叠为 ``(...)``。"""
+    sql = sql.replace('%s', '?')
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDER_LIST_RE.sub('(...)', sql)
+    sql = ROW_LIST_RE.sub('(...)', sql)
+    return WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class QueryInspector(QueryCollector):
+    def fingerprints(self):
+        return Counter(fingerprint(query['sql']) for query in self.queries)
+
+    def repeated(self, threshold):
+        # 只检查 SELECT：分批写入产生的重复 INSERT / UPDATE 是预期行为
+        return [
+            (shape, count) for shape, count in self.fingerprints().most_common()
+            if count >= threshold and shape.upper().startswith('SELECT')
+        ]
+
+    def slow(self, threshold_ms):
+        return [query for query in self.queries if query['duration'] * 1000 >= threshold_ms]
+
+    def describe(self):
+        return '\n'.join(
+            f'{count}x {shape}' for shape, count in self.fingerprints().most_common()
+        )
+
+
+def explain(query):
+    if query['many'] or not query['sql'].lstrip().upper().startswith('SELECT'):
+        return None
+    try:
+        # 外层的收集器（例如 benchmark_api 的计数）不应看到 EXPLAIN，否则查询数取决于是否出现慢查询
+        with unobserved(), connections[query['alias']].cursor() as cursor:
+            cursor.execute('EXPLAIN ' + query['sql'], query['params'])
+            return '\n'.join(row[0] for row in cursor.fetchall())
+    except DatabaseError:
+        logger.debug('EXPLAIN failed for %s', query['sql'], exc_info=True)
+        return None
+
+
+def get_budget(method, route):
+    # 键为 URL 名称时只约束 GET / HEAD，写操作可以用 "PATCH prompttemplate-detail" 形式单独设置
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    if f'{method} {route}' in budgets:
+        return budgets[f'{method} {route}']
+    if method in ('GET', 'HEAD'):
+        return budgets.get(route)
+    return None
+
+
+def inspect(inspector, method, route, config):
+    """记录 N+1 与慢查询，返回发现的问题描述列表。"""
+    problems = []
+    for shape, count in inspector.repeated(config['N_PLUS_ONE_THRESHOLD']):
+        logger.warning('Possible N+1 in %s: %d queries shaped like %s', route, count, shape)
+        problems.append(f'{count} queries shaped like {shape}')
+
+    for query in inspector.slow(config['SLOW_QUERY_MS']):
+        plan = explain(query) if config['EXPLAIN'] else None
+        logger.warning(
+            'Slow query in %s (%.1fms): %s%s', route, query['duration'] * 1000, query['sql'],
+            f'\n{plan}' if plan else ''
+        )
+
+    budget = get_budget(method, route)
+    if budget is not None and inspector.count > budget:
+        logger.warning('%s executed %d queries, budget is %d', route, inspector.count, budget)
+        problems.append(f'{inspector.count} queries, budget is {budget}')
+    return problems
+
+
+@contextmanager
+def query_budget(max_queries, n_plus_one_threshold=None):
+    """代码块内的查询数超过 ``max_queries`` 或出现重复形状的语句时抛出 QueryBudgetExceeded。"""
+    threshold = n_plus_one_threshold or get_config()['N_PLUS_ONE_THRESHOLD']
+    with QueryInspector() as inspector:
+        yield inspector
+    if inspector.count > max_queries:
+        raise QueryBudgetExceeded(
+            f'{inspector.count} queries executed, budget is {max_queries}:\n{inspector.describe()}'
+        )
+    repeated = inspector.repeated(threshold)
+    if repeated:
+        raise QueryBudgetExceeded('Possible N+1:\n' + '\n'.join(
+            f'{count}x {shape}' for shape, count in repeated
+        ))
+
+
+class QueryInspectorMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        with QueryInspector() as inspector:
+            response = self.get_response(request)
+        problems = inspect(inspector, request.method, route_label(request), get_config())
+        self.check(request, inspector, problems)
+        return response
+
+    async def __acall__(self, request):
+        with QueryInspector() as inspector:
+            response = await self.get_response(request)
+        # EXPLAIN 需要访问数据库，放到线程中执行
+        problems = await sync_to_async(inspect)(
+            inspector, request.method, route_label(request), get_config()
+        )
+        self.check(request, inspector, problems)
+        return response
+
+    def check(self, request, inspector, problems):
+        if problems and get_config()['RAISE']:
+            raise QueryBudgetExceeded(
+                f'{request.method} {request.path}: ' + '; '.join(problems)
+                + f'\n{inspector.describe()}'
+            )
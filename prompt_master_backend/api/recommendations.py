@@ -0,0 +1,230 @@
+"""模板共现推荐模型的离线构建。
+
+共现矩阵 C = XᵀX 由用户 × 模板的 0/1 使用矩阵 X 计算，相似度取余弦
+C[i, j] / sqrt(C[i, i] · C[j, j])。C、X、已处理的 TemplateUsage 主键水位线与上次扫描时间
+保存在数据库（TemplateCousageState）中，各主机上的构建共用同一份状态，并通过咨询锁串行执行。
+
+增量构建重新读取两类用户的使用记录：主键在水位线之后的，以及上次扫描前
+RECOMMENDATION_RESCAN_WINDOW 秒内有使用记录的。后者覆盖事务晚于更大主键提交的记录，
+例如异步写入管道与 bulk_create 的批次。旧的使用情况取自保存的 X，而不是按主键从数据库推断，
+因此重复扫描同一用户只会得到零增量。模板的使用人数 C[i, i] 变化时，与它共现的所有模板的
+相似度都随之变化，这些模板的邻居同样重新计算。
+"""
+import io
+from datetime import timedelta
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import Template, TemplateCousageState, TemplateNeighbor, TemplateUsage
+
+DEFAULT_TOP_K = 20
+CHUNK_SIZE = 100000
+STATE_ID = 1
+
+
+def get_rescan_window():
+    return timedelta(seconds=getattr(settings, 'RECOMMENDATION_RESCAN_WINDOW', 3600))
+
+
+def load_matrix(state, prefix):
+    return sparse.csr_matrix(
+        (state[f'{prefix}data'], state[f'{prefix}indices'], state[f'{prefix}indptr']),
+        shape=tuple(state[f'{prefix}shape'])
+    )
+
+
+def lock_state():
+    # 读取状态、计算增量、写入邻居与状态在同一事务中完成，并发的构建依次执行
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))', ['template-cousage'])
+
+
+def load_state():
+    """返回 (C, X, 主键水位线, 扫描时间)；尚未构建过时返回 None。"""
+    state = TemplateCousageState.objects.filter(pk=STATE_ID).first()
+    if state is None:
+        return None
+    with np.load(io.BytesIO(state.data)) as arrays:
+        return load_matrix(arrays, ''), load_matrix(arrays, 'usage_'), state.watermark, state.scanned_at
+
+
+def save_state(counts, usage, watermark, scanned_at):
+    counts = counts.tocsr()
+    usage = usage.tocsr()
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        data=counts.data, indices=counts.indices, indptr=counts.indptr,
+        shape=np.array(counts.shape),
+        usage_data=usage.data, usage_indices=usage.indices, usage_indptr=usage.indptr,
+        usage_shape=np.array(usage.shape),
+    )
+    TemplateCousageState.objects.update_or_create(
+        pk=STATE_ID,
+        defaults={'data': buffer.getvalue(), 'watermark': watermark, 'scanned_at': scanned_at},
+    )
+
+
+def fetch_pairs(queryset, chunk_size=CHUNK_SIZE):
+    """以 int64 数组 (n, 2) 的形式读取 (user_id, template_id) 对。"""
+    chunks = []
+    buffer = []
+    for row in queryset.values_list('user_id', 'template_id').iterator(chunk_size=chunk_size):
+        buffer.append(row)
+        if len(buffer) >= chunk_size:
+            chunks.append(np.array(buffer, dtype=np.int64))
+            buffer = []
+    if buffer:
+        chunks.append(np.array(buffer, dtype=np.int64))
+    if not chunks:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.concatenate(chunks)
+
+
+def usage_matrix(pairs, shape):
+    """由 (user_id, template_id) 对构造 0/1 使用矩阵 X，行号即用户 id。"""
+    usage = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int64), (pairs[:, 0], pairs[:, 1])),
+        shape=shape
+    )
+    # 同一用户多次使用同一模板只计一次
+    usage.sum_duplicates()
+    usage.data[:] = 1
+    return usage
+
+
+def cousage_counts(usage):
+    return (usage.T @ usage).tocsr()
+
+
+def resize(matrix, shape):
+    if matrix.shape[0] >= shape[0] and matrix.shape[1] >= shape[1]:
+        return matrix
+    matrix = matrix.tocsr()
+    matrix.resize((max(matrix.shape[0], shape[0]), max(matrix.shape[1], shape[1])))
+    return matrix
+
+
+def top_neighbors(counts, rows, top_k):
+    """计算 ``rows`` 中每个模板的余弦相似度并返回 [(template_id, neighbor_id, score)]。"""
+    users_per_template = counts.diagonal().astype(np.float64)
+    with np.errstate(divide='ignore'):
+        inv_norm = np.where(users_per_template > 0, 1 / np.sqrt(users_per_template), 0)
+
+    subset = counts[rows].astype(np.float64)
+    similarity = sparse.diags(inv_norm[rows]) @ subset @ sparse.diags(inv_norm)
+    similarity = similarity.tocsr()
+
+    result = []
+    for offset, template_id in enumerate(rows):
+        start, end = similarity.indptr[offset], similarity.indptr[offset + 1]
+        neighbor_ids = similarity.indices[start:end]
+        scores = similarity.data[start:end]
+        keep = (neighbor_ids != template_id) & (scores > 0)
+        neighbor_ids, scores = neighbor_ids[keep], scores[keep]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            neighbor_ids, scores = neighbor_ids[best], scores[best]
+        result.extend(
+            (int(template_id), int(neighbor_id), float(score))
+            for neighbor_id, score in zip(neighbor_ids, scores)
+        )
+    return result
+
+
+def write_neighbors(rows, neighbors):
+    existing = set(Template.objects.values_list('pk', flat=True))
+    objs = [
+        TemplateNeighbor(template_id=template_id, neighbor_id=neighbor_id, score=score)
+        for template_id, neighbor_id, score in neighbors
+        if template_id in existing and neighbor_id in existing
+    ]
+    with transaction.atomic():
+        TemplateNeighbor.objects.filter(template_id__in=[int(row) for row in rows]).delete()
+        TemplateNeighbor.objects.bulk_create(objs, batch_size=5000)
+    return len(objs)
+
+
+def affected_rows(counts, delta):
+    """增量 ``delta`` 之后需要重新计算邻居的模板。
+
+    除共现次数发生变化的模板外，使用人数 C[j, j] 变化的模板 j 会改变所有与它共现的模板的
+    相似度归一化因子，这些模板即 C 中第 j 行的非零列。
+    """
+    changed = np.flatnonzero(delta.diagonal())
+    return np.union1d(
+        np.union1d(np.unique(delta.nonzero()[0]), changed),
+        np.unique(counts[changed].nonzero()[1]),
+    )
+
+
+def build_full(top_k=DEFAULT_TOP_K):
+    with transaction.atomic():
+        lock_state()
+        scanned_at = timezone.now()
+        usages = TemplateUsage.objects.order_by()
+        watermark = usages.aggregate(max_id=Max('id'))['max_id'] or 0
+        pairs = fetch_pairs(usages.filter(id__lte=watermark).values('user_id', 'template_id').distinct())
+        shape = (
+            int(pairs[:, 0].max()) + 1 if len(pairs) else 1,
+            int(pairs[:, 1].max()) + 1 if len(pairs) else 1,
+        )
+
+        usage = usage_matrix(pairs, shape)
+        counts = cousage_counts(usage)
+        rows = np.unique(pairs[:, 1])
+        neighbors = top_neighbors(counts, rows, top_k) if len(rows) else []
+
+        TemplateNeighbor.objects.all().delete()
+        written = write_neighbors(rows, neighbors)
+        save_state(counts, usage, watermark, scanned_at)
+    return len(rows), written
+
+
+def build_incremental(top_k=DEFAULT_TOP_K):
+    with transaction.atomic():
+        lock_state()
+        state = load_state()
+        if state is None:
+            return build_full(top_k)
+        counts, usage, watermark, last_scanned_at = state
+
+        scanned_at = timezone.now()
+        usages = TemplateUsage.objects.order_by()
+        new_watermark = usages.aggregate(max_id=Max('id'))['max_id'] or 0
+
+        # 使用记录按 used_at 分区，时间窗口条件只扫描最近的分区
+        recent = Q(id__gt=watermark) | Q(used_at__gte=last_scanned_at - get_rescan_window())
+        user_ids = list(usages.filter(recent, id__lte=new_watermark).values_list('user_id', flat=True).distinct())
+        if not user_ids:
+            save_state(counts, usage, new_watermark, scanned_at)
+            return 0, 0
+
+        after = fetch_pairs(
+            usages.filter(user_id__in=user_ids, id__lte=new_watermark).values('user_id', 'template_id').distinct()
+        )
+        size = max(counts.shape[0], int(after[:, 1].max()) + 1 if len(after) else 0)
+        shape = (max(usage.shape[0], max(user_ids) + 1), size)
+        usage = resize(usage, shape)
+        counts = resize(counts, (size, size))
+
+        # 受影响用户在 X 中的旧行替换为数据库中的新行，新旧共现之差即为本次增量
+        selected = np.zeros(shape[0], dtype=np.int64)
+        selected[user_ids] = 1
+        before = (sparse.diags(selected) @ usage).tocsr()
+        after = usage_matrix(after, shape)
+        delta = cousage_counts(after) - cousage_counts(before)
+        delta.eliminate_zeros()
+        counts = (counts + delta).tocsr()
+        usage = (usage - before + after).tocsr()
+        usage.eliminate_zeros()
+
+        rows = affected_rows(counts, delta)
+        written = write_neighbors(rows, top_neighbors(counts, rows, top_k)) if len(rows) else 0
+        save_state(counts, usage, new_watermark, scanned_at)
+    return len(rows), written
@@ -0,0 +1,163 @@
+"""提示词模板的版本历史。
+
+每次修改保存为相对上一版本的差异：文本字段按行比较，只记录复制的行号区间与新增的文本，
+其余字段记录新值；第 1 版、距上一个快照已有 SNAPSHOT_INTERVAL 个版本，或差异不比完整内容
+更小时保存快照。因此每次修改占用的空间与改动量成正比，还原任意版本最多读取并应用
+SNAPSHOT_INTERVAL 条记录（一次查询）。
+
+差异总是基于由历史记录还原出的上一版本计算，即使模板曾被绕过本模块修改，历史也不会损坏。
+"""
+import difflib
+import json
+import zlib
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+
+from .models import PromptTemplateRevision
+
+TRACKED_FIELDS = ('name', 'description', 'content', 'tags', 'is_public')
+TEXT_FIELDS = ('name', 'description', 'content')
+
+
+def get_snapshot_interval():
+    return getattr(settings, 'PROMPT_TEMPLATE_SNAPSHOT_INTERVAL', 20)
+
+
+def state_of(obj):
+    return {field: getattr(obj, field) for field in TRACKED_FIELDS}
+
+
+def encode(payload):
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode())
+
+
+def decode(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def diff_text(old, new):
+    """返回把 ``old`` 变为 ``new`` 的操作列表：[start, end] 表示复制旧文本的第 start 到 end 行，字符串表示新增文本。"""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif tag in ('replace', 'insert'):
+            ops.append(''.join(new_lines[j1:j2]))
+    return ops
+
+
+def patch_text(old, ops):
+    old_lines = old.splitlines(keepends=True)
+    return ''.join(
+        op if isinstance(op, str) else ''.join(old_lines[op[0]:op[1]])
+        for op in ops
+    )
+
+
+def make_delta(old_state, new_state):
+    delta = {}
+    for field in TRACKED_FIELDS:
+        if old_state[field] == new_state[field]:
+            continue
+        if field in TEXT_FIELDS:
+            delta[field] = {'ops': diff_text(old_state[field], new_state[field])}
+        else:
+            delta[field] = {'value': new_state[field]}
+    return delta
+
+
+def apply_delta(state, delta):
+    state = dict(state)
+    for field, change in delta.items():
+        if 'ops' in change:
+            state[field] = patch_text(state[field], change['ops'])
+        else:
+            state[field] = change['value']
+    return state
+
+
+def replay(chain):
+    """依次应用一条以快照开头、按版本升序排列的记录链，返回最后一个版本的字段。"""
+    state = None
+    for revision in chain:
+        payload = decode(revision.data)
+        state = payload if revision.is_snapshot else apply_delta(state, payload)
+    return state
+
+
+def chains_for(template_ids, version=None):
+    """一次查询读取每个模板从最近一个快照到 ``version``（默认最新版本）的记录链。"""
+    snapshots = PromptTemplateRevision.objects.filter(
+        prompt_template=OuterRef('prompt_template'), is_snapshot=True
+    )
+    revisions = PromptTemplateRevision.objects.filter(prompt_template__in=template_ids)
+    if version is not None:
+        snapshots = snapshots.filter(version__lte=version)
+        revisions = revisions.filter(version__lte=version)
+    latest_snapshot = snapshots.order_by('-version').values('version')[:1]
+
+    chains = {}
+    for revision in revisions.filter(version__gte=Subquery(latest_snapshot)) \
+            .order_by('prompt_template', 'version'):
+        chains.setdefault(revision.prompt_template_id, []).append(revision)
+    return chains
+
+
+def build_revision(obj, chain, author=None):
+    new_state = state_of(obj)
+    snapshot = encode(new_state)
+    revision = PromptTemplateRevision(
+        prompt_template=obj, version=obj.version, is_snapshot=True, data=snapshot, author=author
+    )
+    if chain and len(chain) < get_snapshot_interval():
+        delta = encode(make_delta(replay(chain), new_state))
+        if len(delta) < len(snapshot):
+            revision.is_snapshot = False
+            revision.data = delta
+    return revision
+
+
+def record(obj, author=None, created=False):
+    """为 ``obj`` 的当前版本写入一条历史记录，应在修改模板的同一事务内调用。"""
+    return record_many([obj], author, created)[0]
+
+
+def record_many(objs, author=None, created=False):
+    # 新建的模板没有历史记录，直接保存快照
+    chains = {} if created else chains_for([obj.pk for obj in objs])
+    revisions = [build_revision(obj, chains.get(obj.pk), author) for obj in objs]
+    PromptTemplateRevision.objects.bulk_create(revisions, batch_size=1000)
+    return revisions
+
+
+def get_version(prompt_template, version):
+    chain = chains_for([prompt_template.pk], version).get(prompt_template.pk)
+    if not chain or chain[-1].version != version:
+        raise PromptTemplateRevision.DoesNotExist
+    return replay(chain), chain[-1]
+
+
+def diff_versions(prompt_template, from_version, to_version):
+    """按字段比较两个版本：文本字段返回 unified diff，其余字段返回前后的值。"""
+    old, _ = get_version(prompt_template, from_version)
+    new, _ = get_version(prompt_template, to_version)
+    changes = {}
+    for field in TRACKED_FIELDS:
+        if old[field] == new[field]:
+            continue
+        if field in TEXT_FIELDS:
+            changes[field] = ''.join(difflib.unified_diff(
+                old[field].splitlines(keepends=True), new[field].splitlines(keepends=True),
+                fromfile=f'v{from_version}', tofile=f'v{to_version}'
+            ))
+        else:
+            changes[field] = {'from': old[field], 'to': new[field]}
+    return changes
+
+
+def has_changes(obj, data):
+    return any(field in data and data[field] != getattr(obj, field) for field in TRACKED_FIELDS)
@@ -0,0 +1,136 @@
+import threading
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import (
+    Template, TemplateUsage, TemplateDailyUsage, CategoryDailyUsage, TagDailyUsage,
+    TagUsageStats
+)
+
+TAG_MAX_LENGTH = TagDailyUsage._meta.get_field('tag').max_length
+
+# 最近一次刷新标签窗口统计的日期；窗口按自然日滚动，不是当天刷新的统计窗口起点已经过期
+TAG_STATS_DATE_KEY = 'rollups:tag-stats:date'
+
+
+def rollup_targets():
+    # (日汇总表, 维度列, 维度取值的 SQL 表达式, 额外的 FROM 子句)
+    return [
+        (TemplateDailyUsage._meta.db_table, 'template_id', 't.id', ''),
+        (CategoryDailyUsage._meta.db_table, 'category', 't.category', ''),
+        (
+            TagDailyUsage._meta.db_table, 'tag', f'left(tag.name, {TAG_MAX_LENGTH})',
+            'CROSS JOIN LATERAL jsonb_array_elements_text(t.tags) AS tag(name)'
+        ),
+    ]
+
+
+def apply_usage_deltas(deltas):
+    """把 {(template_id, date): 次数} 形式的增量累加到各日汇总表。
+
+    增量按模板关联出分类与标签后，每张表只执行一条 ``INSERT ... ON CONFLICT DO UPDATE``；
+    已删除模板的增量会在关联时被丢弃。
+    """
+    if not deltas:
+        return
+    rows = sorted((template_id, date, count) for (template_id, date), count in deltas.items())
+    values = ', '.join(['(%s::bigint, %s::date, %s::integer)'] * len(rows))
+    params = [value for row in rows for value in row]
+    template_table = Template._meta.db_table
+
+    with connection.cursor() as cursor:
+        for table, column, expression, joins in rollup_targets():
+            cursor.execute(
+                f'INSERT INTO {table} ({column}, date, count) '
+                f'SELECT {expression}, d.date, SUM(d.count) '
+                f'FROM (VALUES {values}) AS d(template_id, date, count) '
+                f'JOIN {template_table} t ON t.id = d.template_id {joins} '
+                f'GROUP BY 1, 2 ORDER BY 1, 2 '
+                f'ON CONFLICT ({column}, date) DO UPDATE SET count = {table}.count + EXCLUDED.count',
+                params
+            )
+
+
+def day_bounds(start_date, end_date):
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(start_date, time.min), tz)
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def rebuild_rollups(start_date, end_date):
+    """根据 TemplateUsage 明细重建 [start_date, end_date] 范围内的日汇总数据。
+
+    应通过 ``usage_counter.rebuild_rollups`` 调用：先写回使用次数缓冲区，避免其中已计入明细的增量
+    在重建后被再次累加。
+    """
+    start, end = day_bounds(start_date, end_date)
+    usage_table = TemplateUsage._meta.db_table
+    template_table = Template._meta.db_table
+    tz_name = timezone.get_current_timezone_name()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table, column, expression, joins in rollup_targets():
+            cursor.execute(
+                f'DELETE FROM {table} WHERE date >= %s AND date <= %s',
+                [start_date, end_date]
+            )
+            cursor.execute(
+                f'INSERT INTO {table} ({column}, date, count) '
+                f'SELECT {expression}, (u.used_at AT TIME ZONE %s)::date, COUNT(*) '
+                f'FROM {usage_table} u '
+                f'JOIN {template_table} t ON t.id = u.template_id {joins} '
+                f'WHERE u.used_at >= %s AND u.used_at < %s '
+                f'GROUP BY 1, 2',
+                [tz_name, start, end]
+            )
+
+
+def tag_stats_are_current():
+    return cache.get(TAG_STATS_DATE_KEY) == timezone.localdate().isoformat()
+
+
+def refresh_tag_stats():
+    """根据标签日汇总重算每个滚动窗口的标签使用次数。
+
+    使用次数写回时会顺带刷新（refresh_tag_stats_if_stale），没有使用记录的实例需要定时执行
+    refresh_tag_stats 命令；当天尚未刷新时 api.analytics 直接汇总标签日汇总表。
+    """
+    today = timezone.localdate()
+    now = timezone.now()
+    stats_table = TagUsageStats._meta.db_table
+    daily_table = TagDailyUsage._meta.db_table
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # 多个进程同时刷新时串行执行，避免插入时的唯一约束冲突
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [stats_table])
+        for window, days in TagUsageStats.WINDOW_DAYS.items():
+            # 在同一事务内替换，读者在提交前始终看到旧的完整结果
+            cursor.execute(f'DELETE FROM {stats_table} WHERE "window" = %s', [window])
+            cursor.execute(
+                f'INSERT INTO {stats_table} (tag, "window", count, refreshed_at) '
+                f'SELECT tag, %s, SUM(count), %s FROM {daily_table} '
+                f'WHERE date >= %s GROUP BY tag',
+                [window, now, today - timedelta(days=days)]
+            )
+        transaction.on_commit(lambda: cache.set(TAG_STATS_DATE_KEY, today.isoformat(), None))
+
+
+_tag_stats_lock = threading.Lock()
+_tag_stats_refreshed = None
+
+
+def refresh_tag_stats_if_stale():
+    global _tag_stats_refreshed
+    interval = getattr(settings, 'TAG_STATS_REFRESH_INTERVAL', 60)
+    with _tag_stats_lock:
+        now = timezone.now()
+        if _tag_stats_refreshed is not None and (now - _tag_stats_refreshed).total_seconds() < interval:
+            return False
+        refresh_tag_stats()
+        _tag_stats_refreshed = now
+        return True
@@ -0,0 +1,141 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.search import SearchQuery, SearchVectorField
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Func, TextField, Value
+from django.utils.module_loading import import_string
+
+CJK_RUN = r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+'
+TOKEN_RE = re.compile(rf'{CJK_RUN}|[0-9a-z]+')
+CJK_RE = re.compile(CJK_RUN)
+
+
+class NgramTokenizer:
+    """离线可用的默认分词器。
+
+    中文按字切出单字和相邻双字，其余文本按字母数字切词并转为小写。查询时中文只取
+    双字（单字查询除外），从而要求命中文档包含查询中的每一对相邻汉字。
+    """
+
+    def tokenize(self, text):
+        tokens = []
+        for word in TOKEN_RE.findall(text.lower()):
+            if CJK_RE.fullmatch(word):
+                tokens.extend(word)
+                tokens.extend(self._bigrams(word))
+            else:
+                tokens.append(word)
+        return tokens
+
+    def tokenize_query(self, text):
+        tokens = []
+        for word in TOKEN_RE.findall(text.lower()):
+            if CJK_RE.fullmatch(word) and len(word) > 1:
+                tokens.extend(self._bigrams(word))
+            else:
+                tokens.append(word)
+        return tokens
+
+    def _bigrams(self, word):
+        return [word[i:i + 2] for i in range(len(word) - 1)]
+
+
+class JiebaTokenizer:
+    """基于 jieba 词典的分词器，需要额外安装 jieba。"""
+
+    def __init__(self):
+        try:
+            import jieba
+        except ImportError as exc:
+            raise ImproperlyConfigured('JiebaTokenizer requires the jieba package') from exc
+        self._jieba = jieba
+
+    def tokenize(self, text):
+        return self._filter(self._jieba.cut_for_search(text.lower()))
+
+    def tokenize_query(self, text):
+        return self._filter(self._jieba.cut(text.lower()))
+
+    def _filter(self, words):
+        return [word for word in words if TOKEN_RE.fullmatch(word)]
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(path=None):
+    path = path or getattr(settings, 'SEARCH_TOKENIZER', 'api.search.NgramTokenizer')
+    return import_string(path)()
+
+
+class LexemeVector(Func):
+    # 词元由 Python 端分词得到，用 array_to_tsvector 直接入库，不再经过数据库的分词器
+    template = "setweight(array_to_tsvector(%(expressions)s::text[]), '%(weight)s')"
+    output_field = SearchVectorField()
+
+    def __init__(self, lexemes, weight):
+        super().__init__(
+            Value(sorted(set(lexemes)), output_field=ArrayField(TextField())),
+            weight=weight,
+        )
+
+
+class ConcatVectors(Func):
+    arg_joiner = ' || '
+    template = '(%(expressions)s)'
+    output_field = SearchVectorField()
+
+
+class LexemeQuery(SearchQuery):
+    """由词元直接构造的 tsquery，各词元之间为 AND 关系。"""
+
+    def __init__(self, lexemes):
+        super().__init__(' & '.join(f"'{lexeme}'" for lexeme in lexemes))
+
+    def as_sql(self, compiler, connection, function=None, template=None):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return f'{sql}::tsquery', params
+
+
+def field_text(value):
+    if isinstance(value, (list, tuple)):
+        return ' '.join(str(item) for item in value)
+    return value or ''
+
+
+def build_search_vector(instance, fields, tokenizer=None):
+    """根据 ``fields``（字段名与权重的序列）为模型实例构造搜索向量表达式。"""
+    tokenizer = tokenizer or get_tokenizer()
+    vectors = [
+        LexemeVector(tokenizer.tokenize(field_text(getattr(instance, name))), weight)
+        for name, weight in fields
+    ]
+    return ConcatVectors(*vectors)
+
+
+def build_search_query(text, tokenizer=None):
+    tokenizer = tokenizer or get_tokenizer()
+    lexemes = sorted(set(tokenizer.tokenize_query(text or '')))
+    if not lexemes:
+        return None
+    return LexemeQuery(lexemes)
+
+
+def rebuild_search_vectors(model, fields, batch_size=1000):
+    """分批重建 ``model`` 全部行的搜索向量，返回处理的行数。"""
+    tokenizer = get_tokenizer()
+    names = [name for name, _ in fields]
+    queryset = model.objects.order_by('pk').only('pk', *names)
+
+    total = 0
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return total
+        for instance in batch:
+            instance.search_vector = build_search_vector(instance, fields, tokenizer)
+        model.objects.bulk_update(batch, ['search_vector'])
+        total += len(batch)
+        last_pk = batch[-1].pk
@@ -1,8 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from .fieldsets import SparseFieldsMixin
 from .models import (
     User, Scene, Template, TemplateComment, 
-    TemplateUsage, PromptTemplate
+    TemplateUsage, PromptTemplate, PromptTemplateRevision
 )
 
 User = get_user_model()
@@ -23,14 +24,17 @@ class UserProfileSerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'email', 'first_name', 'last_name')
         read_only_fields = ('id', 'username', 'email')
 
-class SceneSerializer(serializers.ModelSerializer):
+class SceneSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Scene
         fields = ('id', 'name', 'description', 'created_at', 'updated_at', 'creator', 'tags')
         read_only_fields = ('id', 'created_at', 'updated_at', 'creator')
+        expandable_fields = {'creator': UserSerializer}
 
-class PromptTemplateSerializer(serializers.ModelSerializer):
+class PromptTemplateSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     creator = UserSerializer(read_only=True)
+    # 正文保存在 TextBlob 中（PromptTemplate.content 为属性），需要显式声明
+    content = serializers.CharField()
 
     class Meta:
         model = PromptTemplate
@@ -38,12 +42,34 @@ class PromptTemplateSerializer(serializers.ModelSerializer):
             'id', 'name', 'description', 'content', 'creator',
             'created_at', 'updated_at', 'is_public', 'tags', 'version'
         )
-        read_only_fields = ('creator', 'created_at', 'updated_at')
+        # version 由服务端在内容变化时递增，见 api.revisions
+        read_only_fields = ('creator', 'created_at', 'updated_at', 'version')
+        expandable_fields = {'creator': UserSerializer}
 
     def create(self, validated_data):
         validated_data['creator'] = self.context['request'].user
         return super().create(validated_data)
 
+class PromptTemplateListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """列表场景使用的精简表示，不包含正文，列表查询因此不读取 TextBlob。"""
+    creator = UserSerializer(read_only=True)
+
+    class Meta:
+        model = PromptTemplate
+        fields = (
+            'id', 'name', 'description', 'creator',
+            'created_at', 'updated_at', 'is_public', 'tags', 'version'
+        )
+        read_only_fields = fields
+        expandable_fields = {'creator': UserSerializer}
+
+class PromptTemplateRevisionSerializer(serializers.ModelSerializer):
+    author = UserSerializer(read_only=True)
+
+    class Meta:
+        model = PromptTemplateRevision
+        fields = ('version', 'is_snapshot', 'author', 'created_at')
+
 class TemplateCommentSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
@@ -52,8 +78,12 @@ class TemplateCommentSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'content', 'rating', 'created_at')
         read_only_fields = ('id', 'created_at')
 
-class TemplateSerializer(serializers.ModelSerializer):
+class TemplateSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     creator = UserSerializer(read_only=True)
+    # 以下文本保存在 TextBlob 中，查询时需要 select_related 对应的 *_blob 外键
+    content = serializers.CharField()
+    usage = serializers.CharField()
+    example = serializers.CharField()
     comments = TemplateCommentSerializer(many=True, read_only=True)
     comment_count = serializers.SerializerMethodField()
 
@@ -65,6 +95,35 @@ class TemplateSerializer(serializers.ModelSerializer):
             'rating', 'usage_count', 'comments', 'comment_count'
         )
         read_only_fields = ('id', 'created_at', 'updated_at', 'creator', 'rating', 'usage_count')
+        expandable_fields = {'creator': UserSerializer, 'comments': TemplateCommentSerializer}
 
     def get_comment_count(self, obj):
-        return obj.comments.count()
\ No newline at end of file
+        if hasattr(obj, 'comment_count'):
+            return obj.comment_count
+        return obj.comments.count()
+
+class TemplateListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """列表场景使用的精简表示，不包含正文与评论详情。
+
+    需要配合 ``Template.objects.for_list()`` 使用，以便创建者与评论数随列表一次查询加载。
+    """
+    creator = UserSerializer(read_only=True)
+    comment_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Template
+        fields = (
+            'id', 'name', 'description', 'category', 'creator',
+            'created_at', 'updated_at', 'tags', 'rating', 'usage_count',
+            'comment_count'
+        )
+        read_only_fields = fields
+        expandable_fields = {'creator': UserSerializer}
+
+class UsageEventSerializer(serializers.Serializer):
+    """批量上报的单条模板使用事件，模板是否存在由调用方一次性校验。"""
+    event_id = serializers.CharField(max_length=64, required=False, allow_null=True, allow_blank=False)
+    template_id = serializers.IntegerField(min_value=1)
+    used_at = serializers.DateTimeField(required=False)
+    context = serializers.JSONField(required=False, default=dict)
+
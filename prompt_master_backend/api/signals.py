@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import invalidate_user
+from .cache import bump
+from .models import User, Scene, Template, TemplateComment, PromptTemplate
+
+
+def bump_on_commit(*namespaces):
+    # 事务提交后再失效，避免提交前的并发请求把旧数据重新写入缓存
+    transaction.on_commit(lambda: bump(*namespaces))
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    # 立即清除一次，提交后再清除一次，避免提交前的并发请求把旧数据重新写入缓存
+    invalidate_user(instance)
+    transaction.on_commit(lambda: invalidate_user(instance))
+
+
+@receiver([post_save, post_delete], sender=Template)
+def invalidate_template(sender, instance, **kwargs):
+    bump_on_commit('templates', f'template:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=TemplateComment)
+def invalidate_template_comment(sender, instance, **kwargs):
+    # 评论会改变模板的评分与评论数
+    bump_on_commit('templates', f'template:{instance.template_id}')
+
+
+@receiver([post_save, post_delete], sender=PromptTemplate)
+def invalidate_prompt_template(sender, instance, **kwargs):
+    bump_on_commit('prompt-templates', f'prompt-template:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=Scene)
+def invalidate_scene(sender, instance, **kwargs):
+    bump_on_commit('scenes')
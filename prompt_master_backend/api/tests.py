@@ -1,3 +1,1011 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import analytics, recommendations, revisions
+from .authentication import VersionedRefreshToken, invalidate_user, local_users
+from .counters import usage_counter
+from .db_router import replica_health, sticky_key
+from .events import usage_events
+from .instrumentation import QueryCollector
+from .models import (
+    CategoryDailyUsage, PromptTemplate, PromptTemplateRevision, TagDailyUsage, TagUsageStats, Template,
+    TemplateComment, TemplateCousageState, TemplateDailyUsage, TemplateNeighbor, TemplateUsage, TextBlob, User,
+    store_text_blobs,
+)
+from .partitions import (
+    add_months, detach_partitions, ensure_partitions, list_partitions, month_start, partition_name, usage_table,
+)
+from .query_inspector import QueryBudgetExceeded, explain, get_budget, query_budget
+from .rollups import TAG_STATS_DATE_KEY, refresh_tag_stats
+from .serializers import TemplateSerializer
+
+
+class QueryBudgetTests(TestCase):
+    # 条目数超过 N_PLUS_ONE_THRESHOLD，逐条查询关联对象时能被识别为 N+1
+    count = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='budget', password='pass12345')
+        other = User.objects.create_user(username='budget-other', password='pass12345')
+        cls.templates = []
+        for i in range(cls.count):
+            template = Template.objects.create(
+                name=f'模板{i}', description='描述', category='analysis', content='正文' * 50,
+                usage='用法', example='示例', creator=other, tags=['分析', f't{i}']
+            )
+            for user, rating in ((cls.user, 4), (other, 5)):
+                TemplateComment.objects.create(template=template, user=user, content='评论', rating=rating)
+            cls.templates.append(template)
+            PromptTemplate.objects.create(
+                name=f'提示词{i}', description='描述', content='正文', creator=cls.user, tags=['写作']
+            )
+        Template.objects.all().recompute_ratings()
+        TemplateUsage.objects.bulk_create(
+            TemplateUsage(template=template, user=cls.user) for template in cls.templates[:3]
+        )
+
+    def setUp(self):
+        # 响应缓存命中时不执行查询，每个用例都从冷缓存开始
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def budget(self, route):
+        # QUERY_BUDGETS 含 JWT 认证查询用户的一次，force_authenticate 不执行这次查询
+        return settings.QUERY_BUDGETS[route] - 1
+
+    def get(self, route, *args, **params):
+        with query_budget(self.budget(route)) as inspector:
+            response = self.client.get(reverse(route, args=args), params)
+        self.assertEqual(response.status_code, 200, inspector.describe())
+        return response
+
+    def test_template_list(self):
+        response = self.get('template-list')
+        self.assertEqual(response.data['count'], self.count)
+        self.get('template-list', tags='分析', sort_by='rating')
+
+    def test_template_detail(self):
+        response = self.get('template-detail', self.templates[0].pk)
+        self.assertEqual(len(response.data['comments']), 2)
+
+    def test_recommended_templates(self):
+        response = self.get('recommended-templates')
+        self.assertTrue(response.data)
+
+    def test_prompt_template_list(self):
+        response = self.get('prompttemplate-list')
+        self.assertEqual(len(response.data['results']), self.count)
+        self.get('prompttemplate-list', search='提示词')
+
+    def test_sparse_fields_within_budget(self):
+        self.get('template-list', fields='id,name,creator')
+        self.get('prompttemplate-list', fields='id,name', expand='creator')
+
+    def test_exceeding_budget_raises(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'budget is 1'):
+            with query_budget(1):
+                list(Template.objects.all())
+                list(PromptTemplate.objects.all())
+
+    def test_n_plus_one_raises(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'Possible N+1'):
+            with query_budget(100):
+                TemplateSerializer(Template.objects.all(), many=True).data
+
+    def test_get_budget(self):
+        with override_settings(QUERY_BUDGETS={'template-list': 4, 'PATCH prompttemplate-detail': 6}):
+            self.assertEqual(get_budget('GET', 'template-list'), 4)
+            self.assertEqual(get_budget('HEAD', 'template-list'), 4)
+            self.assertIsNone(get_budget('POST', 'template-list'))
+            self.assertEqual(get_budget('PATCH', 'prompttemplate-detail'), 6)
+            self.assertIsNone(get_budget('GET', 'prompttemplate-detail'))
+
+    def test_middleware_raises_over_budget(self):
+        config = {'ENABLED': True, 'RAISE': True}
+        with override_settings(QUERY_INSPECTOR=config, QUERY_BUDGETS={'template-list': 0}):
+            # 中间件在客户端第一次请求时加载，需要在修改配置后创建客户端
+            client = APIClient()
+            client.force_authenticate(self.user)
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'budget is 0'):
+                client.get(reverse('template-list'))
+
+    def test_explain_is_not_collected(self):
+        with QueryCollector() as collector:
+            list(Template.objects.all())
+        query = collector.queries[0]
+        with QueryCollector() as outer:
+            plan = explain(query)
+        self.assertTrue(plan)
+        self.assertEqual(outer.count, 0)
+        self.assertEqual(query['alias'], connection.alias)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_users.clear()
+        self.user = User.objects.create_user(username='auth', password='pass12345')
+
+    def get_profile(self, user):
+        token = VersionedRefreshToken.for_user(user).access_token
+        client = APIClient(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client, client.get(reverse('user-profile'))
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+    ])
+    def test_hash_upgrade_keeps_tokens(self):
+        User.objects.filter(pk=self.user.pk).update(password=make_password('pass12345', hasher='md5'))
+        self.user.refresh_from_db()
+        client, response = self.get_profile(self.user)
+        self.assertEqual(response.status_code, 200)
+
+        self.assertTrue(self.user.check_password('pass12345'))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(self.user.token_version, 0)
+        local_users.clear()
+        self.assertEqual(client.get(reverse('user-profile')).status_code, 200)
+
+    def test_password_change_revokes_tokens(self):
+        client, response = self.get_profile(self.user)
+        self.assertEqual(response.status_code, 200)
+        self.user.set_password('other12345')
+        self.user.save(update_fields=['password'])
+        self.assertEqual(User.objects.get(pk=self.user.pk).token_version, 1)
+        self.assertEqual(client.get(reverse('user-profile')).status_code, 401)
+        self.assertEqual(self.get_profile(self.user)[1].status_code, 200)
+
+    def test_concurrent_invalidation_is_not_cached(self):
+        get_user = JWTAuthentication.get_user
+
+        def read_then_deactivate(auth, validated_token):
+            # 请求读到用户之后、写入共享缓存之前，另一个事务停用了该用户
+            user = get_user(auth, validated_token)
+            User.objects.filter(pk=user.pk).update(is_active=False)
+            invalidate_user(user)
+            return user
+
+        with mock.patch.object(JWTAuthentication, 'get_user', read_then_deactivate):
+            client, response = self.get_profile(self.user)
+        self.assertEqual(response.status_code, 200)
+        local_users.clear()
+        self.assertEqual(client.get(reverse('user-profile')).status_code, 401)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='keyset', password='pass12345')
+        other = User.objects.create_user(username='keyset-other', password='pass12345')
+        now = timezone.now()
+        for i in range(13):
+            template = PromptTemplate.objects.create(
+                name=f'提示词{i % 3}', description='描述', content='正文', creator=cls.user if i % 2 else other,
+                is_public=bool(i % 3)
+            )
+            # 多条记录的排序键相同，只能依靠 id 区分先后
+            PromptTemplate.objects.filter(pk=template.pk).update(created_at=now - timedelta(minutes=i % 4))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, **params):
+        ids = []
+        response = self.client.get(reverse('prompttemplate-list'), {'page_size': 4, **params})
+        while True:
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertLessEqual(len(response.data['results']), 4)
+            ids += [item['id'] for item in response.data['results']]
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_pages_follow_ordering_with_ties(self):
+        for sort_by in ('created_at', 'updated_at', 'name'):
+            for sort_order, prefix in (('asc', ''), ('desc', '-')):
+                expected = list(
+                    PromptTemplate.objects.order_by(f'{prefix}{sort_by}', f'{prefix}id').values_list('pk', flat=True)
+                )
+                self.assertEqual(self.walk(sort_by=sort_by, sort_order=sort_order), expected, (sort_by, sort_order))
+
+        expected = list(
+            PromptTemplate.objects.filter(creator=self.user, is_public=True)
+            .order_by('-created_at', '-id').values_list('pk', flat=True)
+        )
+        self.assertEqual(self.walk(creator=self.user.pk, is_public='true'), expected)
+
+    def test_rows_inserted_before_the_cursor_do_not_shift_pages(self):
+        url = reverse('prompttemplate-list')
+        first = self.client.get(url, {'page_size': 4}).data
+        PromptTemplate.objects.create(name='新增', description='描述', content='正文', creator=self.user)
+        cache.clear()
+        second = self.client.get(first['next']).data
+        seen = [item['id'] for item in first['results'] + second['results']]
+        expected = PromptTemplate.objects.exclude(name='新增').order_by('-created_at', '-id')
+        self.assertEqual(seen, list(expected.values_list('pk', flat=True)[:8]))
+
+    def test_invalid_parameters(self):
+        url = reverse('prompttemplate-list')
+        self.assertEqual(self.client.get(url, {'sort_by': 'content'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'sort_order': 'sideways'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 404)
+        # 游标记录了排序字段，不能用于另一种排序
+        cursor = self.client.get(url, {'page_size': 2}).data['next'].split('cursor=')[1]
+        self.assertEqual(self.client.get(url, {'sort_by': 'name', 'cursor': cursor}).status_code, 404)
+
+
+class PromptTemplateBulkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bulk', password='pass12345')
+        cls.other = User.objects.create_user(username='bulk-other', password='pass12345')
+        cls.others_template = PromptTemplate.objects.create(
+            name='他人的模板', description='描述', content='正文', creator=cls.other
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def items(self, count):
+        return [{'name': f'批量{i}', 'description': '描述', 'content': f'正文{i}', 'tags': ['写作']} for i in range(count)]
+
+    def create(self, items):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('prompttemplate-bulk'), items, format='json')
+
+    def test_create_update_delete(self):
+        response = self.create(self.items(3))
+        self.assertEqual(response.status_code, 201, response.data)
+        ids = [item['id'] for item in response.data]
+        self.assertEqual(PromptTemplate.objects.get(pk=ids[1]).content, '正文1')
+        self.assertEqual(PromptTemplateRevision.objects.filter(prompt_template_id__in=ids).count(), 3)
+
+        response = self.client.patch(
+            reverse('prompttemplate-bulk'), [{'id': ids[0], 'content': '新正文'}, {'id': ids[1], 'name': '改名'}],
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        first = PromptTemplate.objects.get(pk=ids[0])
+        self.assertEqual((first.content, first.version), ('新正文', 2))
+        self.assertEqual(PromptTemplate.objects.get(pk=ids[1]).name, '改名')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('prompttemplate-bulk-delete'), {'ids': ids[:2]}, format='json')
+        self.assertEqual(response.data, {'deleted': 2})
+        self.assertEqual(list(PromptTemplate.objects.filter(pk__in=ids).values_list('pk', flat=True)), ids[2:])
+        # 版本历史随模板一起删除
+        self.assertFalse(PromptTemplateRevision.objects.filter(prompt_template_id__in=ids[:2]).exists())
+
+    def test_delete_invalidates_cached_detail(self):
+        pk = self.create(self.items(1)).data[0]['id']
+        url = reverse('prompttemplate-detail', args=[pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('prompttemplate-bulk-delete'), {'ids': [pk]}, format='json')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_item_errors_reject_the_whole_batch(self):
+        response = self.create(self.items(1) + [{'name': ''}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertFalse(PromptTemplate.objects.filter(creator=self.user).exists())
+
+        pk = self.create(self.items(1)).data[0]['id']
+        response = self.client.patch(reverse('prompttemplate-bulk'), [
+            {'id': pk, 'name': '改名'}, {'id': self.others_template.pk, 'name': '改名'}, {'name': '缺少 id'},
+            {'id': pk, 'name': '重复'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [2, 3])
+        response = self.client.patch(reverse('prompttemplate-bulk'), [
+            {'id': pk, 'name': '改名'}, {'id': self.others_template.pk, 'name': '改名'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'], [{'index': 1, 'errors': {'id': ['Not found.']}}])
+        self.assertEqual(PromptTemplate.objects.get(pk=pk).name, '批量0')
+
+        response = self.client.post(
+            reverse('prompttemplate-bulk-delete'), {'ids': [pk, self.others_template.pk, 'x']}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [2])
+        response = self.client.post(
+            reverse('prompttemplate-bulk-delete'), {'ids': [pk, self.others_template.pk]}, format='json'
+        )
+        self.assertEqual(response.data['errors'], [{'index': 1, 'errors': {'id': ['Not found.']}}])
+        self.assertEqual(PromptTemplate.objects.count(), 2)
+
+    @override_settings(PROMPT_TEMPLATE_BULK_LIMIT=3)
+    def test_limits(self):
+        self.assertEqual(self.create(self.items(3)).status_code, 201)
+        for method, route, body in (
+            ('post', 'prompttemplate-bulk', self.items(4)),
+            ('post', 'prompttemplate-bulk', []),
+            ('post', 'prompttemplate-bulk', {'name': '不是数组'}),
+            ('patch', 'prompttemplate-bulk', [{'id': i} for i in range(1, 5)]),
+            ('post', 'prompttemplate-bulk-delete', {'ids': [1, 2, 3, 4]}),
+        ):
+            response = getattr(self.client, method)(reverse(route), body, format='json')
+            self.assertEqual(response.status_code, 400, (method, route))
+            self.assertIsNone(response.data['errors'][0]['index'])
+        self.assertEqual(PromptTemplate.objects.filter(creator=self.user).count(), 3)
+
+
+class UsageIngestionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='ingest', password='pass12345')
+        cls.other = User.objects.create_user(username='ingest-other', password='pass12345')
+        cls.template = Template.objects.create(
+            name='模板', description='描述', category='writing', content='正文', usage='用法', example='示例',
+            creator=cls.user, tags=['写作']
+        )
+
+    def setUp(self):
+        # 写回缓冲是进程级的：用例结束前写回（随事务回滚），不把增量留给下一个用例
+        usage_counter.flush()
+        self.addCleanup(usage_counter.flush)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ingest(self, events, client=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return (client or self.client).post(reverse('template-usage-batch'), events, format='json')
+
+    def test_retried_batch_is_counted_once(self):
+        events = [{'event_id': f'e{i}', 'template_id': self.template.pk} for i in range(5)]
+        self.assertEqual(self.ingest(events).data, {'created': 5, 'duplicates': 0})
+        # 客户端超时后重发同一批，夹带一条新事件、一条不带 event_id 的事件与批内重复
+        retried = events + [
+            {'event_id': 'e5', 'template_id': self.template.pk},
+            {'event_id': 'e5', 'template_id': self.template.pk},
+            {'template_id': self.template.pk},
+        ]
+        self.assertEqual(self.ingest(retried).data, {'created': 2, 'duplicates': 6})
+
+        usage_counter.flush()
+        self.assertEqual(TemplateUsage.objects.filter(user=self.user).count(), 7)
+        self.assertEqual(Template.objects.get(pk=self.template.pk).usage_count, 7)
+        today = timezone.localdate()
+        self.assertEqual(TemplateDailyUsage.objects.get(template=self.template, date=today).count, 7)
+
+    def test_event_ids_are_scoped_to_the_user(self):
+        events = [{'event_id': 'shared', 'template_id': self.template.pk}]
+        self.assertEqual(self.ingest(events).data, {'created': 1, 'duplicates': 0})
+        other = APIClient()
+        other.force_authenticate(self.other)
+        self.assertEqual(self.ingest(events, other).data, {'created': 1, 'duplicates': 0})
+
+    def test_invalid_event_rejects_the_batch(self):
+        response = self.ingest([
+            {'event_id': 'ok', 'template_id': self.template.pk}, {'template_id': 999999},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertFalse(TemplateUsage.objects.exists())
+        # 被拒绝的批次没有占用 event_id，修正后重发可以写入
+        self.assertEqual(self.ingest([{'event_id': 'ok', 'template_id': self.template.pk}]).data['created'], 1)
+
+
+class AsyncViewTests(TransactionTestCase):
+    # async 视图的查询在线程池中使用独立的数据库连接，看不到 TestCase 事务中的数据
+    pairs = [
+        ('async-template-list', 'template-list', (), {}),
+        ('async-template-list', 'template-list', (), {'page': 2, 'page_size': 5}),
+        ('async-template-list', 'template-list', (), {'search': '数据', 'fields': 'id,name', 'sort_by': 'rating'}),
+        ('async-template-list', 'template-list', (), {'page': 9}),
+        ('async-template-detail', 'template-detail', ('first',), {}),
+        ('async-template-detail', 'template-detail', ('first',), {'fields': 'id,name,comments'}),
+        ('async-template-detail', 'template-detail', (999999,), {}),
+        ('async-recommended-templates', 'recommended-templates', (), {}),
+        ('async-template-analytics', 'template-analytics', (), {'time_range': 'month'}),
+        ('async-template-analytics', 'template-analytics', (), {'time_range': 'decade'}),
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='async', password='pass12345')
+        self.templates = [
+            Template.objects.create(
+                name=f'数据模板{i}', description='描述', category='analysis', content='正文', usage='用法',
+                example='示例', creator=self.user, tags=['分析', f't{i}']
+            )
+            for i in range(12)
+        ]
+        for template in self.templates[:4]:
+            TemplateUsage.objects.create(template=template, user=self.user)
+            TemplateComment.objects.create(template=template, user=self.user, content='评论', rating=4)
+        Template.objects.all().recompute_ratings()
+        today = timezone.localdate()
+        usage_counter.rebuild_rollups(today, today)
+        refresh_tag_stats()
+        self.authorization = f'Bearer {VersionedRefreshToken.for_user(self.user).access_token}'
+
+    def get_both(self, async_route, sync_route, args, params):
+        args = [self.templates[0].pk if arg == 'first' else arg for arg in args]
+        async_response = async_to_sync(self.async_client.get)(
+            reverse(async_route, args=args), params, headers={'Authorization': self.authorization}
+        )
+        sync_response = self.client.get(
+            reverse(sync_route, args=args), params, HTTP_AUTHORIZATION=self.authorization
+        )
+        return async_response, sync_response
+
+    def test_matches_sync_views(self):
+        for async_route, sync_route, args, params in self.pairs:
+            async_response, sync_response = self.get_both(async_route, sync_route, args, params)
+            label = (sync_route, args, params)
+            self.assertEqual(async_response.status_code, sync_response.status_code, label)
+            # 分页链接指向各自的路径
+            body = async_response.content.decode().replace('/api/async/', '/api/')
+            self.assertEqual(json.loads(body), json.loads(sync_response.content), label)
+
+    def test_requires_authentication(self):
+        response = async_to_sync(self.async_client.get)(reverse('async-template-list'))
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='sparse', password='pass12345')
+        cls.template = Template.objects.create(
+            name='模板', description='描述', category='writing', content='正文', usage='用法', example='示例',
+            creator=cls.user, tags=['写作']
+        )
+        TemplateComment.objects.create(template=cls.template, user=cls.user, content='评论', rating=5)
+        cls.prompt_template = PromptTemplate.objects.create(
+            name='提示词', description='描述', content='正文', creator=cls.user
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, route, *args, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(route, args=args), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response, [query['sql'] for query in queries]
+
+    def test_list_selects_only_requested_columns(self):
+        response, queries = self.get('template-list', fields='id,name,usage_count')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'usage_count'})
+        self.assertNotIn('"api_user"', queries[-1])
+        self.assertNotIn('"description"', queries[-1])
+
+        # 未展开的外键只输出主键，不连接用户表
+        response, queries = self.get('template-list', fields='id,creator')
+        self.assertEqual(response.data['results'][0]['creator'], self.user.pk)
+        self.assertNotIn('"api_user"', queries[-1])
+
+        response, queries = self.get('template-list', fields='id,creator', expand='creator')
+        self.assertEqual(response.data['results'][0]['creator']['username'], 'sparse')
+        self.assertIn('"api_user"', queries[-1])
+
+        response, queries = self.get('prompttemplate-list', fields='id,name')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
+        self.assertFalse(any('"api_user"' in query or '"api_textblob"' in query for query in queries))
+
+    def test_detail_skips_unrequested_relations(self):
+        response, queries = self.get('template-detail', self.template.pk, fields='id,name')
+        self.assertEqual(response.data, {'id': self.template.pk, 'name': '模板'})
+        # 不预取评论，也不读取 TextBlob
+        self.assertFalse(any(query.startswith('SELECT "api_templatecomment"') for query in queries))
+        self.assertFalse(any('"api_textblob"' in query for query in queries))
+
+        response, queries = self.get('template-detail', self.template.pk, fields='id,comments', expand='comments')
+        self.assertEqual(response.data['comments'][0]['user']['username'], 'sparse')
+        self.assertTrue(any(query.startswith('SELECT "api_templatecomment"') for query in queries))
+
+        response, _ = self.get('prompttemplate-detail', self.prompt_template.pk, fields='content')
+        self.assertEqual(response.data, {'content': '正文'})
+
+    def test_unknown_fields_are_rejected(self):
+        url = reverse('template-list')
+        self.assertEqual(self.client.get(url, {'fields': 'id,bogus'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'expand': 'bogus'}).status_code, 400)
+
+
+class StickyKeyTests(TestCase):
+    def request(self, authorization):
+        return RequestFactory().get('/api/templates/', HTTP_AUTHORIZATION=authorization)
+
+    def test_keyed_by_user(self):
+        user = User.objects.create_user(username='sticky', password='pass12345')
+        other = User.objects.create_user(username='sticky-other', password='pass12345')
+        # 刷新后的令牌与其他设备上的令牌对应同一个键
+        first = sticky_key(self.request(f'Bearer {VersionedRefreshToken.for_user(user).access_token}'))
+        second = sticky_key(self.request(f'Bearer {AccessToken.for_user(user)}'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, sticky_key(self.request(f'Bearer {AccessToken.for_user(other)}')))
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(sticky_key(self.request('Bearer invalid')))
+            self.assertIsNone(sticky_key(self.request('Bearer')))
+            self.assertIsNone(sticky_key(RequestFactory().get('/api/templates/')))
+
+
+@override_settings(USAGE_EVENTS={'RETRIES': 2, 'RETRY_BACKOFF': 0})
+class UsageEventRetryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='events', password='pass12345')
+        cls.template = Template.objects.create(
+            name='模板', description='描述', category='writing', content='正文', usage='用法', example='示例',
+            creator=cls.user, tags=['写作']
+        )
+
+    def batch(self):
+        return [TemplateUsage(template=self.template, user=self.user) for _ in range(3)]
+
+    def test_transient_failure_is_retried(self):
+        write = mock.Mock(side_effect=[DatabaseError('connection lost'), None])
+        before = usage_events.metrics()
+        with mock.patch('api.events.write_usages', write), self.assertLogs('api.events', 'WARNING'):
+            usage_events._write_batch(self.batch())
+        after = usage_events.metrics()
+        self.assertEqual(write.call_count, 2)
+        self.assertEqual(after['written'] - before['written'], 3)
+        self.assertEqual(after['retries'] - before['retries'], 1)
+        self.assertEqual(after['failed'], before['failed'])
+
+    def test_dropped_after_retries(self):
+        write = mock.Mock(side_effect=DatabaseError('connection lost'))
+        before = usage_events.metrics()
+        with mock.patch('api.events.write_usages', write), self.assertLogs('api.events', 'ERROR'):
+            usage_events._write_batch(self.batch())
+        after = usage_events.metrics()
+        self.assertEqual(write.call_count, 3)
+        self.assertEqual(after['failed'] - before['failed'], 3)
+        self.assertEqual(after['written'], before['written'])
+
+
+class MetricsViewTests(TestCase):
+    def get(self, headers=None, **config):
+        with override_settings(METRICS={'ENABLED': True, **config}):
+            return self.client.get(reverse('metrics'), headers=headers)
+
+    def test_disabled(self):
+        self.assertEqual(self.get(ENABLED=False).status_code, 404)
+
+    def test_token(self):
+        self.assertEqual(self.get(TOKEN='secret').status_code, 403)
+        self.assertEqual(self.get({'Authorization': 'Bearer other'}, TOKEN='secret').status_code, 403)
+        response = self.get({'Authorization': 'Bearer secret'}, TOKEN='secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'usage_events_total', response.content)
+
+    def test_allowed_ips(self):
+        # 测试客户端的 REMOTE_ADDR 为 127.0.0.1
+        self.assertEqual(self.get(ALLOWED_IPS=['10.0.0.0/8']).status_code, 403)
+        self.assertEqual(self.get(ALLOWED_IPS=['10.0.0.0/8', '127.0.0.1']).status_code, 200)
+
+
+@override_settings(PROMPT_TEMPLATE_SNAPSHOT_INTERVAL=5)
+class RevisionTests(TestCase):
+    versions = 13
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='revisions', password='pass12345')
+        lines = [f'第{i}行：请根据以下要求完成写作任务。\n' for i in range(200)]
+        cls.prompt_template = PromptTemplate.objects.create(
+            name='提示词', description='描述', content=''.join(lines), creator=cls.user, tags=['写作']
+        )
+        revisions.record(cls.prompt_template, author=cls.user, created=True)
+        cls.states = {1: revisions.state_of(cls.prompt_template)}
+
+        # 每个版本修改、插入或删除少量行，并不时修改非文本字段
+        for version in range(2, cls.versions + 1):
+            obj = cls.prompt_template
+            lines[version * 7] = f'第{version}版修改的行\n'
+            if version % 3 == 0:
+                lines.insert(version, f'第{version}版插入的行\n')
+            if version % 4 == 0:
+                del lines[-1]
+                obj.tags = [*obj.tags, f'v{version}']
+            obj.content = ''.join(lines)
+            obj.is_public = version % 2 == 0
+            obj.version = version
+            obj.save()
+            revisions.record(obj, author=cls.user)
+            cls.states[version] = revisions.state_of(obj)
+
+    def test_every_version_round_trips(self):
+        for version, state in self.states.items():
+            restored, revision = revisions.get_version(self.prompt_template, version)
+            self.assertEqual(restored, state, f'v{version}')
+            self.assertEqual(revision.version, version)
+
+    def test_snapshot_interval(self):
+        snapshots = PromptTemplateRevision.objects.filter(prompt_template=self.prompt_template, is_snapshot=True) \
+            .order_by('version') \
+            .values_list('version', flat=True)
+        self.assertEqual(list(snapshots), [1, 6, 11])
+
+    def test_restoring_reads_at_most_one_chain(self):
+        for version in (5, 10, self.versions):
+            chain = revisions.chains_for([self.prompt_template.pk], version)[self.prompt_template.pk]
+            self.assertTrue(chain[0].is_snapshot)
+            self.assertLessEqual(len(chain), 5)
+        with self.assertNumQueries(1):
+            revisions.get_version(self.prompt_template, 9)
+
+    def test_deltas_are_smaller_than_snapshots(self):
+        snapshot = PromptTemplateRevision.objects.get(prompt_template=self.prompt_template, version=1)
+        delta = PromptTemplateRevision.objects.get(prompt_template=self.prompt_template, version=2)
+        self.assertFalse(delta.is_snapshot)
+        self.assertLess(len(delta.data), len(snapshot.data))
+
+    def test_unknown_version(self):
+        with self.assertRaises(PromptTemplateRevision.DoesNotExist):
+            revisions.get_version(self.prompt_template, self.versions + 1)
+
+    def test_diff_versions(self):
+        changes = revisions.diff_versions(self.prompt_template, 1, 4)
+        self.assertIn('+第4版修改的行', changes['content'])
+        self.assertEqual(changes['tags'], {'from': ['写作'], 'to': ['写作', 'v4']})
+
+
+class TextBlobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='blobs', password='pass12345')
+
+    def create(self, content, **kwargs):
+        return PromptTemplate.objects.create(
+            name='提示词', description='描述', content=content, creator=self.user, **kwargs
+        )
+
+    def test_identical_text_is_stored_once(self):
+        first = self.create('相同的正文\n' * 100)
+        second = self.create('相同的正文\n' * 100)
+        self.assertEqual(first.content_blob_id, second.content_blob_id)
+        self.assertEqual(TextBlob.objects.count(), 1)
+        blob = TextBlob.objects.get()
+        self.assertEqual(blob.size, len(('相同的正文\n' * 100).encode()))
+        self.assertLess(len(blob.data), blob.size)
+        self.assertEqual(PromptTemplate.objects.get(pk=second.pk).content, '相同的正文\n' * 100)
+
+    def test_prune_keeps_referenced_blobs(self):
+        kept = self.create('仍被引用的正文')
+        changed = self.create('将被修改的正文')
+        changed.content = '修改后的正文'
+        changed.save(update_fields=['content'])
+        TextBlob.from_text('未被引用的正文').save()
+        old_blob = TextBlob.objects.get(pk=TextBlob.from_text('将被修改的正文').digest)
+
+        call_command('prune_text_blobs', stdout=StringIO())
+        self.assertEqual(
+            set(TextBlob.objects.values_list('pk', flat=True)),
+            {kept.content_blob_id, changed.content_blob_id},
+        )
+        self.assertFalse(TextBlob.objects.filter(pk=old_blob.pk).exists())
+        self.assertEqual(PromptTemplate.objects.get(pk=kept.pk).content, '仍被引用的正文')
+
+
+class TextBlobPruneRaceTests(TransactionTestCase):
+    def test_store_requires_a_transaction(self):
+        user = User.objects.create_user(username='blob-autocommit', password='pass12345')
+        obj = PromptTemplate(name='提示词', description='描述', content='正文', creator=user)
+        with self.assertRaises(transaction.TransactionManagementError):
+            store_text_blobs([obj])
+        self.assertFalse(TextBlob.objects.exists())
+
+    def test_prune_waits_for_writers_reusing_a_blob(self):
+        user = User.objects.create_user(username='blob-race', password='pass12345')
+        text = '刚被清理任务选中的正文'
+        TextBlob.from_text(text).save()
+        saved = threading.Event()
+        release = threading.Event()
+
+        def write():
+            try:
+                with transaction.atomic():
+                    PromptTemplate.objects.create(name='提示词', description='描述', content=text, creator=user)
+                    saved.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        def prune():
+            try:
+                call_command('prune_text_blobs', stdout=StringIO())
+            finally:
+                connection.close()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        self.assertTrue(saved.wait(5))
+        # 写入尚未提交，文本在清理任务看来未被引用；清理任务应等待写入提交后再确认
+        pruner = threading.Thread(target=prune)
+        pruner.start()
+        pruner.join(0.5)
+        self.assertTrue(pruner.is_alive())
+        release.set()
+        writer.join(5)
+        pruner.join(5)
+
+        template = PromptTemplate.objects.get()
+        self.assertEqual(template.content, text)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_popular_tags_after_the_window_moved(self):
+        today = timezone.localdate()
+        TagDailyUsage.objects.bulk_create([
+            TagDailyUsage(tag='旧标签', date=today - timedelta(days=10), count=5),
+            TagDailyUsage(tag='新标签', date=today, count=1),
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            refresh_tag_stats()
+        self.assertEqual(analytics.popular_tags('week'), [{'tag': '新标签', 'count': 1}])
+        self.assertEqual(len(analytics.popular_tags('month')), 2)
+
+        # 统计在前一天刷新后没有新的使用记录：窗口已经移动，不再读取过期的统计
+        TagUsageStats.objects.filter(window='week').update(count=99)
+        cache.set(TAG_STATS_DATE_KEY, (today - timedelta(days=1)).isoformat())
+        self.assertEqual(analytics.popular_tags('week'), [{'tag': '新标签', 'count': 1}])
+
+    @override_settings(USAGE_COUNTER={'FLUSH_INTERVAL': 3600, 'MAX_LAG': 3600})
+    def test_rebuild_does_not_count_buffered_usage_twice(self):
+        user = User.objects.create_user(username='rollups', password='pass12345')
+        template = Template.objects.create(
+            name='模板', description='描述', category='writing', content='正文', usage='用法', example='示例',
+            creator=user, tags=['写作']
+        )
+        # 明细已经提交，使用次数还在缓冲区中
+        TemplateUsage.objects.bulk_create(TemplateUsage(template=template, user=user) for _ in range(3))
+        usage_counter.increment(template.pk, 3)
+
+        today = timezone.localdate()
+        usage_counter.rebuild_rollups(today, today)
+        usage_counter.flush()
+        self.assertEqual(TemplateDailyUsage.objects.get(template=template, date=today).count, 3)
+        self.assertEqual(CategoryDailyUsage.objects.get(category='writing', date=today).count, 3)
+        self.assertEqual(TagDailyUsage.objects.get(tag='写作', date=today).count, 3)
+
+    def test_category_totals_include_unused_categories(self):
+        today = timezone.localdate()
+        CategoryDailyUsage.objects.create(category='coding', date=today, count=2)
+        totals = analytics.category_totals(today - timedelta(days=7))
+        self.assertEqual(totals[0], {'category': 'coding', 'count': 2})
+        self.assertEqual(
+            sorted(item['category'] for item in totals),
+            sorted(choice for choice, _ in Template.CATEGORY_CHOICES),
+        )
+
+
+class UsagePartitionTests(TestCase):
+    def partition_of(self, usage):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT tableoid::regclass::text FROM {usage_table()} WHERE id = %s', [usage.pk]
+            )
+            return cursor.fetchone()[0]
+
+    def test_rollups_outlive_detached_partitions(self):
+        user = User.objects.create_user(username='partitions', password='pass12345')
+        template = Template.objects.create(
+            name='模板', description='描述', category='coding', content='正文', usage='用法', example='示例',
+            creator=user, tags=['编程']
+        )
+        table = usage_table()
+        month = month_start(timezone.now() - timedelta(days=800))
+        used_at = month + timedelta(days=3)
+        self.assertNotIn(partition_name(table, month), list_partitions(table))
+
+        # 没有对应月份的分区时记录落入默认分区，创建分区时移入新分区
+        usage = TemplateUsage.objects.create(template=template, user=user, used_at=used_at)
+        self.assertEqual(self.partition_of(usage), f'{table}_default')
+        self.assertIn(partition_name(table, month), ensure_partitions(start=month))
+        self.assertEqual(self.partition_of(usage), partition_name(table, month))
+
+        day = timezone.localdate(used_at)
+        usage_counter.rebuild_rollups(day, day)
+        self.assertEqual(analytics.usage_trend(day)[0], {'date': day, 'count': 1})
+
+        # 明细分区过期删除后，日汇总仍保留这一天的统计
+        detached = detach_partitions(add_months(month, 1), drop=True)
+        self.assertEqual(detached, [partition_name(table, month)])
+        self.assertFalse(TemplateUsage.objects.exists())
+        self.assertEqual(TemplateDailyUsage.objects.get(template=template, date=day).count, 1)
+        self.assertEqual(analytics.usage_trend(day)[0], {'date': day, 'count': 1})
+        self.assertEqual(analytics.category_totals(day)[0], {'category': 'coding', 'count': 1})
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username=f'cousage{i}', password='pass12345') for i in range(3)]
+        cls.templates = [
+            Template.objects.create(
+                name=f'模板{i}', description='描述', category='writing', content='正文', usage='用法',
+                example='示例', creator=cls.users[0], tags=['写作']
+            )
+            for i in range(2)
+        ]
+
+    def use(self, user, *templates):
+        TemplateUsage.objects.bulk_create(TemplateUsage(template=template, user=user) for template in templates)
+
+    def neighbors(self):
+        return sorted(TemplateNeighbor.objects.values_list('template_id', 'neighbor_id', 'score'))
+
+    def test_incremental_matches_full(self):
+        first, second = self.templates
+        self.use(self.users[0], first, second)
+        self.use(self.users[1], first, second)
+        recommendations.build_full()
+        self.assertEqual(TemplateCousageState.objects.count(), 1)
+
+        # 新用户只使用 second：first 与 second 的共现次数不变，但 second 的使用人数变化，
+        # first 的邻居得分同样需要重新计算
+        self.use(self.users[2], second)
+        recommendations.build_incremental()
+        incremental = self.neighbors()
+        recommendations.build_full()
+        self.assertEqual(incremental, self.neighbors())
+        self.assertEqual(recommendations.build_incremental(), (0, 0))
+
+
+# 使用事件在请求线程内同步写入，计数留在缓冲区中直到手动写回
+@override_settings(USAGE_EVENTS={'ENABLED': False}, USAGE_COUNTER={'FLUSH_INTERVAL': 3600, 'MAX_LAG': 3600})
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='response-cache', password='pass12345')
+        cls.template = Template.objects.create(
+            name='模板', description='描述', category='writing', content='正文', usage='用法', example='示例',
+            creator=cls.user, tags=['写作']
+        )
+        cls.prompt_template = PromptTemplate.objects.create(
+            name='提示词', description='描述', content='正文', creator=cls.user
+        )
+
+    def setUp(self):
+        cache.clear()
+        usage_counter.flush()
+        self.addCleanup(usage_counter.flush)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, route, *args):
+        # 第二次请求命中响应缓存，不再查询数据库
+        first = self.client.get(reverse(route, args=args)).data
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse(route, args=args)).data, first)
+        return first
+
+    def test_comment_invalidates_template_responses(self):
+        self.assertEqual(self.get('template-list')['results'][0]['comment_count'], 0)
+        self.assertEqual(self.get('template-detail', self.template.pk)['comments'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('template-comment', args=[self.template.pk]), {'content': '评论', 'rating': 4}, format='json'
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+
+        listed = self.get('template-list')['results'][0]
+        self.assertEqual((listed['comment_count'], listed['rating']), (1, 4))
+        self.assertEqual(len(self.get('template-detail', self.template.pk)['comments']), 1)
+
+    def test_flushed_usage_invalidates_template_responses(self):
+        self.assertEqual(self.get('template-detail', self.template.pk)['usage_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('template-use', args=[self.template.pk]), {}, format='json')
+        # 使用次数还在缓冲区中，缓存的响应保持不变；写回后失效
+        self.assertEqual(self.get('template-detail', self.template.pk)['usage_count'], 0)
+        usage_counter.flush()
+        self.assertEqual(self.get('template-detail', self.template.pk)['usage_count'], 1)
+        self.assertEqual(self.get('template-list')['results'][0]['usage_count'], 1)
+
+    def test_prompt_template_update_invalidates_responses(self):
+        self.assertEqual(self.get('prompttemplate-list')['results'][0]['name'], '提示词')
+        self.assertEqual(self.get('prompttemplate-detail', self.prompt_template.pk)['content'], '正文')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('prompttemplate-detail', args=[self.prompt_template.pk]),
+                {'name': '改名', 'content': '新正文'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+
+        self.assertEqual(self.get('prompttemplate-list')['results'][0]['name'], '改名')
+        self.assertEqual(self.get('prompttemplate-detail', self.prompt_template.pk)['content'], '新正文')
+
+
+class ConditionalRequestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='conditional', password='pass12345')
+        cls.template = Template.objects.create(
+            name='模板', description='描述', category='writing', content='正文', usage='用法', example='示例',
+            creator=cls.user, tags=['写作']
+        )
+
+    def setUp(self):
+        cache.clear()
+        replica_health.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        replica_health.reset()
+
+    def test_not_modified_until_written(self):
+        for route, args in (('template-detail', [self.template.pk]), ('template-list', [])):
+            url = reverse(route, args=args)
+            etag = self.client.get(url)['ETag']
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, route)
+            self.assertEqual(response['ETag'], etag)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(
+                    reverse('template-comment', args=[self.template.pk]), {'content': '评论', 'rating': 3},
+                    format='json'
+                )
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, route)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_prompt_template_validators(self):
+        prompt_template = PromptTemplate.objects.create(
+            name='提示词', description='描述', content='正文', creator=self.user
+        )
+        url = reverse('prompttemplate-detail', args=[prompt_template.pk])
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MATCH=etag).status_code, 200)
+        # 表示不同（稀疏字段集）时 ETag 不同
+        self.assertNotEqual(self.client.get(url, {'fields': 'id,name'})['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {'content': '新正文'}, format='json')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_MATCH=etag).status_code, 412)
+
+    def test_no_list_etag_when_reading_from_replica(self):
+        url = reverse('template-list')
+        etag = self.client.get(url)['ETag']
+        # 列表的 ETag 由主库的缓存代号计算，副本上的数据可能更旧；
+        # 响应缓存中的结果来自主库，命中时仍可返回 304，这里从冷缓存开始
+        cache.clear()
+        with override_settings(REPLICA_DATABASES=['default']):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
@@ -1,8 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .async_views import (
+    AsyncTemplateListView, AsyncTemplateDetailView, AsyncRecommendedTemplatesView,
+    AsyncTemplateAnalyticsView
+)
 from .views import (
     RegisterView, LoginView, UserProfileView, RecommendedScenesView,
-    TemplateListView, TemplateDetailView, TemplateUseView, TemplateCommentView,
+    TemplateListView, TemplateDetailView, TemplateUseView, TemplateUsageBatchView,
+    TemplateCommentView,
     RecommendedTemplatesView, TemplateAnalyticsView, PromptTemplateViewSet
 )
 
@@ -20,7 +25,14 @@ urlpatterns = [
     path('templates/', TemplateListView.as_view(), name='template-list'),
     path('templates/<int:pk>/', TemplateDetailView.as_view(), name='template-detail'),
     path('templates/<int:pk>/use/', TemplateUseView.as_view(), name='template-use'),
+    path('templates/usage/', TemplateUsageBatchView.as_view(), name='template-usage-batch'),
     path('templates/<int:pk>/comments/', TemplateCommentView.as_view(), name='template-comment'),
     path('templates/recommended/', RecommendedTemplatesView.as_view(), name='recommended-templates'),
     path('templates/analytics/', TemplateAnalyticsView.as_view(), name='template-analytics'),
-]
\ No newline at end of file
+
+    # 只读接口的 async 版本，适用于 ASGI 部署（asgi.py）
+    path('async/templates/', AsyncTemplateListView.as_view(), name='async-template-list'),
+    path('async/templates/<int:pk>/', AsyncTemplateDetailView.as_view(), name='async-template-detail'),
+    path('async/templates/recommended/', AsyncRecommendedTemplatesView.as_view(), name='async-recommended-templates'),
+    path('async/templates/analytics/', AsyncTemplateAnalyticsView.as_view(), name='async-template-analytics'),
+]
@@ -1,19 +1,32 @@
-from rest_framework import generics, permissions, status, filters, viewsets
+from rest_framework import generics, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.views import APIView
 from django.contrib.auth import authenticate
-from django.db.models import Q, Avg, Count, F
+from django.db import transaction
+from django.db.models import F, FloatField
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models.functions import TruncDate
+from django.db.models.functions import Cast
 from .serializers import (
     UserSerializer, UserProfileSerializer, SceneSerializer,
-    TemplateSerializer, TemplateCommentSerializer, PromptTemplateSerializer
+    TemplateSerializer, TemplateListSerializer, TemplateCommentSerializer,
+    PromptTemplateSerializer, PromptTemplateListSerializer, PromptTemplateRevisionSerializer
 )
 from .models import (
-    User, Scene, Template, TemplateComment, 
-    TemplateUsage, PromptTemplate
+    User, Scene, Template,
+    TemplateUsage, PromptTemplate, PromptTemplateRevision
+)
+from .pagination import KeysetPagination, StandardPagination
+from .filters import FullTextSearchFilter, TagFilter
+from .fieldsets import SparseFieldsFilter, sparse_queryset
+from .authentication import VersionedRefreshToken
+from .events import usage_events
+from . import analytics, bulk, revisions
+from .cache import cache_response
+from .conditional import (
+    conditional, list_validators, template_detail_validators, prompt_template_detail_validators
 )
 
 class RegisterView(generics.CreateAPIView):
@@ -30,7 +43,7 @@ class LoginView(APIView):
 
         user = authenticate(username=username, password=password)
         if user:
-            refresh = RefreshToken.for_user(user)
+            refresh = VersionedRefreshToken.for_user(user)
             return Response({
                 'access': str(refresh.access_token),
                 'refresh': str(refresh),
@@ -43,25 +56,31 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        if self.request.method in permissions.SAFE_METHODS:
+            return self.request.user
+        # request.user 可能来自认证缓存，修改时重新从数据库读取，避免写回过期字段
+        return User.objects.get(pk=self.request.user.pk)
 
 class RecommendedScenesView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @cache_response('scenes')
     def get(self, request):
         # 这里应该实现推荐算法，目前我们只返回最新的3个场景
-        scenes = Scene.objects.order_by('-created_at')[:3]
-        serializer = SceneSerializer(scenes, many=True)
+        context = {'request': request}
+        scenes = sparse_queryset(SceneSerializer, Scene.objects.order_by('-created_at'), context)[:3]
+        serializer = SceneSerializer(scenes, many=True, context=context)
         return Response(serializer.data)
 
 class TemplateListView(generics.ListAPIView):
-    serializer_class = TemplateSerializer
+    serializer_class = TemplateListSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name', 'description', 'tags']
+    pagination_class = StandardPagination
+    filter_backends = [TagFilter, FullTextSearchFilter, SparseFieldsFilter]
+    read_from_replica = True
 
     def get_queryset(self):
-        queryset = Template.objects.all()
+        queryset = Template.objects.for_list()
         
         # 基本过滤
         category = self.request.query_params.get('category', None)
@@ -87,13 +106,6 @@ class TemplateListView(generics.ListAPIView):
             elif time_range == 'month':
                 queryset = queryset.filter(created_at__gte=timezone.now() - timedelta(days=30))
 
-        # 标签过滤
-        tags = self.request.query_params.get('tags', None)
-        if tags:
-            tag_list = tags.split(',')
-            for tag in tag_list:
-                queryset = queryset.filter(tags__contains=[tag])
-
         # 排序
         sort_by = self.request.query_params.get('sort_by', 'created_at')
         sort_order = self.request.query_params.get('sort_order', 'desc')
@@ -108,80 +120,97 @@ class TemplateListView(generics.ListAPIView):
         order_by = order_fields.get(sort_by, '-created_at')
         return queryset.order_by(order_by)
 
+    @cache_response('templates')
+    @conditional(list_validators('templates'))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 class TemplateDetailView(generics.RetrieveAPIView):
-    queryset = Template.objects.all()
+    queryset = Template.objects.select_related('creator', 'content_blob', 'usage_blob', 'example_blob') \
+        .prefetch_related('comments__user') \
+        .with_comment_count()
     serializer_class = TemplateSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [SparseFieldsFilter]
+
+    @cache_response('template:{pk}')
+    @conditional(template_detail_validators)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 class TemplateUseView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, pk):
-        try:
-            template = Template.objects.get(pk=pk)
-            template.usage_count += 1
-            template.save()
-
-            # 记录模板使用情况
-            TemplateUsage.objects.create(
-                template=template,
-                user=request.user,
-                context=request.data.get('context', {})
-            )
-
-            return Response({'status': 'success'})
-        except Template.DoesNotExist:
+        if not Template.objects.filter(pk=pk).exists():
             return Response(
                 {'error': 'Template not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
 
+        # 使用记录交给后台管道批量写入，请求只负责入队；使用次数在写入时累加
+        usage_events.submit(TemplateUsage(
+            template_id=pk,
+            user=request.user,
+            context=request.data.get('context', {})
+        ))
+
+        return Response({'status': 'success'})
+
+class TemplateUsageBatchView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        # 请求体为 [{event_id, template_id, used_at, context}, ...]，event_id 相同的事件只记录一次
+        try:
+            created, duplicates = bulk.ingest_usage_events(
+                request.user, request.data, {'request': request}
+            )
+        except bulk.BulkError as e:
+            return Response({'errors': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'created': created, 'duplicates': duplicates})
+
 class TemplateCommentView(generics.CreateAPIView):
     serializer_class = TemplateCommentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
         template_id = self.kwargs.get('pk')
-        template = Template.objects.get(pk=template_id)
-        serializer.save(user=self.request.user, template=template)
-        
-        # 更新模板的平均评分
-        avg_rating = TemplateComment.objects.filter(template=template).aggregate(
-            Avg('rating')
-        )['rating__avg']
-        template.rating = avg_rating or 0
-        template.save()
+        rating = serializer.validated_data['rating']
+
+        with transaction.atomic():
+            # 增量更新模板的评分总和、数量与平均分，无需重新聚合全部评论
+            updated = Template.objects.filter(pk=template_id).update(
+                rating_sum=F('rating_sum') + rating,
+                rating_count=F('rating_count') + 1,
+                rating=Cast(F('rating_sum') + rating, FloatField()) / (F('rating_count') + 1),
+                updated_at=timezone.now()
+            )
+            if not updated:
+                raise NotFound('Template not found')
+            serializer.save(user=self.request.user, template_id=template_id)
 
 class RecommendedTemplatesView(generics.ListAPIView):
-    serializer_class = TemplateSerializer
+    serializer_class = TemplateListSerializer
     permission_classes = [permissions.IsAuthenticated]
+    read_from_replica = True
+    recent_window = 50
+    limit = 10
 
     def get_queryset(self):
         user = self.request.user
-        
-        # 获取用户最近使用的模板类别
-        recent_categories = Template.objects.filter(
-            templateusage__user=user
-        ).values('category').annotate(
-            usage_count=Count('id')
-        ).order_by('-usage_count')[:3]
-
-        recent_category_ids = [cat['category'] for cat in recent_categories]
-
-        # 获取用户最近使用的标签
-        recent_tags = Template.objects.filter(
-            templateusage__user=user
-        ).values_list('tags', flat=True)
-        recent_tags = [tag for tags in recent_tags for tag in tags]
-        recent_tags = sorted(set(recent_tags), key=recent_tags.count, reverse=True)[:5]
-
-        # 基于类别、标签和评分推荐模板
-        recommended_templates = Template.objects.filter(
-            Q(category__in=recent_category_ids) |
-            Q(tags__overlap=recent_tags)
-        ).exclude(
-            templateusage__user=user
-        ).order_by('-rating', '-usage_count')[:10]
+        context = self.get_serializer_context()
+        recommended_templates = list(sparse_queryset(
+            self.serializer_class, Template.objects.recommended_for(user, self.recent_window), context
+        )[:self.limit])
+        if len(recommended_templates) < self.limit:
+            recommended_templates += sparse_queryset(
+                self.serializer_class,
+                Template.objects.popular_for(
+                    user, exclude=[template.pk for template in recommended_templates]
+                ),
+                context
+            )[:self.limit - len(recommended_templates)]
 
         return recommended_templates
 
@@ -189,29 +218,36 @@ class PromptTemplateViewSet(viewsets.ModelViewSet):
     queryset = PromptTemplate.objects.all()
     serializer_class = PromptTemplateSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['name', 'description', 'tags']
-    ordering_fields = ['created_at', 'updated_at', 'name']
+    pagination_class = KeysetPagination
+    filter_backends = [TagFilter, FullTextSearchFilter, SparseFieldsFilter]
+    search_rank_ordering = False
+    # 可排序字段，均有 (字段, id) 及带 is_public / creator 前缀的复合索引
+    sort_fields = ['created_at', 'updated_at', 'name']
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return PromptTemplateListSerializer
+        return PromptTemplateSerializer
 
     def get_queryset(self):
-        queryset = PromptTemplate.objects.all()
-        
-        # 搜索
-        search = self.request.query_params.get('search', None)
-        if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(description__icontains=search) |
-                Q(tags__icontains=search)
-            )
-        
-        # 标签过滤
-        tags = self.request.query_params.get('tags', None)
-        if tags:
-            tag_list = tags.split(',')
-            for tag in tag_list:
-                queryset = queryset.filter(tags__contains=[tag])
-        
+        queryset = PromptTemplate.objects.select_related('creator')
+        if self.action in ('retrieve', 'update', 'partial_update'):
+            # 只有详情与修改需要正文
+            queryset = queryset.select_related('content_blob')
+
+        # 基本过滤
+        is_public = self.request.query_params.get('is_public', None)
+        if is_public is not None:
+            if is_public not in ('true', 'false'):
+                raise ValidationError({'is_public': 'Must be "true" or "false".'})
+            queryset = queryset.filter(is_public=is_public == 'true')
+
+        creator = self.request.query_params.get('creator', None)
+        if creator is not None:
+            if not creator.isdigit():
+                raise ValidationError({'creator': 'Must be a user id.'})
+            queryset = queryset.filter(creator_id=int(creator))
+
         # 时间范围过滤
         time_range = self.request.query_params.get('time_range', None)
         if time_range:
@@ -221,71 +257,117 @@ class PromptTemplateViewSet(viewsets.ModelViewSet):
                 queryset = queryset.filter(created_at__gte=timezone.now() - timedelta(days=7))
             elif time_range == 'month':
                 queryset = queryset.filter(created_at__gte=timezone.now() - timedelta(days=30))
-        
-        # 排序
+
+        # 排序，id 作为相同排序值之间的唯一次序，供游标分页使用
         sort_by = self.request.query_params.get('sort_by', 'created_at')
         sort_order = self.request.query_params.get('sort_order', 'desc')
-        
-        if sort_order == 'desc':
-            queryset = queryset.order_by(f'-{sort_by}')
-        else:
-            queryset = queryset.order_by(sort_by)
-        
-        return queryset
+        if sort_by not in self.sort_fields:
+            raise ValidationError({'sort_by': f'Must be one of: {", ".join(self.sort_fields)}.'})
+        if sort_order not in ('asc', 'desc'):
+            raise ValidationError({'sort_order': 'Must be "asc" or "desc".'})
+
+        prefix = '-' if sort_order == 'desc' else ''
+        return queryset.order_by(f'{prefix}{sort_by}', f'{prefix}id')
+
+    @cache_response('prompt-templates')
+    @conditional(list_validators('prompt-templates'))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response('prompt-template:{pk}')
+    @conditional(prompt_template_detail_validators)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        serializer.save(creator=self.request.user)
+        with transaction.atomic():
+            obj = serializer.save(creator=self.request.user)
+            revisions.record(obj, author=self.request.user, created=True)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # 锁定当前行，保证并发修改得到连续的版本号
+            instance = PromptTemplate.objects.select_related('creator', 'content_blob') \
+                .select_for_update(of=('self',)) \
+                .get(pk=serializer.instance.pk)
+            serializer.instance = instance
+            if not revisions.has_changes(instance, serializer.validated_data):
+                serializer.save()
+                return
+            obj = serializer.save(version=instance.version + 1)
+            revisions.record(obj, author=self.request.user)
+
+    @action(detail=True, methods=['get'])
+    def versions(self, request, pk=None):
+        obj = self.get_object()
+        queryset = obj.revisions.select_related('author').order_by('-version')
+        return Response(PromptTemplateRevisionSerializer(queryset, many=True).data)
+
+    @action(detail=True, methods=['get'], url_path=r'versions/(?P<version>\d+)', url_name='version')
+    def version(self, request, pk=None, version=None):
+        obj = self.get_object()
+        try:
+            state, revision = revisions.get_version(obj, int(version))
+        except PromptTemplateRevision.DoesNotExist:
+            raise NotFound('Version not found')
+        return Response({
+            **state,
+            **PromptTemplateRevisionSerializer(revision).data,
+            'id': obj.pk,
+        })
+
+    @action(detail=True, methods=['get'])
+    def diff(self, request, pk=None):
+        obj = self.get_object()
+        try:
+            from_version = int(request.query_params['from'])
+            to_version = int(request.query_params.get('to', obj.version))
+        except (KeyError, ValueError):
+            raise ValidationError({'from': 'Must be a version number.'})
+        try:
+            changes = revisions.diff_versions(obj, from_version, to_version)
+        except PromptTemplateRevision.DoesNotExist:
+            raise NotFound('Version not found')
+        return Response({'from': from_version, 'to': to_version, 'changes': changes})
+
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk')
+    def bulk(self, request):
+        # POST 批量创建，PATCH 按 id 批量部分更新，请求体均为对象数组
+        context = self.get_serializer_context()
+        try:
+            if request.method == 'POST':
+                objs = bulk.bulk_create(request.user, request.data, context)
+                response_status = status.HTTP_201_CREATED
+            else:
+                objs = bulk.bulk_update(request.user, request.data, context)
+                response_status = status.HTTP_200_OK
+        except bulk.BulkError as e:
+            return Response({'errors': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(objs, many=True)
+        return Response(serializer.data, status=response_status)
+
+    @action(detail=False, methods=['post'], url_path='bulk-delete')
+    def bulk_delete(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        try:
+            deleted = bulk.bulk_delete(request.user, ids)
+        except bulk.BulkError as e:
+            return Response({'errors': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'deleted': deleted})
 
 class TemplateAnalyticsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    read_from_replica = True
 
     def get(self, request):
         time_range = request.query_params.get('time_range', 'week')
-        if time_range == 'week':
-            start_date = timezone.now() - timedelta(days=7)
-        elif time_range == 'month':
-            start_date = timezone.now() - timedelta(days=30)
-        elif time_range == 'quarter':
-            start_date = timezone.now() - timedelta(days=90)
-        else:
+        if time_range not in analytics.TIME_RANGES:
             return Response({'error': 'Invalid time range'}, status=400)
-
-        # 使用趋势数据
-        usage_data = TemplateUsage.objects.filter(used_at__gte=start_date) \
-            .annotate(date=TruncDate('used_at')) \
-            .values('date') \
-            .annotate(count=Count('id')) \
-            .order_by('date')
-
-        # 分类统计数据
-        category_data = Template.objects.values('category') \
-            .annotate(count=Count('templateusage', filter=Q(templateusage__used_at__gte=start_date))) \
-            .order_by('-count')
-
-        # 热门标签
-        popular_tags = Template.objects.filter(templateusage__used_at__gte=start_date) \
-            .values('tags') \
-            .annotate(count=Count('templateusage')) \
-            .order_by('-count')[:20]
-
-        # 使用排行
-        top_templates = Template.objects.filter(templateusage__used_at__gte=start_date) \
-            .annotate(recent_usage_count=Count('templateusage')) \
-            .order_by('-recent_usage_count')[:10]
-
-        serialized_top_templates = TemplateSerializer(top_templates, many=True).data
-        for template, serialized_template in zip(top_templates, serialized_top_templates):
-            serialized_template['recent_usage_count'] = template.recent_usage_count
-
-        return Response({
-            'usageData': {
-                'labels': [item['date'].strftime('%Y-%m-%d') for item in usage_data],
-                'values': [item['count'] for item in usage_data]
-            },
-            'categoryData': {
-                'labels': [item['category'] for item in category_data],
-                'values': [item['count'] for item in category_data]
-            },
-            'popularTags': [{'name': item['tags'], 'count': item['count']} for item in popular_tags],
-            'topTemplates': serialized_top_templates
-        })
\ No newline at end of file
+        start_date = analytics.start_date_for(time_range)
+
+        return Response(analytics.build_response(
+            analytics.usage_trend(start_date),
+            analytics.category_totals(start_date),
+            analytics.popular_tags(time_range),
+            analytics.top_templates(start_date),
+        ))
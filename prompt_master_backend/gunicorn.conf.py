@@ -0,0 +1,7 @@
+# gunicorn -c gunicorn.conf.py prompt_master_backend.wsgi
+# 多进程部署时 Prometheus 指标写入 PROMETHEUS_MULTIPROC_DIR，启动前需清空该目录
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
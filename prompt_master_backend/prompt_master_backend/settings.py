@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,15 +41,19 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
 ]
 
 MIDDLEWARE = [
+    'api.query_inspector.QueryInspectorMiddleware',  # N+1 / 慢查询检查，默认仅 DEBUG 下启用
+    'api.metrics.MetricsMiddleware',  # 按路由统计耗时与 SQL，由 /metrics 导出
     'corsheaders.middleware.CorsMiddleware',  # 添加CORS中间件
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    'api.db_router.ReplicaRoutingMiddleware',  # 只读副本路由与写后读主库
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -88,6 +93,31 @@ DATABASES = {
     }
 }
 
+# 只读副本：DB_REPLICAS=host[:port][/name],...，未指定的部分与主库相同
+# （例如 DB_REPLICAS=localhost/prompt_master_replica 可用本地的第二个数据库模拟副本）
+REPLICA_DATABASES = []
+for index, entry in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    address, _, name = entry.strip().partition('/')
+    host, _, port = address.partition(':')
+    alias = f'replica{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host or DATABASES['default']['HOST'],
+        'PORT': port or DATABASES['default']['PORT'],
+        'NAME': name or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+
+# 副本路由配置（api.db_router）
+DATABASE_REPLICA = {
+    'MAX_LAG': 5,  # 复制延迟超过该值（秒）时回退到主库
+    'CHECK_INTERVAL': 5,  # 副本健康检查间隔（秒）
+    'STICKY_SECONDS': 10,  # 用户写入后固定读主库的时长（秒）
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -117,7 +147,7 @@ AUTH_USER_MODEL = 'api.User'
 # REST Framework 配置
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ],
 }
 
@@ -128,6 +158,78 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
 
+# JWT 认证的用户缓存（api.authentication），资料修改在其他进程中最多延迟 LOCAL_TTL 秒生效
+AUTH_USER_CACHE = {
+    'LOCAL_TTL': 5,
+    'SHARED_TTL': 300,
+    'LOCAL_MAX_ENTRIES': 10000,
+}
+
+# 全文检索分词器，可替换为 'api.search.JiebaTokenizer'（需安装 jieba），更换后需执行 rebuild_search_index
+SEARCH_TOKENIZER = 'api.search.NgramTokenizer'
+
+# 增量构建时重新扫描上次构建前多少秒内有使用记录的用户，覆盖晚于更大主键提交的记录
+RECOMMENDATION_RESCAN_WINDOW = 3600
+
+# 模板使用次数写回缓冲配置
+USAGE_COUNTER = {
+    'FLUSH_INTERVAL': 5,  # 后台刷新周期（秒），设为 0 时同步写库
+    'MAX_LAG': 30,  # 增量在内存中停留的最长时间（秒）
+    'MAX_PENDING': 1000,  # 积压的（模板, 日期）条目数达到该值时立即写库
+}
+
+# 模板使用事件异步写入管道（api.events），ENABLED 为 False 时在请求内同步写库
+USAGE_EVENTS = {
+    'ENABLED': True,
+    'QUEUE_SIZE': 10000,  # 队列容量
+    'BATCH_SIZE': 500,  # 每批写入的最大事件数
+    'FLUSH_INTERVAL': 1,  # 未攒满一批时的最长等待时间（秒）
+    'BACKPRESSURE': 'block',  # 队列已满时：block 短暂等待后同步写库 / drop 丢弃 / sync 同步写库
+    'BLOCK_TIMEOUT': 0.5,
+    'SHUTDOWN_TIMEOUT': 10,  # 进程退出时排空队列的最长等待时间（秒）
+    'RETRIES': 3,  # 写入失败的批次最多重试几次，之后丢弃
+    'RETRY_BACKOFF': 0.5,  # 首次重试前的等待时间（秒），之后每次加倍
+}
+
+# 缓存：设置 REDIS_URL（如 redis://127.0.0.1:6379/1）时使用 Redis，否则使用进程内存（开发与测试）；
+# 多进程部署必须使用共享缓存，否则缓存失效无法在进程间传播
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Prometheus 指标接口（/metrics，api.metrics）：默认只在 DEBUG 或设置了 METRICS_TOKEN 时开放；
+# 设置 TOKEN 后需携带 Authorization: Bearer <TOKEN>，ALLOWED_IPS 非空时只允许列出的地址或网段
+METRICS = {
+    'ENABLED': DEBUG or bool(os.environ.get('METRICS_TOKEN')),
+    'TOKEN': os.environ.get('METRICS_TOKEN', ''),
+    'ALLOWED_IPS': [],
+}
+
+# 模板目录接口响应缓存的有效期（秒），数据变更时通过递增命名空间代号立即失效
+CATALOG_CACHE_TIMEOUT = 300
+
+# 提示词模板批量接口（/api/prompt-templates/bulk/、bulk-delete/）单次请求的最大条目数
+PROMPT_TEMPLATE_BULK_LIMIT = 5000
+
+# 模板使用事件批量上报（/api/templates/usage/）单次请求的最大事件数
+USAGE_EVENT_BATCH_LIMIT = 10000
+
+# 提示词模板版本历史（api.revisions）每隔多少个版本保存一次完整快照，还原任意版本最多读取这么多条记录
+PROMPT_TEMPLATE_SNAPSHOT_INTERVAL = 20
+
+# 标签窗口统计（TagUsageStats）的最短刷新间隔（秒），由使用次数写回时顺带刷新
+TAG_STATS_REFRESH_INTERVAL = 60
+
 LANGUAGE_CODE = "en-us"
 
 TIME_ZONE = "UTC"
@@ -169,3 +271,28 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# 查询检查（api.query_inspector）：N+1 与慢查询日志，RAISE 为 True 时超出预算直接报错
+QUERY_INSPECTOR = {
+    'ENABLED': DEBUG,
+    'N_PLUS_ONE_THRESHOLD': 5,
+    'SLOW_QUERY_MS': 100,
+    'EXPLAIN': True,
+    'RAISE': False,
+}
+
+# 各视图（按 URL 名称）GET 请求允许的最大查询数，含 JWT 认证查询用户的一次；
+# 写操作使用 "PATCH prompttemplate-detail" 形式的键
+QUERY_BUDGETS = {
+    'template-list': 4,
+    'template-detail': 5,
+    'recommended-templates': 3,
+    'template-analytics': 6,
+    'recommended-scenes': 2,
+    'prompttemplate-list': 3,
+    'prompttemplate-detail': 3,
+    'async-template-list': 3,
+    'async-template-detail': 4,
+    'async-recommended-templates': 3,
+    'async-template-analytics': 6,
+}
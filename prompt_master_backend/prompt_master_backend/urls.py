@@ -17,9 +17,11 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, include
+from api.metrics import metrics_view
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),  # 添加 API 应用的 URL
+    path('metrics', metrics_view, name='metrics'),  # Prometheus 指标，访问控制见 settings.METRICS
 ]